@@ -0,0 +1,67 @@
+"""Gzip for buffered responses only.
+
+Starlette's GZipMiddleware also compresses streaming responses, which holds
+back NDJSON chat tokens and export chunks inside the compressor. This variant
+only compresses responses that declare a Content-Length of at least
+`minimum_size`, are not already encoded, and are not a streaming media type.
+"""
+import gzip
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+STREAMING_MEDIA_TYPES = ("application/x-ndjson", "text/event-stream")
+
+
+class SelectiveGZipMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, compresslevel: int = 6) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] == "HEAD"
+            or "gzip" not in Headers(scope=scope).get("accept-encoding", "")
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        start: Message = {}
+        compress = False
+        chunks: list[bytes] = []
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, compress
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                length = headers.get("content-length")
+                compress = (
+                    length is not None
+                    and int(length) >= self.minimum_size
+                    and "content-encoding" not in headers
+                    and not headers.get("content-type", "").startswith(STREAMING_MEDIA_TYPES)
+                )
+                if compress:
+                    start = message
+                else:
+                    await send(message)
+                return
+
+            if not compress or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = gzip.compress(b"".join(chunks), compresslevel=self.compresslevel, mtime=0)
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = "gzip"
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body, "more_body": False})
+
+        await self.app(scope, receive, send_wrapper)
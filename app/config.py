@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field, model_validator
-from typing import List
+from typing import Dict, List
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
@@ -12,6 +12,13 @@ class Settings(BaseSettings):
     llm_provider: str = Field(default="openai", alias="LLM_PROVIDER")
     openai_api_key: str = Field(default="", alias="OPENAI_API_KEY")
     openai_model: str = Field(default="gpt-4o-mini", alias="OPENAI_MODEL")
+    # Model tiering (app/services/model_tier.py): simple turns use the fast model. Policy per plan
+    # as "free:fast,pro:auto,enterprise:quality"; auto = classify each turn.
+    openai_fast_model: str = Field(default="gpt-4o-mini", alias="OPENAI_FAST_MODEL")
+    model_tier_default: str = Field(default="auto", alias="MODEL_TIER_DEFAULT")
+    model_tier_by_plan_config: str = Field(default="", alias="MODEL_TIER_BY_PLAN")
+    model_tier_max_fast_chars: int = Field(default=160, alias="MODEL_TIER_MAX_FAST_CHARS")
+    model_tier_max_fast_history: int = Field(default=6, alias="MODEL_TIER_MAX_FAST_HISTORY")
 
     anthropic_api_key: str = Field(default="", alias="ANTHROPIC_API_KEY")
     anthropic_model: str = Field(default="claude-3-5-sonnet-latest", alias="ANTHROPIC_MODEL")
@@ -21,6 +28,10 @@ class Settings(BaseSettings):
 
     ip_hash_salt: str = Field(default="", alias="IP_HASH_SALT")
     chat_memory_messages: int = Field(default=10, alias="CHAT_MEMORY_MESSAGES")
+    # Chat request deadline, kept under the widget's ~20s timeout; the LLM gets whatever is left.
+    # Optional stages (history) are skipped unless CHAT_MIN_LLM_SECONDS would remain after them.
+    chat_deadline_seconds: float = Field(default=18.0, alias="CHAT_DEADLINE_SECONDS")
+    chat_min_llm_seconds: float = Field(default=8.0, alias="CHAT_MIN_LLM_SECONDS")
 
     public_api_base: str = Field(default="", alias="PUBLIC_API_BASE")
     public_widget_src: str = Field(default="https://dental-bot-widget.vercel.app/widget.js", alias="PUBLIC_WIDGET_SRC")
@@ -32,6 +43,87 @@ class Settings(BaseSettings):
     smtp_password: str = Field(default="", alias="SMTP_PASSWORD")
     email_from: str = Field(default="info@lemontechno.org", alias="EMAIL_FROM")
     admin_email: str = Field(default="info@lemontechno.org", alias="ADMIN_EMAIL")
+    smtp_starttls: bool = Field(default=True, alias="SMTP_STARTTLS")
+    smtp_timeout: float = Field(default=10.0, alias="SMTP_TIMEOUT")
+    smtp_pool_size: int = Field(default=2, alias="SMTP_POOL_SIZE")
+    mail_queue_size: int = Field(default=1000, alias="MAIL_QUEUE_SIZE")
+    mail_max_attempts: int = Field(default=3, alias="MAIL_MAX_ATTEMPTS")
+    # Write queued mail to the mail_deliveries table (when Supabase is configured) so any worker
+    # can answer a delivery poll and mail left behind by a dead worker is sent by another one
+    mail_persist_deliveries: bool = Field(default=True, alias="MAIL_PERSIST_DELIVERIES")
+    mail_recover_interval_seconds: float = Field(default=60.0, alias="MAIL_RECOVER_INTERVAL_SECONDS")
+    mail_claim_stale_seconds: int = Field(default=300, alias="MAIL_CLAIM_STALE_SECONDS")
+    lead_digest_max_leads: int = Field(default=25, alias="LEAD_DIGEST_MAX_LEADS")
+
+    # Worker processes (gunicorn.conf.py / uvicorn --workers); enables the shared-state check
+    web_concurrency: int = Field(default=1, alias="WEB_CONCURRENCY")
+
+    # Clinic knowledge documents (app/services/knowledge.py): local BM25 index per clinic, stored in
+    # KNOWLEDGE_DIR (use a persistent volume); chat adds the best passages within the token budget.
+    knowledge_dir: str = Field(default="data/knowledge", alias="KNOWLEDGE_DIR")
+    knowledge_passage_words: int = Field(default=120, alias="KNOWLEDGE_PASSAGE_WORDS")
+    knowledge_top_k: int = Field(default=5, alias="KNOWLEDGE_TOP_K")
+    knowledge_token_budget: int = Field(default=600, alias="KNOWLEDGE_TOKEN_BUDGET")
+    knowledge_max_document_bytes: int = Field(default=512 * 1024, alias="KNOWLEDGE_MAX_DOCUMENT_BYTES")
+    knowledge_max_clinics: int = Field(default=500, alias="KNOWLEDGE_MAX_CLINICS")
+
+    # Outbound HTTP pools (app/http_clients.py): one per upstream (LLM, data API) and worker.
+    # Until response headers arrive the read timeout is capped at the pool's first-byte timeout.
+    http2_enabled: bool = Field(default=True, alias="HTTP2_ENABLED")
+    http_max_connections: int = Field(default=100, alias="HTTP_MAX_CONNECTIONS")
+    http_max_keepalive_connections: int = Field(default=20, alias="HTTP_MAX_KEEPALIVE_CONNECTIONS")
+    http_keepalive_expiry: float = Field(default=30.0, alias="HTTP_KEEPALIVE_EXPIRY")
+    http_connect_timeout: float = Field(default=5.0, alias="HTTP_CONNECT_TIMEOUT")
+    http_read_timeout: float = Field(default=30.0, alias="HTTP_READ_TIMEOUT")
+    http_write_timeout: float = Field(default=10.0, alias="HTTP_WRITE_TIMEOUT")
+    http_pool_timeout: float = Field(default=5.0, alias="HTTP_POOL_TIMEOUT")
+    llm_first_byte_timeout: float = Field(default=60.0, alias="LLM_FIRST_BYTE_TIMEOUT")
+    data_first_byte_timeout: float = Field(default=10.0, alias="DATA_FIRST_BYTE_TIMEOUT")
+
+    # Startup warmup: /ready returns 503 until it finishes (or times out)
+    warmup_enabled: bool = Field(default=True, alias="WARMUP_ENABLED")
+    warmup_clinic_limit: int = Field(default=1000, alias="WARMUP_CLINIC_LIMIT")
+    warmup_timeout_seconds: float = Field(default=30.0, alias="WARMUP_TIMEOUT_SECONDS")
+    warmup_llm_timeout_seconds: float = Field(default=5.0, alias="WARMUP_LLM_TIMEOUT_SECONDS")
+
+    # Structured JSON logs: queued to a writer thread, dropped (and counted) when the queue is full
+    log_level: str = Field(default="INFO", alias="LOG_LEVEL")
+    log_queue_size: int = Field(default=10000, alias="LOG_QUEUE_SIZE")
+    log_debug_sample_rate: float = Field(default=0.01, alias="LOG_DEBUG_SAMPLE_RATE")
+
+    # Request profiling (pyinstrument): fraction of requests sampled to PROFILE_DIR
+    profile_sample_rate: float = Field(default=0.0, alias="PROFILE_SAMPLE_RATE")
+    profile_dir: str = Field(default="/tmp/dental-bot-profiles", alias="PROFILE_DIR")
+    profile_keep: int = Field(default=50, alias="PROFILE_KEEP")
+    profile_interval: float = Field(default=0.001, alias="PROFILE_INTERVAL")
+
+    # Label cache/guardrail/fallback counters per clinic (turn off if clinic count explodes series)
+    metrics_per_clinic: bool = Field(default=True, alias="METRICS_PER_CLINIC")
+    # Bearer token for GET /metrics (Prometheus `authorization: credentials`); API_KEY always works too
+    metrics_token: str = Field(default="", alias="METRICS_TOKEN")
+    gzip_min_bytes: int = Field(default=1024, alias="GZIP_MIN_BYTES")
+    static_max_age: int = Field(default=300, alias="STATIC_MAX_AGE")
+    public_clinic_max_age: int = Field(default=60, alias="PUBLIC_CLINIC_MAX_AGE")
+    public_clinic_stale_seconds: int = Field(default=600, alias="PUBLIC_CLINIC_STALE_SECONDS")
+
+    lead_dedupe_ttl_seconds: int = Field(default=600, alias="LEAD_DEDUPE_TTL_SECONDS")
+    # How long a lead's key blocks retries before the lead is saved or notified; covers a
+    # worker dying mid-lead (the claim lapses) without letting a slow pipeline take it twice
+    lead_dedupe_pending_seconds: int = Field(default=120, alias="LEAD_DEDUPE_PENDING_SECONDS")
+    lead_queue_size: int = Field(default=1000, alias="LEAD_QUEUE_SIZE")
+    lead_workers: int = Field(default=4, alias="LEAD_WORKERS")
+
+    clinic_cache_ttl_seconds: float = Field(default=60.0, alias="CLINIC_CACHE_TTL_SECONDS")
+    clinic_cache_max_entries: int = Field(default=5000, alias="CLINIC_CACHE_MAX_ENTRIES")
+    clinic_import_batch_size: int = Field(default=100, alias="CLINIC_IMPORT_BATCH_SIZE")
+
+    # Chat message retention (0 = keep forever, the default: nothing is purged until a window
+    # is configured). Per-plan overrides as "free:30,pro:180"; a clinic's own retention_days
+    # column wins over both.
+    chat_retention_days: int = Field(default=0, alias="CHAT_RETENTION_DAYS")
+    chat_retention_days_by_plan: str = Field(default="", alias="CHAT_RETENTION_DAYS_BY_PLAN")
+    retention_batch_size: int = Field(default=500, alias="RETENTION_BATCH_SIZE")
+    retention_max_batches: int = Field(default=200, alias="RETENTION_MAX_BATCHES")
 
 
     def origins_list(self) -> List[str]:
@@ -39,6 +131,22 @@ class Settings(BaseSettings):
             return ["*"]
         return [o.strip() for o in self.allowed_origins.split(",") if o.strip()]
 
+    def retention_days_by_plan(self) -> Dict[str, int]:
+        plans: Dict[str, int] = {}
+        for item in self.chat_retention_days_by_plan.split(","):
+            plan, _, days = item.partition(":")
+            if plan.strip() and days.strip().isdigit():
+                plans[plan.strip()] = int(days.strip())
+        return plans
+
+    def model_tier_by_plan(self) -> Dict[str, str]:
+        policies: Dict[str, str] = {}
+        for item in self.model_tier_by_plan_config.split(","):
+            plan, _, policy = item.partition(":")
+            if plan.strip() and policy.strip() in ("auto", "fast", "quality"):
+                policies[plan.strip()] = policy.strip()
+        return policies
+
     @model_validator(mode='after')
     def set_default_email_from(self):
         # Only override if email_from is completely missing/empty
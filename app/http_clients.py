@@ -0,0 +1,168 @@
+"""Shared outbound HTTP transport for the LLM API and the Supabase data API.
+
+Each upstream has a named pool ("llm", "data") holding one long-lived httpx
+transport per worker. Clients built with `async_client()` / `sync_client()`
+send through it, so connections are kept alive and reused across requests
+instead of being opened per burst, and HTTP/2 (when the server offers it
+over TLS) multiplexes concurrent requests on one connection. Pool size,
+keep-alive and timeouts come from the HTTP_* settings.
+
+Timeouts: connect, write and pool (waiting for a free connection) are the
+usual httpx ones. Until the response headers arrive the read timeout is
+capped at the pool's first-byte timeout (LLM_FIRST_BYTE_TIMEOUT,
+DATA_FIRST_BYTE_TIMEOUT); after that it is back to HTTP_READ_TIMEOUT, or
+whatever the call asked for, and bounds each gap in a streamed body.
+
+Requests, new connections and time to response headers are counted in
+app/metrics.py from httpcore trace events.
+"""
+import logging
+import time
+import weakref
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from app.config import settings
+from app.metrics import HTTP_CLIENT_CONNECTIONS, HTTP_CLIENT_FIRST_BYTE_SECONDS, HTTP_CLIENT_REQUESTS
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+# httpx is imported on first use, like the SDKs that use these pools.
+_async_transports: Dict[str, "httpx.AsyncHTTPTransport"] = {}
+_sync_transports: Dict[str, "httpx.HTTPTransport"] = {}
+_async_clients: "weakref.WeakSet[httpx.AsyncClient]" = weakref.WeakSet()
+_lock = Lock()
+
+
+def first_byte_timeout(pool: str) -> Optional[float]:
+    return {
+        "llm": settings.llm_first_byte_timeout,
+        "data": settings.data_first_byte_timeout,
+    }.get(pool)
+
+
+def http2_enabled() -> bool:
+    if not settings.http2_enabled:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("HTTP2_ENABLED is set but h2 is not installed; using HTTP/1.1")
+        return False
+    return True
+
+
+def timeout() -> "httpx.Timeout":
+    import httpx
+
+    return httpx.Timeout(
+        connect=settings.http_connect_timeout,
+        read=settings.http_read_timeout,
+        write=settings.http_write_timeout,
+        pool=settings.http_pool_timeout,
+    )
+
+
+def _transport_options() -> dict:
+    import httpx
+
+    return {
+        "http2": http2_enabled(),
+        "limits": httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+        ),
+    }
+
+
+class _RequestTrace:
+    """httpcore trace callback for one request: metrics plus the first-byte read timeout."""
+
+    def __init__(self, pool: str, timeouts: dict) -> None:
+        self.pool = pool
+        self.timeouts = timeouts
+        self.read = timeouts.get("read")
+        self.start = time.perf_counter()
+        first_byte = first_byte_timeout(pool)
+        if first_byte is not None and (self.read is None or first_byte < self.read):
+            timeouts["read"] = first_byte
+
+    def __call__(self, event: str, info: dict) -> None:
+        if event == "connection.connect_tcp.complete":
+            HTTP_CLIENT_CONNECTIONS.labels(self.pool).inc()
+        elif event.endswith(".send_request_headers.started"):
+            HTTP_CLIENT_REQUESTS.labels(self.pool, event.split(".", 1)[0]).inc()
+        elif event.endswith(".receive_response_headers.complete"):
+            HTTP_CLIENT_FIRST_BYTE_SECONDS.labels(self.pool).observe(time.perf_counter() - self.start)
+            self.timeouts["read"] = self.read
+
+    async def atrace(self, event: str, info: dict) -> None:
+        self(event, info)
+
+
+def _trace_request(pool: str, request: "httpx.Request", is_async: bool) -> None:
+    # A fresh timeout dict is built per request, so adjusting it here only affects this request.
+    trace = _RequestTrace(pool, request.extensions.setdefault("timeout", {}))
+    request.extensions["trace"] = trace.atrace if is_async else trace
+
+
+def async_client(pool: str, **kwargs: Any) -> "httpx.AsyncClient":
+    """An AsyncClient sending through the shared `pool` transport (kwargs go to httpx.AsyncClient)."""
+    import httpx
+
+    with _lock:
+        transport = _async_transports.get(pool)
+        if transport is None:
+            transport = _async_transports[pool] = httpx.AsyncHTTPTransport(**_transport_options())
+
+    async def on_request(request: httpx.Request) -> None:
+        _trace_request(pool, request, is_async=True)
+
+    kwargs.setdefault("timeout", timeout())
+    client = httpx.AsyncClient(transport=transport, event_hooks={"request": [on_request]}, **kwargs)
+    _async_clients.add(client)
+    return client
+
+
+def sync_client(pool: str, **kwargs: Any) -> "httpx.Client":
+    """A Client sending through the shared `pool` transport (kwargs go to httpx.Client)."""
+    import httpx
+
+    with _lock:
+        transport = _sync_transports.get(pool)
+        if transport is None:
+            transport = _sync_transports[pool] = httpx.HTTPTransport(**_transport_options())
+
+    def on_request(request: httpx.Request) -> None:
+        _trace_request(pool, request, is_async=False)
+
+    kwargs.setdefault("timeout", timeout())
+    return httpx.Client(transport=transport, event_hooks={"request": [on_request]}, **kwargs)
+
+
+async def aclose() -> None:
+    """Close the async pools and their clients (connections belong to the running event loop).
+
+    Callers holding a client see `is_closed` and build a new one on next use.
+    """
+    with _lock:
+        clients = list(_async_clients)
+        transports = list(_async_transports.values())
+        _async_clients.clear()
+        _async_transports.clear()
+    for client in clients:
+        await client.aclose()
+    for transport in transports:
+        await transport.aclose()
+
+
+def reset() -> None:
+    """Forget every pool without closing it (after fork the sockets belong to the parent)."""
+    with _lock:
+        _async_clients.clear()
+        _async_transports.clear()
+        _sync_transports.clear()
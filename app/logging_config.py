@@ -0,0 +1,170 @@
+"""Structured JSON logging that never blocks the event loop.
+
+Records go through a bounded in-memory queue to a background thread that
+formats them as one JSON object per line and writes to stdout. When the
+queue is full (slow collector, log storm) records are dropped and counted
+instead of blocking the caller. Every record carries the current request_id
+and clinic_id, and DEBUG records are sampled at LOG_DEBUG_SAMPLE_RATE.
+
+Use plain `logging.getLogger(__name__)`; extra fields go in `extra={...}`.
+"""
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+from uuid import uuid4
+
+import orjson
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+clinic_id_var: ContextVar[Optional[str]] = ContextVar("clinic_id", default=None)
+
+# LogRecord attributes that are not user-supplied `extra` fields.
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "clinic_id"}
+
+_listener: Optional[QueueListener] = None
+_handler: Optional["DroppingQueueHandler"] = None
+
+
+def bind_clinic(clinic_id: Optional[str]) -> None:
+    """Tag the rest of this request's log records with `clinic_id`."""
+    clinic_id_var.set(clinic_id)
+
+
+class ContextFilter(logging.Filter):
+    """Stamps request/clinic ids and samples DEBUG records."""
+
+    def __init__(self, debug_sample_rate: float = 1.0):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0 and random.random() >= self.debug_sample_rate:
+            return False
+        record.request_id = request_id_var.get()
+        record.clinic_id = clinic_id_var.get()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if getattr(record, "clinic_id", None):
+            entry["clinic_id"] = record.clinic_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when full."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens on the writer thread; only resolve the message here
+        # so args referencing mutable objects are captured at log time.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging() -> None:
+    """Install the queue handler on the root logger and start the writer thread. Idempotent."""
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JSONFormatter())
+
+    _handler = DroppingQueueHandler(queue.Queue(maxsize=settings.log_queue_size))
+    _handler.addFilter(ContextFilter(settings.log_debug_sample_rate))
+
+    root = logging.getLogger()
+    root.handlers = [h for h in root.handlers if not isinstance(h, DroppingQueueHandler)]
+    root.addHandler(_handler)
+    root.setLevel(settings.log_level.upper())
+
+    _listener = QueueListener(_handler.queue, stream, respect_handler_level=False)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _handler is not None and _handler.dropped:
+        sys.stdout.write(orjson.dumps({"ts": round(time.time(), 3), "level": "warning", "logger": __name__, "msg": "log records dropped", "dropped": _handler.dropped}).decode() + "\n")
+
+
+def _restart_in_child() -> None:
+    """After fork the writer thread is gone (and the queue's lock may be held): start over."""
+    global _listener
+    if _listener is None:
+        return
+    _listener = None
+    setup_logging()
+
+
+os.register_at_fork(after_in_child=_restart_in_child)
+
+
+def dropped_count() -> int:
+    return _handler.dropped if _handler else 0
+
+
+class RequestContextMiddleware:
+    """Assigns a request id (incoming X-Request-ID or a new one) and echoes it back."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get("x-request-id") or uuid4().hex
+        rid_token = request_id_var.set(request_id[:64])
+        clinic_token = clinic_id_var.set(None)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(raw=message["headers"])["X-Request-ID"] = request_id_var.get()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(rid_token)
+            clinic_id_var.reset(clinic_token)
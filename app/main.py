@@ -2,28 +2,47 @@
 Clean, minimal FastAPI app that properly uses modular routes.
 This replaces the broken main.py with extensive duplication.
 """
+import asyncio
+import logging
 import os
-import redis.asyncio as redis
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 from datetime import datetime, timedelta
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 
 load_dotenv()
 
 from app.config import settings
 from app.routes import chat, leads, admin, clinics, public
+from app.utils.email import start_mail, stop_mail
+from app.metrics import ServerTimingMiddleware, render_latest
+from app.security import require_metrics_token
+from app import http_clients, static_assets
+from app.compression import SelectiveGZipMiddleware
+from app.profiling import ProfilingMiddleware
+from app.workers import check_shared_state
+from app.services.warmup import open_llm_connection, prefetch_clinics, preload_sdks, warmup
+from app.logging_config import RequestContextMiddleware, setup_logging, shutdown_logging
+
+setup_logging()
+
+logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Dental Bot API",
     description="AI-powered dental clinic chat and lead management",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
+# Gzip buffered JSON/HTML responses above the threshold; NDJSON streams and
+# already-encoded static assets pass through untouched.
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=settings.gzip_min_bytes)
+
 # CORS Configuration: Allow specified origins or all if configured
 origins = settings.origins_list()
 app.add_middleware(
@@ -32,34 +51,86 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Request-ID"],
 )
 
-# Startup event: Initialize Redis connection
+# Per-request stage timings: Server-Timing header + request_stage_seconds histograms
+app.add_middleware(ServerTimingMiddleware)
+
+# Admin-only per-request profiles (X-Profile: 1) and optional sampled profiling
+app.add_middleware(ProfilingMiddleware)
+
+# Outermost: request id for every log line and the X-Request-ID response header
+app.add_middleware(RequestContextMiddleware)
+
+async def connect_redis() -> None:
+    """Connect to Redis for rate limiting and lead dedupe; until then both use in-memory fallbacks."""
+    redis_url = settings.redis_url
+    if not redis_url:
+        logger.info("Redis URL not configured; rate limiting will use in-memory fallback")
+        return
+    import redis.asyncio as redis
+
+    try:
+        # Create Redis connection pool
+        pool = redis.ConnectionPool.from_url(redis_url, decode_responses=False)
+        client = redis.Redis(connection_pool=pool)
+        # Test connection
+        await client.ping()
+        app.state.redis = client
+        logger.info("Redis connected")
+    except Exception as e:
+        logger.warning("Redis connection failed; rate limiting will use in-memory fallback", extra={"error": str(e)})
+
+
+async def load_static_assets() -> int:
+    return len(await asyncio.to_thread(static_assets.load_assets))
+
+
+async def background_startup() -> None:
+    """Startup work the app can serve without: it only makes the first requests faster.
+
+    The worker reports ready on /ready once this finishes.
+    """
+    steps = [
+        ("redis", connect_redis),
+        ("static_assets", load_static_assets),
+        ("sdks", lambda: asyncio.to_thread(preload_sdks)),
+    ]
+    if settings.warmup_enabled:
+        steps += [
+            ("clinics", lambda: asyncio.to_thread(prefetch_clinics)),
+            ("llm_connection", open_llm_connection),
+        ]
+    await warmup.run(steps, timeout=settings.warmup_timeout_seconds)
+
+
+# Startup event: only what requests need is awaited; the rest runs in the background
 @app.on_event("startup")
 async def startup_event():
-    """Initialize Redis connection for rate limiting and caching."""
-    redis_url = settings.redis_url
-    if redis_url:
-        try:
-            # Create Redis connection pool
-            pool = redis.ConnectionPool.from_url(redis_url, decode_responses=False)
-            app.state.redis = redis.Redis(connection_pool=pool)
-            # Test connection
-            await app.state.redis.ping()
-            print("✅ Redis connected successfully")
-        except Exception as e:
-            print(f"⚠️  Redis connection failed: {e}. Rate limiting will use in-memory fallback.")
-            app.state.redis = None
-    else:
-        print("ℹ️  Redis URL not configured. Rate limiting will use in-memory fallback.")
-        app.state.redis = None
+    """Start the mail queue and lead pipeline, then kick off background startup."""
+    app.state.redis = None
+    warmup.reset()
+    check_shared_state()
+    if settings.smtp_host:
+        await start_mail()
+    await leads.lead_pipeline.start()
+    app.state.background_startup = asyncio.create_task(background_startup())
 
 # Shutdown event: Close Redis connection
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Clean up Redis connection on shutdown."""
+    """Finish queued leads, deliver queued mail and clean up Redis connection on shutdown."""
+    warmup.drain()
+    task = getattr(app.state, "background_startup", None)
+    if task is not None and not task.done():
+        task.cancel()
+    await leads.lead_pipeline.stop()
+    await stop_mail()
+    await http_clients.aclose()
     if hasattr(app.state, "redis") and app.state.redis:
         await app.state.redis.close()
+    shutdown_logging()
 
 # Register API route modules
 app.include_router(chat.router)
@@ -69,10 +140,8 @@ app.include_router(admin.router)
 app.include_router(clinics.router)
 app.include_router(public.router)
 
-# Mount static files (widget.js, admin.html, etc.)
-static_dir = os.path.join(os.path.dirname(__file__), "..", "static")
-if os.path.exists(static_dir):
-    app.mount("/static", StaticFiles(directory=static_dir), name="static")
+# Static files (widget.js, admin.html, etc.), precompressed and fingerprinted
+app.include_router(static_assets.router)
 
 # Health check endpoint
 @app.get("/health")
@@ -92,6 +161,18 @@ async def health():
         "redis_connected": redis_ok,
     }
 
+@app.get("/ready")
+async def ready():
+    """Readiness: 503 until startup warmup has finished (use /health for liveness)."""
+    status = warmup.status()
+    return ORJSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+async def metrics():
+    """Prometheus scrape endpoint (per-clinic labels, so behind METRICS_TOKEN / API_KEY)."""
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/")
 async def root():
     """Root endpoint."""
@@ -0,0 +1,211 @@
+"""Prometheus metrics shared across the app, plus per-request stage timing.
+
+Metrics are module-level so any route or service can import and update them;
+`render_latest()` serves them in the text exposition format. When
+PROMETHEUS_MULTIPROC_DIR is set (it must be set before this module is first
+imported, e.g. by the process manager) every worker writes its samples there
+and `/metrics` aggregates all workers instead of reporting whichever one
+answered the scrape.
+
+Stage timings are recorded with `stage("name")`. Each one is observed in
+STAGE_SECONDS (labelled by stage and route template) and, inside a request
+wrapped by ServerTimingMiddleware, listed in that response's Server-Timing
+header if it finished before the headers were sent.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+
+# Lead intake (POST /lead, /leads): time until the response is ready, and
+# what happened to each submission.
+LEAD_INTAKE_SECONDS = Histogram(
+    "lead_intake_seconds",
+    "Time to accept or reject a lead submission",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+LEADS_TOTAL = Counter(
+    "leads_total",
+    "Lead submissions by outcome (accepted, duplicate, not_found)",
+    ["outcome"],
+)
+LEAD_PIPELINE_SECONDS = Histogram(
+    "lead_pipeline_seconds",
+    "Background persistence and notification time per lead",
+)
+LEAD_PIPELINE_ERRORS = Counter(
+    "lead_pipeline_errors_total",
+    "Background lead processing failures by stage",
+    ["stage"],
+)
+
+# Request pipeline stages: clinic_lookup, session_resolution, history_fetch, knowledge_retrieval,
+# guardrails, llm_ttft, llm_total, background_write. Histograms are not
+# labelled by clinic (buckets x clinics grows too fast); the counters below are.
+STAGE_SECONDS = Histogram(
+    "request_stage_seconds",
+    "Time spent in each request pipeline stage",
+    ["stage", "route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0),
+)
+CLINIC_CACHE_TOTAL = Counter(
+    "clinic_cache_lookups_total",
+    "Clinic cache lookups by result (hit, miss)",
+    ["clinic", "route", "result"],
+)
+GUARDRAIL_TOTAL = Counter(
+    "guardrail_outcomes_total",
+    "Chat guardrail decisions (pass, emergency, medical_advice, competitor)",
+    ["clinic", "route", "outcome"],
+)
+DEADLINE_TOTAL = Counter(
+    "deadline_exceeded_total",
+    "Request stages cut short by the request deadline: skipped (no budget left) or timed_out",
+    ["stage", "route", "outcome"],
+)
+FALLBACK_TOTAL = Counter(
+    "fallbacks_total",
+    "Degraded paths taken (clinic_lookup_error, demo_clinic, session, history, history_deadline, knowledge)",
+    ["clinic", "route", "kind"],
+)
+
+# Outbound HTTP pools (app/http_clients.py). Connection reuse per pool is
+# 1 - rate(http_client_connections_opened_total) / rate(http_client_requests_total).
+HTTP_CLIENT_REQUESTS = Counter(
+    "http_client_requests_total",
+    "Outbound HTTP requests by pool (llm, data) and protocol (http11, http2)",
+    ["pool", "protocol"],
+)
+HTTP_CLIENT_CONNECTIONS = Counter(
+    "http_client_connections_opened_total",
+    "New outbound connections by pool",
+    ["pool"],
+)
+HTTP_CLIENT_FIRST_BYTE_SECONDS = Histogram(
+    "http_client_first_byte_seconds",
+    "Time from sending an outbound request (including waiting for a pooled connection) to its response headers",
+    ["pool"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+# Model tiering (app/services/model_tier.py): choices, and chat feedback by the tier that answered.
+MODEL_TIER_TOTAL = Counter(
+    "model_tier_choices_total",
+    "Chat turns by model tier (fast, quality) and reason",
+    ["tier", "reason"],
+)
+MODEL_TIER_FEEDBACK_TOTAL = Counter(
+    "model_tier_feedback_total",
+    "Chat feedback (up, down) by the model tier of the session's last answer",
+    ["tier", "rating"],
+)
+
+_request_ctx: ContextVar[Optional[dict]] = ContextVar("request_metrics", default=None)
+
+
+def route_label() -> str:
+    """Route template of the current request (e.g. /public/clinic/{clinic_id})."""
+    ctx = _request_ctx.get()
+    route = ctx["scope"].get("route") if ctx else None
+    return getattr(route, "path", None) or "unknown"
+
+
+def clinic_label(clinic_id: Optional[str]) -> str:
+    """Clinic label value; collapsed to "all" when METRICS_PER_CLINIC is off."""
+    if not settings.metrics_per_clinic:
+        return "all"
+    return clinic_id or "unknown"
+
+
+def record_stage(name: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(name, route_label()).observe(seconds)
+    ctx = _request_ctx.get()
+    if ctx is not None:
+        ctx["timings"].append((name, seconds))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def count_cache(clinic_id: Optional[str], hit: bool) -> None:
+    CLINIC_CACHE_TOTAL.labels(clinic_label(clinic_id), route_label(), "hit" if hit else "miss").inc()
+
+
+def count_guardrail(clinic_id: Optional[str], outcome: str) -> None:
+    GUARDRAIL_TOTAL.labels(clinic_label(clinic_id), route_label(), outcome).inc()
+
+
+def count_fallback(clinic_id: Optional[str], kind: str) -> None:
+    FALLBACK_TOTAL.labels(clinic_label(clinic_id), route_label(), kind).inc()
+
+
+def count_deadline(stage_name: str, outcome: str) -> None:
+    DEADLINE_TOTAL.labels(stage_name, route_label(), outcome).inc()
+
+
+def _server_timing(timings: list, total: float) -> str:
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings]
+    parts.append(f"app;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class ServerTimingMiddleware:
+    """Sets up per-request stage timing and adds a Server-Timing response header.
+
+    Streaming responses send headers before the LLM finishes, so their
+    header only covers stages completed by then; the histograms get all.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        ctx = {"scope": scope, "timings": []}
+        token = _request_ctx.set(ctx)
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                headers.append("Server-Timing", _server_timing(ctx["timings"], time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_ctx.reset(token)
+
+
+def render_latest() -> tuple[bytes, str]:
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead(pid: int) -> None:
+    """Drop a dead worker's live samples (call from the process manager's child_exit hook)."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
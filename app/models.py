@@ -42,9 +42,11 @@ class LeadRequest(BaseModel):
     phone: Optional[str] = None
     email: Optional[str] = None
     message: Optional[str] = None
+    idempotency_key: Optional[str] = Field(default=None, max_length=128)
 
 class LeadResponse(BaseModel):
     ok: bool = True
+    duplicate: bool = False
 
 class FeedbackRequest(BaseModel):
     clinic_id: str
@@ -0,0 +1,159 @@
+"""Opt-in request profiling with pyinstrument (optional dependency).
+
+On demand: send `X-Profile: 1` (or `?profile=1`) together with a valid
+`X-API-Key` and the response body is replaced by the profile of that request.
+Pick the format with `X-Profile-Format` / `?profile_format=`: `text` (call
+tree, default), `html`, or `speedscope` (flamegraph JSON for speedscope.app).
+
+Continuous: with PROFILE_SAMPLE_RATE > 0, that fraction of requests is
+profiled in the background and written as speedscope JSON to PROFILE_DIR,
+keeping the newest PROFILE_KEEP files.
+
+Profiles follow the request's event-loop task; work a sync route hands to the
+threadpool shows up as time spent awaiting it.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Optional
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FORMATS = {
+    "text": "text/plain; charset=utf-8",
+    "html": "text/html; charset=utf-8",
+    "speedscope": "application/json",
+}
+
+
+def _profiler_class():
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        return None
+    return Profiler
+
+
+def _render(profiler, fmt: str) -> str:
+    if fmt == "html":
+        return profiler.output_html()
+    if fmt == "speedscope":
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        return profiler.output(renderer=SpeedscopeRenderer())
+    return profiler.output_text(unicode=True, color=False)
+
+
+def _write_sample(directory: str, keep: int, name: str, body: str) -> None:
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+        f.write(body)
+    files = sorted(
+        (os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".speedscope.json")),
+        key=os.path.getmtime,
+    )
+    for old in files[:-keep] if keep > 0 else []:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+
+
+class ProfilingMiddleware:
+    """Profiles single requests on demand, or a random sample of traffic to disk.
+
+    When neither is requested the cost is a header/query-string check and one
+    random() call (skipped entirely when the sample rate is 0).
+    """
+
+    def __init__(self, app: ASGIApp, sample_rate: Optional[float] = None, directory: Optional[str] = None, keep: Optional[int] = None):
+        self.app = app
+        self.sample_rate = settings.profile_sample_rate if sample_rate is None else sample_rate
+        self.directory = directory or settings.profile_dir
+        self.keep = settings.profile_keep if keep is None else keep
+        self._busy = asyncio.Lock()
+
+    def _requested(self, scope: Scope) -> Optional[str]:
+        """Requested profile format if this request asked for (and may have) a profile."""
+        headers = Headers(scope=scope)
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1")) if b"profile" in scope.get("query_string", b"") else {}
+        if headers.get("x-profile") != "1" and query.get("profile") != ["1"]:
+            return None
+        if headers.get("x-api-key") != settings.api_key:
+            return None
+        return headers.get("x-profile-format") or (query.get("profile_format") or ["text"])[0]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        fmt = self._requested(scope)
+        if fmt is not None:
+            await self._profile_request(scope, receive, send, fmt)
+        elif self.sample_rate > 0 and random.random() < self.sample_rate and not self._busy.locked():
+            await self._sample(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    async def _profile_request(self, scope: Scope, receive: Receive, send: Send, fmt: str) -> None:
+        Profiler = _profiler_class()
+        if fmt not in PROFILE_FORMATS or Profiler is None:
+            detail = "pyinstrument is not installed" if Profiler is None else f"profile_format must be one of {', '.join(PROFILE_FORMATS)}"
+            await _send_plain(send, 501 if Profiler is None else 400, detail)
+            return
+
+        async def discard(message: Message) -> None:
+            pass
+
+        # One profiler at a time; pyinstrument cannot nest them in one thread.
+        async with self._busy:
+            profiler = Profiler(interval=settings.profile_interval, async_mode="enabled")
+            profiler.start()
+            try:
+                await self.app(scope, receive, discard)
+            finally:
+                profiler.stop()
+        body = await asyncio.to_thread(_render, profiler, fmt)
+        await _send_plain(send, 200, body, PROFILE_FORMATS[fmt])
+
+    async def _sample(self, scope: Scope, receive: Receive, send: Send) -> None:
+        Profiler = _profiler_class()
+        if Profiler is None:
+            self.sample_rate = 0
+            logger.warning("PROFILE_SAMPLE_RATE is set but pyinstrument is not installed; sampling disabled")
+            await self.app(scope, receive, send)
+            return
+
+        async with self._busy:
+            profiler = Profiler(interval=settings.profile_interval, async_mode="enabled")
+            profiler.start()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                profiler.stop()
+        path = scope.get("path", "").strip("/").replace("/", "_") or "root"
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{path}-{random.randrange(16 ** 6):06x}.speedscope.json"
+        try:
+            body = await asyncio.to_thread(_render, profiler, "speedscope")
+            await asyncio.to_thread(_write_sample, self.directory, self.keep, name, body)
+        except Exception as e:
+            logger.warning("Failed to write profile sample", extra={"error": str(e)})
+
+
+async def _send_plain(send: Send, status: int, body: str, content_type: str = "text/plain; charset=utf-8") -> None:
+    data = body.encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(data)).encode())],
+    })
+    await send({"type": "http.response.body", "body": data})
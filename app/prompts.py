@@ -1,3 +1,8 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
 def get_system_prompt(clinic: dict) -> str:
     name = clinic.get("clinic_name", "the business")
     name_lower = name.lower()
@@ -22,7 +27,7 @@ def get_system_prompt(clinic: dict) -> str:
         specialization = "technology company"
 
     # Debug log to verify specialization detection
-    print(f"[PROMPT DEBUG] Clinic: {name} | Type: {specialization} | Medical: {is_medical}")
+    logger.debug("System prompt built", extra={"clinic_name": name, "specialization": specialization, "medical": is_medical})
 
     prompt = f"""You are a helpful and professional AI assistant for {name}, a {specialization}.
 Your goal is to assist visitors with information about services, booking, and general inquiries.
@@ -1,9 +1,12 @@
+import logging
 from fastapi import Request, HTTPException, status
 from typing import Optional
 import time
 from threading import Lock
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 _store = {}
 _lock = Lock()
 
@@ -40,7 +43,7 @@ async def _redis_limit(request: Request, max_requests: int, window_seconds: int)
             raise
         except Exception as e:
             # fallthrough to in-memory fallback on Redis error
-            print(f"Redis rate limit error: {e}. Using in-memory fallback.")
+            logger.warning("Redis rate limit failed; using in-memory fallback", extra={"error": str(e)})
             pass
 
     # Fallback in-memory limiter (per-process)
@@ -0,0 +1,152 @@
+-- Daily per-clinic feedback rollup, maintained incrementally from chat_feedback.
+-- get_clinic_feedback_stats (raw scan) stays in place for reconciliation.
+create table if not exists public.chat_feedback_daily (
+    clinic_id uuid not null references public.clinics(id) on delete cascade,
+    day date not null, -- UTC day of chat_feedback.created_at
+    up bigint not null default 0,
+    down bigint not null default 0,
+    total bigint not null default 0,
+    updated_at timestamp with time zone default timezone('utc'::text, now()),
+
+    constraint chat_feedback_daily_pkey primary key (clinic_id, day)
+);
+
+-- Date-range reads across all clinics (weekly summary, admin counts).
+create index if not exists chat_feedback_daily_day_idx
+    on public.chat_feedback_daily (day) include (up, down, total);
+
+alter table public.chat_feedback_daily enable row level security;
+
+create policy "Service role can manage chat feedback rollup"
+    on public.chat_feedback_daily
+    using ( true )
+    with check ( true );
+
+-- Statement-level trigger: one grouped upsert per statement, so bulk inserts
+-- touch each (clinic, day) row once. Feedback without a clinic is not rolled up.
+create or replace function chat_feedback_daily_apply()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op in ('INSERT', 'UPDATE') then
+        insert into chat_feedback_daily as d (clinic_id, day, up, down, total)
+        select
+            n.clinic_id,
+            (n.created_at at time zone 'utc')::date,
+            count(*) filter (where n.rating = 'up'),
+            count(*) filter (where n.rating = 'down'),
+            count(*)
+        from new_rows n
+        where n.clinic_id is not null
+        group by 1, 2
+        on conflict (clinic_id, day) do update set
+            up = d.up + excluded.up,
+            down = d.down + excluded.down,
+            total = d.total + excluded.total,
+            updated_at = timezone('utc'::text, now());
+    end if;
+
+    if tg_op in ('DELETE', 'UPDATE') then
+        update chat_feedback_daily d set
+            up = d.up - o.up,
+            down = d.down - o.down,
+            total = d.total - o.total,
+            updated_at = timezone('utc'::text, now())
+        from (
+            select
+                clinic_id,
+                (created_at at time zone 'utc')::date as day,
+                count(*) filter (where rating = 'up') as up,
+                count(*) filter (where rating = 'down') as down,
+                count(*) as total
+            from old_rows
+            where clinic_id is not null
+            group by 1, 2
+        ) o
+        where d.clinic_id = o.clinic_id and d.day = o.day;
+    end if;
+
+    return null;
+end;
+$$;
+
+-- Block writers while the triggers go in and the backfill runs, so no row is
+-- counted twice or missed.
+begin;
+
+lock table public.chat_feedback in share row exclusive mode;
+
+drop trigger if exists chat_feedback_daily_ins on public.chat_feedback;
+create trigger chat_feedback_daily_ins
+    after insert on public.chat_feedback
+    referencing new table as new_rows
+    for each statement execute function chat_feedback_daily_apply();
+
+drop trigger if exists chat_feedback_daily_upd on public.chat_feedback;
+create trigger chat_feedback_daily_upd
+    after update on public.chat_feedback
+    referencing old table as old_rows new table as new_rows
+    for each statement execute function chat_feedback_daily_apply();
+
+drop trigger if exists chat_feedback_daily_del on public.chat_feedback;
+create trigger chat_feedback_daily_del
+    after delete on public.chat_feedback
+    referencing old table as old_rows
+    for each statement execute function chat_feedback_daily_apply();
+
+-- Backfill from the raw table (idempotent: overwrites existing rollup rows).
+insert into public.chat_feedback_daily (clinic_id, day, up, down, total)
+select
+    clinic_id,
+    (created_at at time zone 'utc')::date,
+    count(*) filter (where rating = 'up'),
+    count(*) filter (where rating = 'down'),
+    count(*)
+from public.chat_feedback
+where clinic_id is not null
+group by 1, 2
+on conflict (clinic_id, day) do update set
+    up = excluded.up,
+    down = excluded.down,
+    total = excluded.total,
+    updated_at = timezone('utc'::text, now());
+
+commit;
+
+-- Same result shape as get_clinic_feedback_stats, read from the rollup.
+-- Day granularity: UTC days from start_date's day up to, but not including,
+-- end_date's day, so back-to-back ranges never count a day twice.
+create or replace function get_clinic_feedback_rollup(
+    start_date timestamp with time zone default null,
+    end_date timestamp with time zone default null
+)
+returns table (
+    clinic_id uuid,
+    clinic_name text,
+    up bigint,
+    down bigint,
+    total bigint
+)
+language plpgsql
+as $$
+begin
+    return query
+    select
+        d.clinic_id,
+        c.clinic_name,
+        sum(d.up)::bigint as up,
+        sum(d.down)::bigint as down,
+        sum(d.total)::bigint as total
+    from chat_feedback_daily d
+    left join clinics c on d.clinic_id = c.id
+    where
+        (start_date is null or d.day >= (start_date at time zone 'utc')::date)
+        and (end_date is null or d.day < (end_date at time zone 'utc')::date)
+    group by d.clinic_id, c.clinic_name
+    having sum(d.total) > 0;
+end;
+$$;
+
+revoke execute on function get_clinic_feedback_rollup(timestamp with time zone, timestamp with time zone) from public;
+grant execute on function get_clinic_feedback_rollup(timestamp with time zone, timestamp with time zone) to service_role;
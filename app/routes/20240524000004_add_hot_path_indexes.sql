@@ -0,0 +1,50 @@
+-- Indexes for the request hot paths and the keyset-paginated admin/export reads.
+
+-- get_or_create_session: chat_sessions.session_key equality
+create index if not exists chat_sessions_session_key_idx
+    on public.chat_sessions (session_key);
+
+-- Per-clinic session scans ordered by the (created_at, id) keyset
+create index if not exists chat_sessions_clinic_created_idx
+    on public.chat_sessions (clinic_id, created_at, id);
+
+-- fetch_recent_messages: filter by session, newest first
+create index if not exists chat_messages_session_created_idx
+    on public.chat_messages (session_id, created_at desc);
+
+-- get_clinic_by_public_id: clinics.clinic_id equality. The upsert's
+-- on_conflict=clinic_id already requires a unique index; only add one if missing.
+do $$
+begin
+    if not exists (
+        select 1
+        from pg_index i
+        join pg_attribute a on a.attrelid = i.indrelid and a.attnum = i.indkey[0]
+        where i.indrelid = 'public.clinics'::regclass
+          and i.indisunique
+          and i.indnkeyatts = 1
+          and a.attname = 'clinic_id'
+    ) then
+        create unique index clinics_clinic_id_key on public.clinics (clinic_id);
+    end if;
+end;
+$$;
+
+-- Admin listings page clinics by (created_at, id)
+create index if not exists clinics_created_id_idx
+    on public.clinics (created_at, id);
+
+-- chat_feedback: created_at range scans, (created_at, id) keyset export and
+-- the raw get_clinic_feedback_stats aggregate (covering: clinic_id, rating).
+create index if not exists chat_feedback_created_id_idx
+    on public.chat_feedback (created_at, id) include (clinic_id, rating);
+
+create index if not exists chat_feedback_clinic_created_idx
+    on public.chat_feedback (clinic_id, created_at);
+
+-- competitor_queries: created_at range scans and (created_at, id) keyset listing
+create index if not exists competitor_queries_created_id_idx
+    on public.competitor_queries (created_at, id);
+
+create index if not exists competitor_queries_clinic_created_idx
+    on public.competitor_queries (clinic_id, created_at);
@@ -0,0 +1,137 @@
+-- Convert chat_messages into a table range-partitioned by month on created_at.
+-- Recent-history reads only touch the newest partitions, and expired months can
+-- be detached instead of deleted row by row.
+
+-- Both functions run as their owner (the owner of chat_messages, see below):
+-- creating a partition requires owning the table, and the retention cron
+-- calls them over RPC as service_role.
+
+-- Creates the monthly partition containing `month` if it does not exist yet.
+-- Rows that already landed in chat_messages_default for that month are moved
+-- into the new partition (attaching over them would fail).
+create or replace function create_chat_messages_partition(month date)
+returns text
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    start_at date := date_trunc('month', month)::date;
+    end_at date := (date_trunc('month', month) + interval '1 month')::date;
+    part_name text := 'chat_messages_' || to_char(start_at, 'YYYY_MM');
+begin
+    if to_regclass('public.' || part_name) is null then
+        if to_regclass('public.chat_messages_default') is not null and exists (
+            select 1 from public.chat_messages_default where created_at >= start_at and created_at < end_at
+        ) then
+            execute format(
+                'create table public.%I (like public.chat_messages including defaults including constraints)',
+                part_name
+            );
+            execute format(
+                'with moved as (delete from public.chat_messages_default where created_at >= %L and created_at < %L returning *) '
+                'insert into public.%I select * from moved',
+                start_at, end_at, part_name
+            );
+            execute format(
+                'alter table public.chat_messages attach partition public.%I for values from (%L) to (%L)',
+                part_name, start_at, end_at
+            );
+        else
+            execute format(
+                'create table public.%I partition of public.chat_messages for values from (%L) to (%L)',
+                part_name, start_at, end_at
+            );
+        end if;
+        execute format('alter table public.%I enable row level security', part_name);
+    end if;
+    return part_name;
+end;
+$$;
+
+-- Ensures partitions exist from the current month through `months_ahead`
+-- months from now. Run at least monthly (the retention cron calls it).
+create or replace function ensure_chat_messages_partitions(months_ahead int default 3)
+returns setof text
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    m int;
+begin
+    for m in 0..months_ahead loop
+        return next create_chat_messages_partition(
+            (date_trunc('month', timezone('utc'::text, now())) + make_interval(months => m))::date
+        );
+    end loop;
+end;
+$$;
+
+revoke execute on function create_chat_messages_partition(date) from public;
+revoke execute on function ensure_chat_messages_partitions(int) from public;
+grant execute on function ensure_chat_messages_partitions(int) to service_role;
+
+begin;
+
+lock table public.chat_messages in access exclusive mode;
+
+alter table public.chat_messages rename to chat_messages_unpartitioned;
+alter index if exists public.chat_messages_pkey rename to chat_messages_unpartitioned_pkey;
+alter index if exists public.chat_messages_session_created_idx rename to chat_messages_unpartitioned_session_created_idx;
+
+-- Same columns and defaults; the primary key must include the partition key.
+create table public.chat_messages (
+    like public.chat_messages_unpartitioned including defaults including constraints,
+    constraint chat_messages_pkey primary key (id, created_at),
+    constraint chat_messages_session_id_fkey foreign key (session_id)
+        references public.chat_sessions(id) on delete cascade
+) partition by range (created_at);
+
+alter table public.chat_messages alter column created_at set not null;
+
+-- Rows with a created_at outside every monthly partition land here.
+create table public.chat_messages_default partition of public.chat_messages default;
+
+-- The partition functions are security definer; they must be owned by the
+-- role that owns the table they add partitions to.
+do $$
+declare
+    table_owner name := (select tableowner from pg_tables where schemaname = 'public' and tablename = 'chat_messages');
+begin
+    execute format('alter function public.create_chat_messages_partition(date) owner to %I', table_owner);
+    execute format('alter function public.ensure_chat_messages_partitions(int) owner to %I', table_owner);
+end;
+$$;
+
+-- One partition per month that already has data, plus the months ahead.
+select create_chat_messages_partition(month::date)
+from generate_series(
+    date_trunc('month', coalesce((select min(created_at) from public.chat_messages_unpartitioned), timezone('utc'::text, now()))),
+    date_trunc('month', timezone('utc'::text, now())),
+    interval '1 month'
+) as month;
+select ensure_chat_messages_partitions(3);
+
+-- created_at is part of the key now; stamp any legacy rows that lack it.
+update public.chat_messages_unpartitioned
+set created_at = timezone('utc'::text, now())
+where created_at is null;
+
+insert into public.chat_messages
+select * from public.chat_messages_unpartitioned;
+
+create index chat_messages_session_created_idx
+    on public.chat_messages (session_id, created_at desc);
+
+alter table public.chat_messages enable row level security;
+alter table public.chat_messages_default enable row level security;
+
+create policy "Service role can manage chat messages"
+    on public.chat_messages
+    using ( true )
+    with check ( true );
+
+drop table public.chat_messages_unpartitioned;
+
+commit;
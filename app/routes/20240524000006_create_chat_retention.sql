@@ -0,0 +1,30 @@
+-- Chat message retention: optional per-clinic window and compacted session archives.
+
+-- Days of chat_messages to keep for this clinic; null falls back to the plan /
+-- global default configured on the API (CHAT_RETENTION_DAYS*), 0 keeps forever.
+alter table public.clinics add column if not exists retention_days integer;
+
+-- One row per session whose expired messages were removed: counts, time span
+-- and a truncated transcript of what was deleted.
+create table if not exists public.chat_session_archives (
+    session_id uuid not null references public.chat_sessions(id) on delete cascade,
+    clinic_id uuid references public.clinics(id) on delete cascade,
+    message_count integer not null default 0,
+    content_bytes bigint not null default 0,
+    first_message_at timestamp with time zone,
+    last_message_at timestamp with time zone,
+    summary text,
+    archived_at timestamp with time zone default timezone('utc'::text, now()),
+
+    constraint chat_session_archives_pkey primary key (session_id)
+);
+
+create index if not exists chat_session_archives_clinic_idx
+    on public.chat_session_archives (clinic_id, last_message_at);
+
+alter table public.chat_session_archives enable row level security;
+
+create policy "Service role can manage chat session archives"
+    on public.chat_session_archives
+    using ( true )
+    with check ( true );
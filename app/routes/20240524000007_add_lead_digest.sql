@@ -0,0 +1,3 @@
+-- Opt-in lead digest: when set, lead notifications for the clinic are batched
+-- into one email per window of this many minutes instead of one email per lead.
+alter table public.clinics add column if not exists lead_digest_minutes integer;
@@ -0,0 +1,4 @@
+-- Set once the onboarding email for a clinic has been delivered, so repeat
+-- upserts of the same clinic (including from other workers or after a
+-- restart) do not send it again.
+alter table public.clinics add column if not exists onboarding_email_sent_at timestamptz;
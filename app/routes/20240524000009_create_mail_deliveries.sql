@@ -0,0 +1,63 @@
+-- Outbound mail accepted by the API's mail queue (app/services/mailer.py).
+-- Rows are written before a message is queued, so a delivery id can be polled
+-- from any worker and mail left unsent by a worker that died is picked up by
+-- another one through claim_mail_deliveries().
+create table if not exists public.mail_deliveries (
+    id text not null,
+    idempotency_key text,
+    status text not null default 'queued', -- queued, sending, retrying, sent, failed
+    to_email text,
+    subject text,
+    message text, -- the RFC 5322 message; cleared once sent
+    attempts integer not null default 0,
+    error text,
+    claimed_by text, -- the API worker holding the delivery in its queue
+    claimed_at timestamp with time zone,
+    created_at timestamp with time zone default timezone('utc'::text, now()),
+    updated_at timestamp with time zone default timezone('utc'::text, now()),
+
+    constraint mail_deliveries_pkey primary key (id),
+    constraint mail_deliveries_idempotency_key_key unique (idempotency_key)
+);
+
+create index if not exists mail_deliveries_unsent_idx
+    on public.mail_deliveries (claimed_at)
+    where status in ('queued', 'sending', 'retrying');
+
+alter table public.mail_deliveries enable row level security;
+
+create policy "Service role can manage mail deliveries"
+    on public.mail_deliveries
+    using ( true )
+    with check ( true );
+
+-- Hand unsent deliveries whose claim has not been refreshed for stale_seconds
+-- (or was released on shutdown) to `worker`. Live workers refresh their
+-- claims well within that window; skip locked keeps two workers from taking
+-- the same row.
+create or replace function public.claim_mail_deliveries(
+    worker text,
+    stale_seconds integer default 300,
+    max_rows integer default 100
+)
+returns setof public.mail_deliveries
+language sql
+as $$
+    update public.mail_deliveries d
+    set claimed_by = worker,
+        claimed_at = now(),
+        status = 'queued',
+        updated_at = now()
+    where d.id in (
+        select id from public.mail_deliveries
+        where status in ('queued', 'sending', 'retrying')
+          and (claimed_at is null or claimed_at < now() - make_interval(secs => stale_seconds))
+        order by created_at
+        limit max_rows
+        for update skip locked
+    )
+    returning d.*;
+$$;
+
+revoke execute on function public.claim_mail_deliveries(text, integer, integer) from public;
+grant execute on function public.claim_mail_deliveries(text, integer, integer) to service_role;
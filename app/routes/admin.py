@@ -1,12 +1,41 @@
-import csv
-import io
-from fastapi import APIRouter, HTTPException, Header, Request, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Header, Query, Request, BackgroundTasks
+import asyncio
+from datetime import date, timedelta
+import tempfile
 from typing import Optional
-from fastapi.responses import RedirectResponse, StreamingResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse, StreamingResponse
 from app.config import settings
-from app.supabase_db import get_supabase_client, get_competitor_queries, get_feedback_stats, get_feedback_counts, export_feedback_data
-from app.utils.email import send_onboarding_email
+from app.supabase_db import (
+    get_supabase_client,
+    get_clinic_by_public_id,
+    mark_onboarding_email_sent,
+    upsert_clinics,
+    list_clinics,
+    list_competitor_queries,
+    list_feedback,
+    get_feedback_counts,
+    get_feedback_counts_raw,
+    iter_feedback_export,
+    iter_conversation_export,
+)
+from app.services.export_service import (
+    COLUMNAR_FORMATS,
+    EXPORT_FORMATS,
+    conversation_source_fields,
+    resolve_conversation_columns,
+    stream_conversation_export,
+    stream_feedback_export,
+)
+from app.services import clinic_cache, knowledge
+from app.static_assets import versioned_widget_src
+from app.services.clinic_import import IMPORT_FORMATS, import_clinics
+from app.services.mailer import mail_queue
+from app.utils.email import queue_onboarding_email, send_onboarding_email
+from app.utils.ndjson import ndjson_line
+from app.utils.pagination import decode_cursor, encode_cursor, parse_fields
 from app.services.summary_service import send_weekly_summary_email
+from app.services import retention_service
+from app.services.retention_service import RETENTION_MODES, run_retention
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -14,8 +43,45 @@ def require_api_key(x_api_key: str = Header(default="")):
     if x_api_key != settings.api_key:
         raise HTTPException(status_code=401, detail="Invalid API key")
     
+def _embed_snippet(clinic_id: str) -> Optional[str]:
+    api_base = (settings.public_api_base or "").rstrip("/")
+    widget_src = (settings.public_widget_src or "").rstrip("/")
+    if not api_base or not widget_src:
+        return None
+    widget_src = versioned_widget_src(widget_src)
+    return f"""<script
+        src="{widget_src}"
+        data-clinic="{clinic_id}"
+        data-api="{api_base}"
+        ></script>"""
+
+# Marks the clinic once its onboarding email ("onboarding:<clinic_id>") is sent,
+# including when another worker recovered the delivery from mail_deliveries.
+mail_queue.register_sent_hook("onboarding", mark_onboarding_email_sent)
+
+def _send_onboarding_and_mark(clinic_id: str, *args) -> None:
+    if send_onboarding_email(*args):
+        mark_onboarding_email_sent(clinic_id)
+
+def _queue_onboarding(clinic_id: str, payload: dict, saved: list, snippet: Optional[str], bg: BackgroundTasks) -> dict:
+    """Hand the onboarding email to the mail queue; never blocks on SMTP."""
+    contact_email = payload.get('contact_email') or payload.get('email')
+    if not snippet or not contact_email:
+        return {"delivery_id": None, "status": "skipped"}
+    if any(row.get("onboarding_email_sent_at") for row in saved or []):
+        return {"delivery_id": None, "status": "already_sent"}
+
+    args = (contact_email, payload.get('clinic_name'), snippet, payload.get('logo_url'), payload.get('preview_text'))
+    delivery_id = queue_onboarding_email(clinic_id, *args)
+    if delivery_id:
+        return {"delivery_id": delivery_id, "status": mail_queue.delivery(delivery_id)["status"]}
+
+    # Queue not running (no SMTP configured at startup) or full: send after the response.
+    bg.add_task(_send_onboarding_and_mark, clinic_id, *args)
+    return {"delivery_id": None, "status": "background"}
+
 @router.put("/clinics")
-def upsert_clinic(payload: dict, x_api_key: str = Header(default="")):
+def upsert_clinic(payload: dict, bg: BackgroundTasks, x_api_key: str = Header(default="")):
     require_api_key(x_api_key)
 
     clinic_id = (payload.get("clinic_id") or "").strip()
@@ -29,97 +95,311 @@ def upsert_clinic(payload: dict, x_api_key: str = Header(default="")):
         .upsert(payload, on_conflict="clinic_id")
         .execute()
     )
-    
 
-    api_base = (settings.public_api_base or "").rstrip("/")
-    widget_src = (settings.public_widget_src or "").rstrip("/")
+    clinic_cache.prime(res.data or [])
 
-    if not api_base or not widget_src:
-        snippet = None
-    else:
-        snippet = f"""<script
-        src="{widget_src}"
-        data-clinic="{clinic_id}"
-        data-api="{api_base}"
-        ></script>"""
-        # send onboarding email (async trigger not required here)
-        contact_email = payload.get('contact_email') or payload.get('email')
-        if contact_email:
-            try:
-                send_onboarding_email(contact_email, payload.get('clinic_name'), snippet, payload.get('logo_url'), payload.get('preview_text'))
-            except Exception:
-                pass
+    snippet = _embed_snippet(clinic_id)
+    return {
+        "ok": True,
+        "clinic_id": clinic_id,
+        "embed_snippet": snippet,
+        "saved": res.data,
+        "onboarding_email": _queue_onboarding(clinic_id, payload, res.data, snippet, bg),
+    }
+
+IMPORT_SPOOL_BYTES = 4 * 1024 * 1024
+
+@router.post("/clinics/import")
+async def import_clinics_bulk(
+    request: Request,
+    bg: BackgroundTasks,
+    fmt: Optional[str] = Query(default=None, alias="format"),
+    batch_size: Optional[int] = Query(default=None, ge=1, le=500),
+    send_onboarding: bool = False,
+    x_api_key: str = Header(default="")
+):
+    """Bulk upsert clinics from an NDJSON or CSV body, streaming per-row results as NDJSON.
 
+    Rows are validated against ClinicProfile as they arrive and written in
+    multi-row upserts; saved clinics are primed into the clinic/prompt cache.
+    """
+    require_api_key(x_api_key)
+    if fmt is None:
+        fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    if fmt not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(IMPORT_FORMATS)}")
+
+    def after_upsert(saved: list) -> dict:
+        clinic_cache.prime(saved)
+        if not send_onboarding:
+            return {}
         return {
-            "ok": True,
-            "clinic_id": clinic_id,
-            "embed_snippet": snippet,
-            "saved": res.data,
+            row["clinic_id"]: {
+                "onboarding_email": _queue_onboarding(row["clinic_id"], row, [row], _embed_snippet(row["clinic_id"]), bg)
+            }
+            for row in saved
         }
+
+    # The body is spooled (to disk past IMPORT_SPOOL_BYTES) before the response
+    # starts: once a StreamingResponse is running, Starlette's disconnect listener
+    # owns `receive` and the request body can no longer be read.
+    spool = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+
+    async def body_chunks():
+        while chunk := spool.read(64 * 1024):
+            yield chunk
+
+    async def results():
+        try:
+            async for result in import_clinics(
+                body_chunks(), fmt, upsert_clinics, batch_size or settings.clinic_import_batch_size, after_upsert
+            ):
+                yield ndjson_line(result)
+        finally:
+            spool.close()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+def _require_clinic(clinic_id: str) -> dict:
+    try:
+        clinic = clinic_cache.get_clinic(clinic_id)
+    except Exception:
+        raise HTTPException(status_code=503, detail="Clinic lookup failed")
+    if not clinic:
+        raise HTTPException(status_code=404, detail="Clinic not found")
+    return clinic
+
+@router.get("/clinics/{clinic_id}/documents")
+def list_clinic_documents(clinic_id: str, x_api_key: str = Header(default="")):
+    """Knowledge documents indexed for a clinic."""
+    require_api_key(x_api_key)
+    return {"clinic_id": clinic_id, "documents": knowledge.list_documents(clinic_id)}
+
+@router.put("/clinics/{clinic_id}/documents/{doc_id}")
+async def upload_clinic_document(
+    clinic_id: str,
+    doc_id: str,
+    request: Request,
+    title: Optional[str] = None,
+    x_api_key: str = Header(default=""),
+):
+    """Add or replace a knowledge document (UTF-8 plain text or Markdown body) for a clinic.
+
+    The document is split into passages and added to the clinic's retrieval
+    index; chat answers then draw on the passages matching each message.
+    """
+    require_api_key(x_api_key)
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > settings.knowledge_max_document_bytes:
+            raise HTTPException(status_code=413, detail=f"Document larger than {settings.knowledge_max_document_bytes} bytes")
+    try:
+        text = body.decode("utf-8")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Document must be UTF-8 text")
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="Empty document")
+    await asyncio.to_thread(_require_clinic, clinic_id)
+
+    result = await asyncio.to_thread(knowledge.add_document, clinic_id, doc_id, title or doc_id, text)
+    return {"ok": True, "clinic_id": clinic_id, **result}
+
+@router.delete("/clinics/{clinic_id}/documents/{doc_id}")
+def delete_clinic_document(clinic_id: str, doc_id: str, x_api_key: str = Header(default="")):
+    require_api_key(x_api_key)
+    if not knowledge.delete_document(clinic_id, doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"ok": True}
+
+@router.get("/mail/{delivery_id}")
+def get_mail_delivery(delivery_id: str, x_api_key: str = Header(default="")):
+    """Poll a queued email's delivery status (queued, sending, retrying, sent, failed)."""
+    require_api_key(x_api_key)
+    delivery = mail_queue.delivery(delivery_id)
+    if not delivery:
+        raise HTTPException(status_code=404, detail="Unknown delivery id")
+    delivery.pop("key", None)
+    return delivery
     
+CLINIC_FIELDS = [
+    "id", "clinic_id", "clinic_name", "status", "plan", "created_at", "location", "opening_hours",
+    "booking_url", "contact_phone", "contact_email", "languages", "services", "retention_days",
+]
+CLINIC_DEFAULT_FIELDS = ["clinic_id", "clinic_name", "status", "plan", "created_at"]
+COMPETITOR_QUERY_FIELDS = ["id", "clinic_id", "session_id", "query", "detected_keyword", "created_at", "clinics"]
+FEEDBACK_FIELDS = ["id", "clinic_id", "session_id", "rating", "comment", "created_at", "clinics"]
+
+# Listing rows come straight from PostgREST and are already JSON-native, so the
+# listings return ORJSONResponse directly and skip FastAPI's jsonable_encoder pass.
+
+def _page_args(cursor: Optional[str], fields: Optional[str], allowed: list, default: list):
+    """Decode the cursor and projection query params, mapping bad input to 400."""
+    try:
+        return decode_cursor(cursor), parse_fields(fields, allowed, default)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/clinics")
-def list_clinics(x_api_key: str = Header(default="")):
+def list_clinics_page(
+    limit: int = Query(default=100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    clinic_id: Optional[str] = None,
+    plan: Optional[str] = None,
+    status: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    x_api_key: str = Header(default="")
+):
     require_api_key(x_api_key)
-    sb = get_supabase_client()
-    res = sb.table("clinics").select("clinic_id,clinic_name,status,plan,created_at").order("created_at", desc=True).limit(100).execute()
-    return {"clinics": res.data or []}
+    after, selected = _page_args(cursor, fields, CLINIC_FIELDS, CLINIC_DEFAULT_FIELDS)
+    rows, next_cursor = list_clinics(selected, after, limit, clinic_id, plan, status, start_date, end_date)
+    return ORJSONResponse({"clinics": rows, "next_cursor": encode_cursor(next_cursor)})
 
 @router.get("/competitor-queries")
-def list_competitor_queries(limit: int = 50, x_api_key: str = Header(default="")):
+def list_competitor_queries_page(
+    limit: int = Query(default=50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    clinic_id: Optional[str] = None,
+    plan: Optional[str] = None,
+    status: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    x_api_key: str = Header(default="")
+):
     require_api_key(x_api_key)
-    return {"queries": get_competitor_queries(limit)}
+    after, selected = _page_args(cursor, fields, COMPETITOR_QUERY_FIELDS, COMPETITOR_QUERY_FIELDS)
+    rows, next_cursor = list_competitor_queries(selected, after, limit, clinic_id, plan, status, start_date, end_date)
+    return ORJSONResponse({"queries": rows, "next_cursor": encode_cursor(next_cursor)})
 
 @router.get("/feedback-stats")
-def list_feedback_stats(limit: int = 100, x_api_key: str = Header(default="")):
+def list_feedback_stats(
+    limit: int = Query(default=100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    clinic_id: Optional[str] = None,
+    plan: Optional[str] = None,
+    status: Optional[str] = None,
+    rating: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    x_api_key: str = Header(default="")
+):
     require_api_key(x_api_key)
-    return {"feedback": get_feedback_stats(limit)}
+    after, selected = _page_args(cursor, fields, FEEDBACK_FIELDS, FEEDBACK_FIELDS)
+    rows, next_cursor = list_feedback(selected, after, limit, clinic_id, plan, status, start_date, end_date, rating)
+    return ORJSONResponse({"feedback": rows, "next_cursor": encode_cursor(next_cursor)})
 
 @router.get("/feedback-counts")
 def list_feedback_counts(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    source: str = "rollup",
+    x_api_key: str = Header(default="")
+):
+    """Per-clinic feedback counts.
+
+    The rollup counts whole UTC days from start_date's day up to but excluding
+    end_date's day; `source=raw` filters created_at by the exact timestamps.
+    """
+    require_api_key(x_api_key)
+    if source not in ("rollup", "raw"):
+        raise HTTPException(status_code=400, detail="source must be 'rollup' or 'raw'")
+    fetch = get_feedback_counts_raw if source == "raw" else get_feedback_counts
+    return ORJSONResponse({"counts": fetch(start_date, end_date), "source": source})
+
+@router.get("/feedback-counts/reconcile")
+def reconcile_feedback_counts(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
     x_api_key: str = Header(default="")
 ):
+    """Compare the daily rollup against a raw chat_feedback scan over whole UTC days."""
     require_api_key(x_api_key)
-    return {"counts": get_feedback_counts(start_date, end_date)}
+
+    raw_start = f"{start_date.isoformat()}T00:00:00+00:00" if start_date else None
+    raw_end = f"{end_date.isoformat()}T23:59:59.999999+00:00" if end_date else None
+    # The rollup's end bound is exclusive: stop at the start of the day after end_date.
+    rollup_end = f"{(end_date + timedelta(days=1)).isoformat()}T00:00:00+00:00" if end_date else None
+    rollup = {r.get("clinic_id"): r for r in get_feedback_counts(raw_start, rollup_end)}
+    raw = {r.get("clinic_id"): r for r in get_feedback_counts_raw(raw_start, raw_end) if r.get("clinic_id")}
+
+    mismatches = []
+    for clinic_uuid in sorted(set(rollup) | set(raw), key=str):
+        expected = raw.get(clinic_uuid) or {}
+        actual = rollup.get(clinic_uuid) or {}
+        if any((expected.get(k) or 0) != (actual.get(k) or 0) for k in ("up", "down", "total")):
+            mismatches.append({
+                "clinic_id": clinic_uuid,
+                "clinic_name": expected.get("clinic_name") or actual.get("clinic_name"),
+                "raw": {k: expected.get(k, 0) for k in ("up", "down", "total")},
+                "rollup": {k: actual.get(k, 0) for k in ("up", "down", "total")},
+            })
+
+    return {"ok": not mismatches, "clinics_checked": len(set(rollup) | set(raw)), "mismatches": mismatches}
 
 @router.get("/feedback/export")
 def export_feedback_csv(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    fmt: str = Query(default="csv", alias="format"),
+    gzip: bool = False,
     x_api_key: str = Header(default="")
 ):
     require_api_key(x_api_key)
-    
-    data = export_feedback_data(start_date, end_date)
-    
-    # Create CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header
-    writer.writerow(["Date", "Clinic Name", "Clinic ID", "Session ID", "Rating", "Comment"])
-    
-    for row in data:
-        clinic = row.get("clinics") or {}
-        # Handle case where clinic might be None or empty if join failed
-        c_name = clinic.get("clinic_name", "Unknown") if isinstance(clinic, dict) else "Unknown"
-        
-        writer.writerow([
-            row.get("created_at"),
-            c_name,
-            row.get("clinic_id"),
-            row.get("session_id"),
-            row.get("rating"),
-            row.get("comment") or ""
-        ])
-        
-    output.seek(0)
-    
+
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+
+    # Pages are fetched lazily while the response streams, so there is no row cap
+    # and only one page is held in memory at a time.
+    pages = iter_feedback_export(start_date, end_date)
+    body, media_type, filename = stream_feedback_export(pages, fmt, compress=gzip)
+
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@router.get("/conversations/export")
+def export_conversations(
+    clinic_id: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    fmt: str = Query(default="arrow", alias="format"),
+    columns: Optional[str] = None,
+    x_api_key: str = Header(default="")
+):
+    require_api_key(x_api_key)
+
+    if fmt not in COLUMNAR_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(COLUMNAR_FORMATS)}")
+    try:
+        selected = resolve_conversation_columns(columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    clinic = get_clinic_by_public_id(clinic_id)
+    if not clinic:
+        raise HTTPException(status_code=404, detail="Clinic not found")
+
+    message_fields, session_fields = conversation_source_fields(selected)
+    pages = iter_conversation_export(clinic["id"], message_fields, session_fields, start_date, end_date)
+    try:
+        body, media_type, filename = stream_conversation_export(pages, selected, fmt)
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
     return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=feedback_export.csv"}
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={clinic_id}_{filename}"}
     )
 
 @router.get('/ui')
@@ -137,3 +417,27 @@ def trigger_weekly_summary(background_tasks: BackgroundTasks, x_api_key: str = H
         
     background_tasks.add_task(send_weekly_summary_email, target_email)
     return {"ok": True, "message": "Weekly summary task triggered"}
+
+@router.post("/cron/retention")
+def trigger_retention(
+    background_tasks: BackgroundTasks,
+    mode: str = "archive",
+    dry_run: bool = False,
+    wait: bool = False,
+    x_api_key: str = Header(default="")
+):
+    """Run the chat message retention job; `wait=true` runs inline and returns the report."""
+    require_api_key(x_api_key)
+    if mode not in RETENTION_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(RETENTION_MODES)}")
+
+    if wait:
+        return {"ok": True, "report": run_retention(mode=mode, dry_run=dry_run)}
+
+    background_tasks.add_task(run_retention, mode=mode, dry_run=dry_run)
+    return {"ok": True, "message": "Retention task triggered"}
+
+@router.get("/cron/retention")
+def last_retention_report(x_api_key: str = Header(default="")):
+    require_api_key(x_api_key)
+    return {"report": retention_service.LAST_REPORT}
@@ -1,19 +1,22 @@
+import logging
 from fastapi import APIRouter, HTTPException, Request, BackgroundTasks
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from typing import Dict, Any
-import json
 from uuid import uuid4
 import time
 
 from app.models import ChatRequest, ChatResponse, FeedbackRequest
-from app.prompts import get_system_prompt
+from app.services import clinic_cache, knowledge, model_tier
 from app.services.llm import chat_completion, chat_completion_stream
 from app.services.guardrails import is_emergency, is_symptom_or_diagnosis_request
 from app.utils.rate_limit import limit
 from app.utils.privacy import hash_ip
+from app.utils.ndjson import ndjson_line
+from app.utils.deadline import Deadline, DeadlineExceeded
 from app.config import settings
+from app.logging_config import bind_clinic
+from app.metrics import count_fallback, count_guardrail, record_stage, stage
 from app.supabase_db import (
-    get_clinic_by_public_id,
     get_or_create_session,
     insert_message,
     fetch_recent_messages,
@@ -22,6 +25,8 @@ from app.supabase_db import (
     insert_feedback,
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 def run_with_retry(func, *args, **kwargs):
@@ -31,14 +36,23 @@ def run_with_retry(func, *args, **kwargs):
     
     for i in range(max_retries):
         try:
-            return func(*args, **kwargs)
+            with stage("background_write"):
+                return func(*args, **kwargs)
         except Exception as e:
             if i == max_retries - 1:
-                print(f"Background task failed after {max_retries} attempts: {e}")
+                logger.error("Background task failed", extra={"task": getattr(func, "__name__", str(func)), "attempts": max_retries, "error": str(e)})
                 return
             time.sleep(delay)
             delay *= 2
 
+def deadline_reply(clinic: dict) -> str:
+    """Sent instead of an LLM answer that did not arrive before the request deadline."""
+    contact = clinic.get("contact_phone") or clinic.get("contact_email")
+    return (
+        "Sorry, this is taking longer than it should. Please try again in a moment"
+        + (f" or contact us at {contact}." if contact else ".")
+    )
+
 # Fallback clinic data for demo/testing
 DEMO_CLINICS = {
     "lemon-main": {
@@ -151,28 +165,37 @@ DEMO_CLINICS = {
 @router.post("", response_model=ChatResponse)
 async def chat(req: ChatRequest, request: Request, background_tasks: BackgroundTasks, stream: bool = False):
     limit(request, max_per_minute=90)
+    # Every stage below runs within this budget; the LLM gets what is left
+    deadline = Deadline(settings.chat_deadline_seconds)
 
     # Try Supabase first, then fallback to demo data
     clinic = None
-    try:
-        clinic = get_clinic_by_public_id(req.clinic_id)
-    except Exception as e:
-        # Supabase not configured or connection failed - use demo data
-        print(f"Supabase lookup failed: {e}")
-    
-    # If not in Supabase, try demo clinics (for backward compatibility)
-    if not clinic and req.clinic_id in DEMO_CLINICS:
-        clinic = DEMO_CLINICS[req.clinic_id]
-    
-    if not clinic:
-        raise HTTPException(status_code=404, detail="Clinic not found")
-
-    system = get_system_prompt(clinic)
-
-    # --- DEBUG LOGGING ---
-    print(f"[CHAT_DEBUG] Clinic ID: {req.clinic_id}, Clinic Name: {clinic.get('clinic_name')}")
-    print(f"[CHAT_DEBUG] Generated System Prompt: {system[:300]}...") # Log first 300 chars
-    # ---------------------
+    with stage("clinic_lookup"):
+        try:
+            if clinic_cache.is_cached(req.clinic_id):
+                clinic = clinic_cache.get_clinic(req.clinic_id)
+            else:
+                clinic = await deadline.run("clinic_lookup", clinic_cache.get_clinic, req.clinic_id)
+        except DeadlineExceeded:
+            if req.clinic_id not in DEMO_CLINICS:
+                raise HTTPException(status_code=504, detail="Clinic lookup timed out")
+        except Exception as e:
+            # Supabase not configured or connection failed - use demo data
+            count_fallback(None, "clinic_lookup_error")
+            logger.warning("Supabase clinic lookup failed", extra={"error": str(e)})
+        
+        # If not in Supabase, try demo clinics (for backward compatibility)
+        if not clinic and req.clinic_id in DEMO_CLINICS:
+            clinic = DEMO_CLINICS[req.clinic_id]
+            count_fallback(req.clinic_id, "demo_clinic")
+        
+        if not clinic:
+            raise HTTPException(status_code=404, detail="Clinic not found")
+
+        system = clinic_cache.get_prompt(clinic)
+
+    bind_clinic(req.clinic_id)
+    logger.debug("Chat request", extra={"clinic_name": clinic.get("clinic_name"), "prompt_head": system[:300]})
 
     session_id = req.session_id or str(uuid4())
 
@@ -195,17 +218,22 @@ async def chat(req: ChatRequest, request: Request, background_tasks: BackgroundT
     # Try to use Supabase session management if clinic is in database
     if is_real_clinic and isinstance(clinic_db_id, str):
         try:
-            session = get_or_create_session(
-                clinic_uuid=clinic_db_id,
-                session_key=session_id,
-                user_locale=req.locale_hint,
-                page_url=page_url,
-                user_agent=user_agent,
-                ip_hash=ip_h,
-            )
+            with stage("session_resolution"):
+                session = await deadline.run(
+                    "session_resolution",
+                    get_or_create_session,
+                    clinic_uuid=clinic_db_id,
+                    session_key=session_id,
+                    user_locale=req.locale_hint,
+                    page_url=page_url,
+                    user_agent=user_agent,
+                    ip_hash=ip_h,
+                    reserve=settings.chat_min_llm_seconds,
+                )
         except Exception as e:
             # Fallback if Supabase fails
-            print(f"Warning: Supabase session creation failed: {e}. Using in-memory fallback.")
+            count_fallback(req.clinic_id, "session")
+            logger.warning("Supabase session creation failed; using in-memory session", extra={"error": str(e)})
             session = {"id": session_id, "session_key": session_id}
     else:
         # For demo clinics, use in-memory session
@@ -218,11 +246,22 @@ async def chat(req: ChatRequest, request: Request, background_tasks: BackgroundT
 
     # --- GUARDRAILS (Medical Only) ---
     # Determine if this is a medical context to avoid triggering medical warnings for retail/real estate
-    name_lower = clinic.get("clinic_name", "").lower()
-    is_medical_context = any(x in name_lower for x in ['dental', 'smile', 'ortho', 'tooth', 'dentist', 'medical', 'doctor', 'clinic', 'beauty', 'aesthetic', 'skin', 'derma'])
+    with stage("guardrails"):
+        name_lower = clinic.get("clinic_name", "").lower()
+        is_medical_context = any(x in name_lower for x in ['dental', 'smile', 'ortho', 'tooth', 'dentist', 'medical', 'doctor', 'clinic', 'beauty', 'aesthetic', 'skin', 'derma'])
+        # Prevent discussion of competitors.
+        competitor_keywords = ["competitor", "other clinic", "other dentist", "other agency", "compare you to"]
+        if is_medical_context and is_emergency(user_text):
+            guardrail = "emergency"
+        elif is_medical_context and is_symptom_or_diagnosis_request(user_text):
+            guardrail = "medical_advice"
+        else:
+            matched_keyword = next((x for x in competitor_keywords if x in user_text.lower()), None)
+            guardrail = "competitor" if matched_keyword else "pass"
+    count_guardrail(req.clinic_id, guardrail)
 
     if is_medical_context:
-        if is_emergency(user_text):
+        if guardrail == "emergency":
             reply = (
                 f"{clinic.get('emergency_instructions')}\n\n"
                 f"If you cannot reach the clinic quickly, seek urgent medical care.\n\n"
@@ -232,7 +271,7 @@ async def chat(req: ChatRequest, request: Request, background_tasks: BackgroundT
                 background_tasks.add_task(run_with_retry, insert_message, session["id"], "assistant", reply)
             return ChatResponse(reply=reply, session_id=session_id, handoff=True, handoff_reason="emergency")
 
-        if is_symptom_or_diagnosis_request(user_text):
+        if guardrail == "medical_advice":
             reply = (
                 f"I can't provide medical advice or diagnose symptoms. "
                 f"The safest step is to book an appointment so a clinician can assess you.\n\n"
@@ -245,11 +284,7 @@ async def chat(req: ChatRequest, request: Request, background_tasks: BackgroundT
             return ChatResponse(reply=reply, session_id=session_id, handoff=True, handoff_reason="medical_advice_request")
 
     # --- GUARDRAILS (Competitors) ---
-    # Prevent discussion of competitors.
-    competitor_keywords = ["competitor", "other clinic", "other dentist", "other agency", "compare you to"]
-    matched_keyword = next((x for x in competitor_keywords if x in user_text.lower()), None)
-
-    if matched_keyword:
+    if guardrail == "competitor":
         reply = (
             f"I can only provide information about {clinic.get('clinic_name')}. "
             f"If you have questions about our services, prices, or availability, feel free to ask!"
@@ -260,21 +295,61 @@ async def chat(req: ChatRequest, request: Request, background_tasks: BackgroundT
         return ChatResponse(reply=reply, session_id=session_id, handoff=False)
 
     # ✅ memory: last N messages
+    history_depth = 0
     if is_real_clinic:
         try:
-            history = fetch_recent_messages(session["id"], limit=settings.chat_memory_messages)
+            with stage("history_fetch"):
+                history = await deadline.run(
+                    "history_fetch",
+                    fetch_recent_messages,
+                    session["id"],
+                    limit=settings.chat_memory_messages,
+                    reserve=settings.chat_min_llm_seconds,
+                )
             llm_messages = [m for m in history if m["role"] in ("user", "assistant")]
+            history_depth = len(llm_messages)
+        except DeadlineExceeded:
+            # History is optional: answer from the current message and leave the time to the LLM
+            count_fallback(req.clinic_id, "history_deadline")
+            llm_messages = [{"role": "user", "content": user_text}]
         except Exception as e:
             # Fallback if Supabase fails
-            print(f"Warning: Supabase fetch failed: {e}")
+            count_fallback(req.clinic_id, "history")
+            logger.warning("Supabase history fetch failed", extra={"error": str(e)})
             llm_messages = [{"role": "user", "content": user_text}]
     else:
         # For demo clinics, just use current message
         llm_messages = [{"role": "user", "content": user_text}]
 
+    # Clinic documents: only the passages matching this message, within the token budget.
+    # Appended after the fixed prompt so the per-clinic prefix stays the same across turns.
+    # In a thread: the first lookup after a (re)upload loads and rebuilds the whole index.
+    try:
+        with stage("knowledge_retrieval"):
+            passages = await deadline.run(
+                "knowledge_retrieval",
+                knowledge.retrieve,
+                req.clinic_id,
+                user_text,
+                reserve=settings.chat_min_llm_seconds,
+            )
+        system += knowledge.context_block(passages)
+    except DeadlineExceeded:
+        # Documents are optional too; the load carries on in its thread for the next request
+        count_fallback(req.clinic_id, "knowledge_deadline")
+    except Exception as e:
+        count_fallback(req.clinic_id, "knowledge")
+        logger.warning("Knowledge retrieval failed", extra={"error": str(e)})
+
+    # Simple turns go to the fast model (per-plan policy); the choice is logged for tuning
+    tier = model_tier.choose(clinic, user_text, history_depth, session_id=session_id)
+
     if not stream:
         try:
-            llm_reply = await chat_completion(system=system, messages=llm_messages)
+            with stage("llm_total"):
+                llm_reply = await deadline.wait("llm_total", chat_completion(system=system, messages=llm_messages, model=tier["model"]))
+        except DeadlineExceeded:
+            llm_reply = deadline_reply(clinic)
         except Exception as e:
             raise HTTPException(status_code=502, detail=f"LLM error: {str(e)}")
 
@@ -287,12 +362,24 @@ async def chat(req: ChatRequest, request: Request, background_tasks: BackgroundT
     # Streaming path (NDJSON lines). Each yielded line is a JSON object.
     async def event_stream():
         parts = []
+        timed_out = False
+        llm_start = time.perf_counter()
         try:
-            async for chunk in chat_completion_stream(system=system, messages=llm_messages):
-                parts.append(chunk)
-                obj = {"text": chunk}
-                yield (json.dumps(obj) + "\n").encode()
-
+            try:
+                async for chunk in deadline.iterate("llm_total", chat_completion_stream(system=system, messages=llm_messages, model=tier["model"])):
+                    if not parts:
+                        record_stage("llm_ttft", time.perf_counter() - llm_start)
+                    parts.append(chunk)
+                    obj = {"text": chunk}
+                    yield ndjson_line(obj)
+            except DeadlineExceeded:
+                # Out of time: end the answer here (or apologise if nothing was sent yet)
+                timed_out = True
+                if not parts:
+                    parts.append(deadline_reply(clinic))
+                    yield ndjson_line({"text": parts[0]})
+
+            record_stage("llm_total", time.perf_counter() - llm_start)
             full = "".join(parts)
             # log the finished assistant message
             if is_real_clinic:
@@ -300,12 +387,14 @@ async def chat(req: ChatRequest, request: Request, background_tasks: BackgroundT
 
             # final metadata line
             meta: Dict[str, Any] = {"done": True}
+            if timed_out:
+                meta["timed_out"] = True
             if clinic.get("booking_url"):
                 meta["booking_url"] = clinic.get("booking_url")
-            yield (json.dumps(meta) + "\n").encode()
+            yield ndjson_line(meta)
         except Exception as e:
             # send an error line for the client to consume
-            yield (json.dumps({"error": str(e)}) + "\n").encode()
+            yield ndjson_line({"error": str(e)})
 
     return StreamingResponse(event_stream(), media_type="application/x-ndjson")
 
@@ -315,7 +404,7 @@ async def get_history(clinic_id: str, session_id: str):
     # Try Supabase first
     clinic = None
     try:
-        clinic = get_clinic_by_public_id(clinic_id)
+        clinic = clinic_cache.get_clinic(clinic_id)
     except Exception:
         pass
     
@@ -338,9 +427,9 @@ async def get_history(clinic_id: str, session_id: str):
             ip_hash=None,
         )
         messages = fetch_recent_messages(session["id"], limit=50)
-        return {"history": messages}
+        return ORJSONResponse({"history": messages})
     except Exception as e:
-        print(f"Error fetching history: {e}")
+        logger.warning("Error fetching history", extra={"error": str(e)})
         return {"history": []}
 
 @router.delete("/history")
@@ -349,7 +438,7 @@ async def clear_history(clinic_id: str, session_id: str):
     # Try Supabase first
     clinic = None
     try:
-        clinic = get_clinic_by_public_id(clinic_id)
+        clinic = clinic_cache.get_clinic(clinic_id)
     except Exception:
         pass
     
@@ -374,16 +463,17 @@ async def clear_history(clinic_id: str, session_id: str):
         delete_session_messages(session["id"])
         return {"ok": True}
     except Exception as e:
-        print(f"Error clearing history: {e}")
+        logger.error("Error clearing history", extra={"error": str(e)})
         raise HTTPException(status_code=500, detail="Failed to clear history")
 
 @router.post("/feedback")
 async def submit_feedback(req: FeedbackRequest, background_tasks: BackgroundTasks):
     """Submit user feedback (thumbs up/down) for a chat session."""
+    model_tier.record_feedback(req.session_id, req.rating)
     # Try Supabase first
     clinic = None
     try:
-        clinic = get_clinic_by_public_id(req.clinic_id)
+        clinic = clinic_cache.get_clinic(req.clinic_id)
     except Exception:
         pass
     
@@ -407,7 +497,7 @@ async def submit_feedback(req: FeedbackRequest, background_tasks: BackgroundTask
         )
         background_tasks.add_task(run_with_retry, insert_feedback, clinic["id"], session["id"], req.rating, req.comment)
     except Exception as e:
-        print(f"Error submitting feedback: {e}")
+        logger.warning("Error submitting feedback", extra={"error": str(e)})
         # We don't raise 500 here to avoid breaking the client UI for a non-critical error
     
     return {"ok": True}
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from app.security import require_api_key
 from app.models import ClinicProfile
-from app.supabase_db import get_clinic_by_public_id, get_supabase_client
+from app.supabase_db import get_clinic_by_public_id, get_supabase_client, list_clinics
+from app.utils.pagination import decode_cursor, encode_cursor
 
 router = APIRouter(prefix="/clinics", tags=["clinics"])
 
@@ -24,11 +27,11 @@ def read_clinic(clinic_id: str):
 
 
 @router.get("/debug/ids", dependencies=[Depends(require_api_key)])
-def list_clinic_ids():
-    """List all clinic IDs (debug endpoint)."""
-    sb = get_supabase_client()
-    res = sb.table("clinics").select("clinic_id, clinic_name").execute()
-    return {"clinic_ids": [c["clinic_id"] for c in res.data or []]}
-
-
-
+def list_clinic_ids(limit: int = Query(default=500, ge=1, le=1000), cursor: Optional[str] = None):
+    """List clinic IDs, one keyset page at a time (debug endpoint)."""
+    try:
+        after = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows, next_cursor = list_clinics(["clinic_id"], after, limit)
+    return {"clinic_ids": [c["clinic_id"] for c in rows], "next_cursor": encode_cursor(next_cursor)}
@@ -1,10 +1,17 @@
+import logging
+import time
 from typing import Optional
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Header, Request
+from fastapi.concurrency import run_in_threadpool
 from app.models import LeadRequest, LeadResponse
 from app.supabase_db import get_clinic_by_public_id, create_lead, get_or_create_session
 from app.rate_limit import limit_leads
-from app.utils.email import send_lead_email
+from app.utils.email import queue_lead_email, send_lead_email
 from app.config import settings
+from app.metrics import LEAD_INTAKE_SECONDS, LEAD_PIPELINE_ERRORS, LEAD_PIPELINE_SECONDS, LEADS_TOTAL
+from app.services.lead_pipeline import LeadDeduper, LeadPipeline, derive_lead_key
+
+logger = logging.getLogger(__name__)
 
 # Primary router kept for backwards compatibility (/lead)
 router = APIRouter(prefix="/lead", tags=["lead"])
@@ -23,24 +30,23 @@ DEMO_CLINICS = {
     "smile-city-001": {"id": "demo-smile-city", "clinic_id": "smile-city-001", "clinic_name": "Smile City Dental"},
 }
 
-def _handle_lead(req: LeadRequest, bg: Optional[BackgroundTasks] = None):
+def _resolve_clinic(clinic_id: str) -> Optional[dict]:
     clinic = None
     try:
-        clinic = get_clinic_by_public_id(req.clinic_id)
+        clinic = get_clinic_by_public_id(clinic_id)
     except Exception as e:
         # Supabase not configured or connection failed - use demo data
-        print(f"Supabase lookup failed: {e}")
+        logger.warning("Supabase clinic lookup failed", extra={"error": str(e)})
     
     # Fallback to demo clinics if not found in Supabase
-    if not clinic and req.clinic_id in DEMO_CLINICS:
-        clinic = DEMO_CLINICS[req.clinic_id]
-    
-    if not clinic:
-        raise HTTPException(status_code=404, detail="Clinic not found")
+    if not clinic and clinic_id in DEMO_CLINICS:
+        clinic = DEMO_CLINICS[clinic_id]
+    return clinic
+
 
+def _save_lead(clinic: dict, req: LeadRequest) -> None:
     session_uuid = None
-    if req.session_id and clinic.get("id") and not clinic.get("id").startswith("demo-"):
-        # Only try Supabase session creation if it's a real clinic
+    if req.session_id:
         try:
             # Ensure session exists (minimal create; no metadata here)
             sess = get_or_create_session(
@@ -54,44 +60,106 @@ def _handle_lead(req: LeadRequest, bg: Optional[BackgroundTasks] = None):
             session_uuid = sess["id"]
         except Exception as e:
             # Fallback if Supabase fails
-            print(f"Warning: Supabase session creation failed: {e}")
-            session_uuid = None
-    
+            LEAD_PIPELINE_ERRORS.labels("session").inc()
+            logger.warning("Supabase session creation failed", extra={"error": str(e)})
+
+    create_lead(
+        clinic_uuid=clinic["id"],
+        session_uuid=session_uuid,
+        name=req.name,
+        phone=req.phone,
+        email=req.email,
+        message=req.message,
+    )
+
+
+async def _process_lead(job: dict) -> None:
+    """Persist an accepted lead and notify the clinic. Runs off the request path."""
+    start = time.perf_counter()
+    clinic, req = job["clinic"], job["lead"]
+    # Whether the lead was kept anywhere (database row or email), if anything was tried
+    attempted = kept = False
+
     # Create lead in Supabase if it's a real clinic
     if clinic.get("id") and not clinic.get("id").startswith("demo-"):
+        attempted = True
         try:
-            create_lead(
-                clinic_uuid=clinic["id"],
-                session_uuid=session_uuid,
-                name=req.name,
-                phone=req.phone,
-                email=req.email,
-                message=req.message,
-            )
+            await run_in_threadpool(_save_lead, clinic, req)
+            kept = True
         except Exception as e:
-            # Fallback if Supabase fails  
-            print(f"Warning: Supabase create_lead failed: {e}")
+            # Still notify the clinic; the email is the lead of record if the insert failed
+            LEAD_PIPELINE_ERRORS.labels("persist").inc()
+            logger.warning("Supabase create_lead failed", extra={"error": str(e)})
     
     # Send notification email to clinic contact if configured
     clinic_email = clinic.get('contact_email') or clinic.get('email') or None
-    if clinic_email and bg is not None:
+    if clinic_email:
         lead = {"name": req.name, "phone": req.phone, "email": req.email, "message": req.message, "session_id": req.session_id}
-        # use background task to avoid slowing the API
+        clinic_name = clinic.get('clinic_name') or req.clinic_id
+        # pooled mail queue (or the clinic's digest); direct send if the queue can't take it
+        attempted = True
         try:
-            bg.add_task(send_lead_email, clinic_email, clinic.get('clinic_name') or req.clinic_id, lead)
+            if queue_lead_email(clinic_email, clinic_name, lead, clinic.get('lead_digest_minutes')):
+                kept = True
+            elif await run_in_threadpool(send_lead_email, clinic_email, clinic_name, lead):
+                kept = True
+            else:
+                LEAD_PIPELINE_ERRORS.labels("notify").inc()
+                logger.warning("Lead email failed")
         except Exception as e:
-            # Fallback if email fails
-            print(f"Warning: Email task failed: {e}")
-    
-    return LeadResponse(ok=True)
+            LEAD_PIPELINE_ERRORS.labels("notify").inc()
+            logger.warning("Lead email failed", extra={"error": str(e)})
+
+    if job.get("key"):
+        if kept or not attempted:
+            await lead_dedupe.confirm(job["key"], job.get("redis"))
+        else:
+            # Neither saved nor sent: let the client's retry through instead of calling it a duplicate
+            await lead_dedupe.release(job["key"], job.get("redis"))
+    LEAD_PIPELINE_SECONDS.observe(time.perf_counter() - start)
+
+
+lead_pipeline = LeadPipeline(_process_lead)
+lead_dedupe = LeadDeduper()
+
+
+async def _handle_lead(req: LeadRequest, request: Request, bg: BackgroundTasks, idempotency_key: Optional[str] = None):
+    """Validate the clinic, drop duplicates and hand the lead to the pipeline.
+
+    The idempotency key comes from the Idempotency-Key header or the body;
+    without one it is derived from the session and a hash of the lead content.
+    """
+    start = time.perf_counter()
+    try:
+        clinic = await run_in_threadpool(_resolve_clinic, req.clinic_id)
+        if not clinic:
+            LEADS_TOTAL.labels("not_found").inc()
+            raise HTTPException(status_code=404, detail="Clinic not found")
+
+        key = idempotency_key or req.idempotency_key
+        if key:
+            key = f"{req.clinic_id}:key:{key}"
+        else:
+            key = derive_lead_key(req.clinic_id, req.session_id, {"name": req.name, "phone": req.phone, "email": req.email, "message": req.message})
+        redis = getattr(request.app.state, "redis", None)
+        if not await lead_dedupe.claim(key, redis):
+            LEADS_TOTAL.labels("duplicate").inc()
+            return LeadResponse(ok=True, duplicate=True)
 
+        job = {"clinic": clinic, "lead": req, "key": key, "redis": redis}
+        if not lead_pipeline.submit(job):
+            bg.add_task(_process_lead, job)
+        LEADS_TOTAL.labels("accepted").inc()
+        return LeadResponse(ok=True)
+    finally:
+        LEAD_INTAKE_SECONDS.observe(time.perf_counter() - start)
 
-@router.post("", response_model=LeadResponse)
-async def lead(req: LeadRequest, bg: BackgroundTasks):
-    return _handle_lead(req, bg)
 
+@router.post("", response_model=LeadResponse, dependencies=[Depends(limit_leads())])
+async def lead(req: LeadRequest, request: Request, bg: BackgroundTasks, idempotency_key: Optional[str] = Header(default=None)):
+    return await _handle_lead(req, request, bg, idempotency_key)
 
-@router2.post("", response_model=LeadResponse)
-async def lead_alias(req: LeadRequest, bg: BackgroundTasks):
-    return _handle_lead(req, bg)
 
+@router2.post("", response_model=LeadResponse, dependencies=[Depends(limit_leads())])
+async def lead_alias(req: LeadRequest, request: Request, bg: BackgroundTasks, idempotency_key: Optional[str] = Header(default=None)):
+    return await _handle_lead(req, request, bg, idempotency_key)
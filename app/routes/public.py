@@ -1,22 +1,31 @@
-from fastapi import APIRouter, HTTPException
-from app.supabase_db import get_clinic_by_public_id
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from app.config import settings
+from app.services import clinic_cache
+from app.services.clinic_cache import PUBLIC_CLINIC_FIELDS
 
 router = APIRouter(prefix="/public", tags=["public"])
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses weak comparison: W/ prefixes are ignored, * matches anything."""
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
 @router.get("/clinic/{clinic_id}")
-def public_clinic(clinic_id: str):
-    clinic = get_clinic_by_public_id(clinic_id)
-    if not clinic:
+def public_clinic(clinic_id: str, request: Request):
+    entry = clinic_cache.get_entry(clinic_id)
+    if not entry:
         raise HTTPException(status_code=404, detail="Clinic not found")
-    
-    # return only safe public fields
-    return {
-        "clinic_id": clinic["clinic_id"],
-        "clinic_name": clinic["clinic_name"],
-        "booking_url": clinic["booking_url"],
-        "contact_phone": clinic["contact_phone"],
-        "contact_email": clinic["contact_email"],
-        "opening_hours": clinic["opening_hours"],
-        "location": clinic["location"],
+
+    # Widgets fetch this on every page load; let browsers and CDNs keep it and revalidate cheaply.
+    etag = f'"{entry["public_version"]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.public_clinic_max_age}, stale-while-revalidate={settings.public_clinic_stale_seconds}",
     }
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
 
+    # return only safe public fields
+    clinic = entry["clinic"]
+    return JSONResponse({field: clinic.get(field) for field in PUBLIC_CLINIC_FIELDS}, headers=headers)
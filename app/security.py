@@ -21,3 +21,23 @@ async def require_api_key(
         detail="Invalid or missing API key",
         headers={"WWW-Authenticate": "API-Key"},
     )
+
+
+async def require_metrics_token(
+    authorization: Optional[str] = Header(default=None),
+    x_api_key: Optional[str] = Header(default=None, alias="X-API-Key", convert_underscores=False),
+):
+    """
+    Guard for the Prometheus scrape endpoint: Authorization: Bearer <METRICS_TOKEN>,
+    or the API key (as a bearer token or X-API-Key) so scrapers need no separate secret.
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    bearer = token.strip() if scheme.lower() == "bearer" else None
+    accepted = [t for t in (settings.metrics_token, settings.api_key) if t]
+    if any(t in accepted for t in (bearer, x_api_key)):
+        return True
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or missing metrics token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
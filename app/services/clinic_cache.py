@@ -0,0 +1,130 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Iterable, Optional
+
+from app.config import settings
+from app.metrics import count_cache
+from app.prompts import get_system_prompt
+from app.supabase_db import get_clinic_by_public_id
+
+# Per-process cache of clinic rows and their built system prompts, keyed by the
+# public clinic_id. Entries expire after CLINIC_CACHE_TTL_SECONDS, which bounds
+# how stale another worker's copy can be after an upsert in this one.
+
+_lock = Lock()
+_entries: "OrderedDict[str, dict]" = OrderedDict()
+_prompts: "OrderedDict[tuple, str]" = OrderedDict()
+stats = {"hits": 0, "misses": 0, "primed": 0}
+
+# Cached "not found" lookups expire sooner so new clinics show up quickly.
+NEGATIVE_TTL_SECONDS = 10
+
+# What GET /public/clinic/{id} returns; its ETag ("public_version") hashes only these.
+PUBLIC_CLINIC_FIELDS = ("clinic_id", "clinic_name", "booking_url", "contact_phone", "contact_email", "opening_hours", "location")
+
+
+def clinic_version(clinic: dict, fields: Optional[Iterable[str]] = None) -> str:
+    """Stable content hash of a clinic row, or of just `fields`; changes whenever one of them does."""
+    if fields is not None:
+        clinic = {field: clinic.get(field) for field in fields}
+    raw = json.dumps(clinic, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _store(clinic_id: str, clinic: Optional[dict], ttl: float) -> dict:
+    entry = {
+        "clinic": clinic,
+        "version": clinic_version(clinic) if clinic else None,
+        # Separate from "version" (which keys the prompt cache) so private columns
+        # changing neither shows through the public ETag nor busts browser caches.
+        "public_version": clinic_version(clinic, PUBLIC_CLINIC_FIELDS) if clinic else None,
+        "expires_at": time.monotonic() + ttl,
+    }
+    with _lock:
+        _entries[clinic_id] = entry
+        _entries.move_to_end(clinic_id)
+        while len(_entries) > settings.clinic_cache_max_entries:
+            _entries.popitem(last=False)
+    return entry
+
+
+def _fresh_entry(clinic_id: str) -> Optional[dict]:
+    with _lock:
+        entry = _entries.get(clinic_id)
+        if entry and entry["expires_at"] > time.monotonic():
+            _entries.move_to_end(clinic_id)
+            return entry
+    return None
+
+
+def get_entry(clinic_id: str) -> Optional[dict]:
+    """Cached entry for a clinic ({"clinic", "version", "public_version"}), loading it on a miss.
+
+    Lookup errors propagate and are not cached.
+    """
+    entry = _fresh_entry(clinic_id)
+    if entry:
+        stats["hits"] += 1
+        count_cache(clinic_id if entry["clinic"] else None, hit=True)
+        return entry if entry["clinic"] else None
+
+    stats["misses"] += 1
+    clinic = get_clinic_by_public_id(clinic_id)
+    count_cache(clinic_id if clinic else None, hit=False)
+    ttl = settings.clinic_cache_ttl_seconds if clinic else NEGATIVE_TTL_SECONDS
+    entry = _store(clinic_id, clinic, ttl)
+    return entry if clinic else None
+
+
+def is_cached(clinic_id: str) -> bool:
+    """Whether get_clinic(clinic_id) is answered from the cache, without a data API call."""
+    return _fresh_entry(clinic_id) is not None
+
+
+def get_clinic(clinic_id: str) -> Optional[dict]:
+    entry = get_entry(clinic_id)
+    return entry["clinic"] if entry else None
+
+
+def get_prompt(clinic: dict) -> str:
+    """System prompt for `clinic`, built once per clinic version."""
+    entry = _fresh_entry(clinic.get("clinic_id") or "")
+    version = entry["version"] if entry and entry["clinic"] is clinic else clinic_version(clinic)
+    key = (clinic.get("clinic_id"), version)
+    with _lock:
+        prompt = _prompts.get(key)
+    if prompt is None:
+        prompt = get_system_prompt(clinic)
+        with _lock:
+            _prompts[key] = prompt
+            while len(_prompts) > settings.clinic_cache_max_entries:
+                _prompts.popitem(last=False)
+    return prompt
+
+
+def prime(clinics: Iterable[dict]) -> int:
+    """Load clinic rows into the cache and build their prompts. Returns how many were primed."""
+    count = 0
+    for clinic in clinics:
+        clinic_id = clinic.get("clinic_id")
+        if not clinic_id:
+            continue
+        _store(clinic_id, clinic, settings.clinic_cache_ttl_seconds)
+        get_prompt(clinic)
+        count += 1
+    stats["primed"] += count
+    return count
+
+
+def invalidate(clinic_id: str) -> None:
+    with _lock:
+        _entries.pop(clinic_id, None)
+
+
+def clear() -> None:
+    with _lock:
+        _entries.clear()
+        _prompts.clear()
@@ -0,0 +1,175 @@
+import asyncio
+import codecs
+import csv
+import json
+from typing import AsyncIterator, Callable, Optional
+
+from pydantic import ValidationError
+
+from app.models import ClinicProfile
+
+IMPORT_FORMATS = ("ndjson", "csv")
+
+# Non-profile clinic columns an import row may also set.
+EXTRA_COLUMNS = ("plan", "status", "lead_digest_minutes", "retention_days")
+
+# CSV cells for list fields are ";"-separated ("Cleaning;Whitening"), price_ranges
+# is "name=range;name=range". A cell holding a JSON array/object is also accepted.
+_CSV_LIST_FIELDS = ("services", "insurance", "languages")
+_CSV_DICT_FIELDS = ("price_ranges",)
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buf = ""
+    async for chunk in chunks:
+        buf += decoder.decode(chunk)
+        *lines, buf = buf.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buf += decoder.decode(b"", final=True)
+    if buf:
+        yield buf.rstrip("\r")
+
+
+async def _iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, Optional[dict], Optional[str]]]:
+    line_no = 0
+    async for line in _iter_lines(chunks):
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(obj, dict):
+            yield line_no, None, "expected a JSON object"
+            continue
+        yield line_no, obj, None
+
+
+def _csv_cell(field: str, value: str):
+    value = value.strip()
+    if field in _CSV_LIST_FIELDS + _CSV_DICT_FIELDS and value[:1] in ("[", "{"):
+        return json.loads(value)
+    if field in _CSV_LIST_FIELDS:
+        return [v.strip() for v in value.split(";") if v.strip()]
+    if field in _CSV_DICT_FIELDS:
+        pairs = (item.partition("=") for item in value.split(";") if item.strip())
+        return {k.strip(): v.strip() for k, _, v in pairs}
+    return value
+
+
+async def _iter_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, Optional[dict], Optional[str]]]:
+    header: Optional[list[str]] = None
+    pending: list[str] = []
+    line_no = start = 0
+    async for line in _iter_lines(chunks):
+        line_no += 1
+        if not pending:
+            start = line_no
+        pending.append(line)
+        record = "\n".join(pending)
+        if record.count('"') % 2:
+            continue  # quoted cell spans lines
+        pending = []
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        if len(values) != len(header):
+            yield start, None, f"expected {len(header)} columns, got {len(values)}"
+            continue
+        try:
+            row = {h: _csv_cell(h, v) for h, v in zip(header, values) if v.strip()}
+        except ValueError as e:
+            yield start, None, f"invalid JSON cell: {e}"
+            continue
+        yield start, row, None
+    if pending:
+        yield start, None, "unterminated quoted cell"
+
+
+def validate_clinic_row(raw: dict) -> tuple[Optional[dict], list[str]]:
+    """Validate one import row against ClinicProfile.
+
+    Returns the row to upsert (profile fields plus any EXTRA_COLUMNS present)
+    or None with the validation errors.
+    """
+    try:
+        profile = ClinicProfile.model_validate(raw)
+    except ValidationError as e:
+        return None, [f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()]
+    row = profile.model_dump()
+    row["clinic_id"] = row["clinic_id"].strip()
+    if not row["clinic_id"]:
+        return None, ["clinic_id: must not be blank"]
+    for col in EXTRA_COLUMNS:
+        if col in raw:
+            row[col] = raw[col]
+    return row, []
+
+
+async def import_clinics(
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    upsert: Callable[[list[dict]], list[dict]],
+    batch_size: int = 100,
+    after_upsert: Optional[Callable[[list[dict]], dict]] = None,
+) -> AsyncIterator[dict]:
+    """Validate clinic rows as they stream in and upsert them in batches.
+
+    Yields one result per input row ({"line", "clinic_id", "status", ...}) as
+    soon as its batch is written, then a final {"done": True, ...} summary.
+    `upsert` is a blocking call that writes a batch and returns the saved rows;
+    it runs in a worker thread. `after_upsert(saved)` may return extra result
+    fields per clinic_id.
+
+    A batch holds rows with the same set of columns (so a bulk upsert never
+    nulls a column some rows omit) and at most one row per clinic_id.
+    """
+    records = _iter_csv(chunks) if fmt == "csv" else _iter_ndjson(chunks)
+    totals = {"upserted": 0, "invalid": 0, "failed": 0}
+    batch: list[tuple[int, dict]] = []
+    batch_ids: set[str] = set()
+
+    async def flush():
+        rows = [row for _, row in batch]
+        try:
+            saved = await asyncio.to_thread(upsert, rows)
+        except Exception as e:
+            totals["failed"] += len(batch)
+            return [{"line": n, "clinic_id": row["clinic_id"], "status": "failed", "error": str(e)} for n, row in batch]
+
+        extra = after_upsert(saved or []) if after_upsert else {}
+        totals["upserted"] += len(batch)
+        return [
+            {"line": n, "clinic_id": row["clinic_id"], "status": "upserted", **extra.get(row["clinic_id"], {})}
+            for n, row in batch
+        ]
+
+    async for line_no, raw, error in records:
+        row, errors = validate_clinic_row(raw) if raw is not None else (None, [error])
+        if row is None:
+            totals["invalid"] += 1
+            yield {"line": line_no, "clinic_id": (raw or {}).get("clinic_id"), "status": "invalid", "errors": errors}
+            continue
+
+        if batch and (
+            len(batch) >= batch_size
+            or row.keys() != batch[0][1].keys()
+            or row["clinic_id"] in batch_ids
+        ):
+            for result in await flush():
+                yield result
+            batch, batch_ids = [], set()
+        batch.append((line_no, row))
+        batch_ids.add(row["clinic_id"])
+
+    if batch:
+        for result in await flush():
+            yield result
+    yield {"done": True, **totals}
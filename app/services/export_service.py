@@ -0,0 +1,204 @@
+import csv
+import io
+import zlib
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from app.utils.ndjson import ndjson_line
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+FEEDBACK_CSV_HEADER = ["Date", "Clinic Name", "Clinic ID", "Session ID", "Rating", "Comment"]
+
+
+def _feedback_record(row: dict) -> dict:
+    clinic = row.get("clinics") or {}
+    # Handle case where clinic might be None or empty if join failed
+    c_name = clinic.get("clinic_name", "Unknown") if isinstance(clinic, dict) else "Unknown"
+    return {
+        "created_at": row.get("created_at"),
+        "clinic_name": c_name,
+        "clinic_id": row.get("clinic_id"),
+        "session_id": row.get("session_id"),
+        "rating": row.get("rating"),
+        "comment": row.get("comment") or "",
+    }
+
+
+def _csv_chunks(pages: Iterable[list[dict]]) -> Iterator[bytes]:
+    # One small buffer per page keeps memory flat regardless of export size.
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(FEEDBACK_CSV_HEADER)
+    yield buf.getvalue().encode()
+
+    for page in pages:
+        buf.seek(0)
+        buf.truncate()
+        for row in page:
+            writer.writerow(list(_feedback_record(row).values()))
+        yield buf.getvalue().encode()
+
+
+def _ndjson_chunks(pages: Iterable[list[dict]]) -> Iterator[bytes]:
+    for page in pages:
+        yield b"".join(ndjson_line(_feedback_record(row)) for row in page)
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Gzip a byte stream incrementally (gzip container, not raw deflate)."""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def stream_feedback_export(
+    pages: Iterable[list[dict]],
+    fmt: str = "csv",
+    compress: bool = False,
+) -> Tuple[Iterator[bytes], str, str]:
+    """Encode feedback pages as CSV or NDJSON, optionally gzipped.
+
+    Returns (body iterator, media type, download filename).
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    media_type, ext = EXPORT_FORMATS[fmt]
+    body = _csv_chunks(pages) if fmt == "csv" else _ndjson_chunks(pages)
+    filename = f"feedback_export.{ext}"
+    if compress:
+        return gzip_chunks(body), "application/gzip", filename + ".gz"
+    return body, media_type, filename
+
+
+# --- Columnar conversation export -------------------------------------------
+
+# output column -> (source row, source field, arrow type)
+CONVERSATION_COLUMNS = {
+    "message_id": ("message", "id", "string"),
+    "session_id": ("message", "session_id", "string"),
+    "role": ("message", "role", "string"),
+    "content": ("message", "content", "string"),
+    "created_at": ("message", "created_at", "timestamp"),
+    "session_key": ("session", "session_key", "string"),
+    "clinic_id": ("session", "clinic_id", "string"),
+    "user_locale": ("session", "user_locale", "string"),
+    "page_url": ("session", "page_url", "string"),
+    "session_created_at": ("session", "created_at", "timestamp"),
+}
+
+COLUMNAR_FORMATS = {
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def resolve_conversation_columns(columns: Optional[str]) -> List[str]:
+    """Parse a comma-separated projection; defaults to every column."""
+    if not columns:
+        return list(CONVERSATION_COLUMNS)
+    selected = [c.strip() for c in columns.split(",") if c.strip()]
+    unknown = [c for c in selected if c not in CONVERSATION_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    return selected
+
+
+def conversation_source_fields(columns: List[str]) -> Tuple[List[str], List[str]]:
+    """Split a projection into the chat_messages and chat_sessions fields it needs."""
+    message_fields = [CONVERSATION_COLUMNS[c][1] for c in columns if CONVERSATION_COLUMNS[c][0] == "message"]
+    session_fields = [CONVERSATION_COLUMNS[c][1] for c in columns if CONVERSATION_COLUMNS[c][0] == "session"]
+    return message_fields, session_fields
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to the caller on drain()."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        data = bytes(b)
+        self._chunks.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _record_batch(pa, schema, columns: List[str], page: List[dict]):
+    arrays = []
+    for name in columns:
+        source, field, kind = CONVERSATION_COLUMNS[name]
+        if source == "message":
+            values = [row.get(field) for row in page]
+        else:
+            values = [(row.get("chat_sessions") or {}).get(field) for row in page]
+        arr = pa.array(values, type=pa.string())
+        if kind == "timestamp":
+            arr = arr.cast(schema.field(name).type)
+        arrays.append(arr)
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def stream_conversation_export(
+    pages: Iterable[List[dict]],
+    columns: List[str],
+    fmt: str = "arrow",
+) -> Tuple[Iterator[bytes], str, str]:
+    """Encode conversation pages as an Arrow IPC stream or Parquet, one batch per page.
+
+    Bytes are flushed after every page, so the download grows while the export
+    runs. An Arrow IPC stream can be read batch by batch from a partial
+    download; a Parquet file only becomes readable once its footer arrives.
+
+    Raises RuntimeError if pyarrow is not installed.
+    """
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError("pyarrow is required for columnar exports") from exc
+
+    schema = pa.schema([
+        (name, pa.timestamp("us", tz="UTC") if CONVERSATION_COLUMNS[name][2] == "timestamp" else pa.string())
+        for name in columns
+    ])
+    media_type, ext = COLUMNAR_FORMATS[fmt]
+
+    def body() -> Iterator[bytes]:
+        sink = _ChunkSink()
+        if fmt == "parquet":
+            writer = pq.ParquetWriter(sink, schema, compression="zstd")
+            write = lambda batch: writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            writer = pa.ipc.new_stream(sink, schema)
+            write = writer.write_batch
+        try:
+            for page in pages:
+                write(_record_batch(pa, schema, columns, page))
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+        finally:
+            writer.close()
+        yield sink.drain()
+
+    return body(), media_type, f"conversations_export.{ext}"
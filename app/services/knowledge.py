@@ -0,0 +1,378 @@
+"""Clinic knowledge documents and a local BM25 index over them.
+
+Clinics upload FAQs, treatment descriptions and policies as plain text or
+Markdown (PUT /admin/clinics/{clinic_id}/documents/{doc_id}). Each document
+is cut into passages of about KNOWLEDGE_PASSAGE_WORDS words and added to the
+clinic's inverted index; uploading a document again replaces its passages.
+Per chat turn, `retrieve()` returns the best BM25 matches for the visitor's
+message that fit in KNOWLEDGE_TOKEN_BUDGET, and only those go into the
+prompt.
+
+Storage: one zlib-compressed file per clinic in KNOWLEDGE_DIR holding the
+passage text. Postings are not stored; they are rebuilt when a worker first
+loads the file, and updated in place on upload. Files are replaced
+atomically, and a worker reloads a clinic when its file changes, so an
+upload handled by one worker reaches the others on the same host.
+KNOWLEDGE_DIR should be on a persistent volume.
+
+Searches do not lock: writers for a clinic are serialized, update postings
+one term at a time, and swap in a fresh index when compacting.
+benchmarks/knowledge.py measures build time, query latency and memory.
+"""
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import orjson
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Rough chars-per-token for budgeting prompt text without a tokenizer.
+CHARS_PER_TOKEN = 4
+
+_TOKEN_RE = re.compile(r"\w+")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+# English and Swedish function words; they match everything and rank nothing.
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how i if in is it me my of on or our so that the
+this to us was we what when where which who will with you your
+alla att av de den det du där eller en ett från för har hur i jag kan man med men mig min mitt ni och
+om på sig som till vad var vi vår är
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens without stopwords; plural -s is folded (implants -> implant)."""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS or (len(token) < 2 and not token.isdigit()):
+            continue
+        if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _split_long(paragraph: str, max_words: int) -> List[str]:
+    pieces: List[str] = []
+    current: List[str] = []
+    for sentence in _SENTENCE_RE.split(paragraph):
+        words = sentence.split()
+        while len(words) > max_words:
+            if current:
+                pieces.append(" ".join(current))
+                current = []
+            pieces.append(" ".join(words[:max_words]))
+            words = words[max_words:]
+        if current and len(current) + len(words) > max_words:
+            pieces.append(" ".join(current))
+            current = []
+        current += words
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def split_passages(text: str, max_words: int) -> List[str]:
+    """Paragraphs merged up to about `max_words` words; longer ones are cut at sentence ends."""
+    passages: List[str] = []
+    current: List[str] = []
+    count = 0
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        n = len(paragraph.split())
+        for piece in [paragraph] if n <= max_words else _split_long(paragraph, max_words):
+            n = len(piece.split())
+            if current and count + n > max_words:
+                passages.append("\n".join(current))
+                current, count = [], 0
+            current.append(piece)
+            count += n
+    if current:
+        passages.append("\n".join(current))
+    return passages
+
+
+class KnowledgeIndex:
+    """BM25 index over one clinic's passages; documents are added and removed incrementally."""
+
+    def __init__(self) -> None:
+        self.docs: Dict[str, dict] = {}  # doc_id -> {"title", "passages": [pid], "updated_at"}
+        self.passages: List[Optional[Tuple[str, str]]] = []  # pid -> (doc_id, text); None once removed
+        self.lengths = array("I")
+        self.postings: Dict[str, Tuple[array, array]] = {}  # term -> (pids, term frequencies)
+        self.live = 0
+        self.total_length = 0
+
+    def _add_passages(self, doc_id: str, title: str, passages: List[str], updated_at: float) -> None:
+        pids = []
+        for text in passages:
+            pid = len(self.passages)
+            terms = tokenize(f"{title}\n{text}")
+            self.lengths.append(len(terms))
+            self.passages.append((doc_id, text))
+            for term, tf in Counter(terms).items():
+                entry = self.postings.get(term)
+                if entry is None:
+                    entry = self.postings[term] = (array("I"), array("H"))
+                entry[0].append(pid)
+                entry[1].append(min(tf, 0xFFFF))
+            self.total_length += len(terms)
+            self.live += 1
+            pids.append(pid)
+        self.docs[doc_id] = {"title": title, "passages": pids, "updated_at": updated_at}
+
+    def add_document(self, doc_id: str, title: str, text: str) -> int:
+        """Add or replace a document; returns its number of passages."""
+        self.remove_document(doc_id)
+        passages = split_passages(text, settings.knowledge_passage_words)
+        self._add_passages(doc_id, title, passages, time.time())
+        return len(passages)
+
+    def remove_document(self, doc_id: str) -> bool:
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return False
+        dead = set(doc["passages"])
+        terms = set()
+        for pid in dead:
+            terms.update(tokenize(f"{doc['title']}\n{self.passages[pid][1]}"))
+            self.passages[pid] = None
+            self.total_length -= self.lengths[pid]
+            self.live -= 1
+        for term in terms:
+            pids, tfs = self.postings[term]
+            keep = [i for i, pid in enumerate(pids) if pid not in dead]
+            if keep:
+                self.postings[term] = (array("I", [pids[i] for i in keep]), array("H", [tfs[i] for i in keep]))
+            else:
+                del self.postings[term]
+        return True
+
+    def needs_compaction(self) -> bool:
+        return len(self.passages) - self.live > max(64, self.live)
+
+    def compacted(self) -> "KnowledgeIndex":
+        """A new index without the removed passages' slots."""
+        index = KnowledgeIndex()
+        for doc_id, doc in self.docs.items():
+            index._add_passages(doc_id, doc["title"], [self.passages[p][1] for p in doc["passages"]], doc["updated_at"])
+        return index
+
+    def search(self, query: str, k: int) -> List[Tuple[float, int]]:
+        """Top `k` (score, passage id) pairs for `query`, best first."""
+        if not self.live:
+            return []
+        n = self.live
+        avg_length = self.total_length / n or 1.0
+        lengths = self.lengths
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            pids, tfs = entry
+            idf = math.log(1 + (n - len(pids) + 0.5) / (len(pids) + 0.5))
+            for pid, tf in zip(pids, tfs):
+                norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths[pid] / avg_length))
+                scores[pid] = scores.get(pid, 0.0) + idf * norm
+        return heapq.nlargest(k, ((score, pid) for pid, score in scores.items()))
+
+    def passage(self, pid: int) -> Optional[dict]:
+        entry = self.passages[pid]
+        if entry is None:
+            return None
+        doc = self.docs.get(entry[0])
+        return {"doc_id": entry[0], "title": doc["title"] if doc else entry[0], "text": entry[1]}
+
+    def to_bytes(self) -> bytes:
+        docs = [
+            {"id": doc_id, "title": doc["title"], "updated_at": doc["updated_at"],
+             "passages": [self.passages[p][1] for p in doc["passages"]]}
+            for doc_id, doc in self.docs.items()
+        ]
+        return zlib.compress(orjson.dumps({"version": FORMAT_VERSION, "docs": docs}), 6)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "KnowledgeIndex":
+        payload = orjson.loads(zlib.decompress(data))
+        if payload.get("version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported knowledge index version {payload.get('version')}")
+        index = cls()
+        for doc in payload["docs"]:
+            index._add_passages(doc["id"], doc["title"], doc["passages"], doc["updated_at"])
+        return index
+
+
+# clinic_id -> ((mtime_ns, size) of the file it was loaded from or saved to, index);
+# at most KNOWLEDGE_MAX_CLINICS per worker, the longest-loaded dropped first.
+_indexes: "OrderedDict[str, Tuple[Tuple[int, int], KnowledgeIndex]]" = OrderedDict()
+_locks: Dict[str, threading.RLock] = {}
+_guard = threading.Lock()
+
+
+def _lock_for(clinic_id: str) -> threading.RLock:
+    with _guard:
+        return _locks.setdefault(clinic_id, threading.RLock())
+
+
+def _path(clinic_id: str) -> str:
+    return os.path.join(settings.knowledge_dir, quote(clinic_id, safe="") + ".kb")
+
+
+def _file_key(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _remember(clinic_id: str, key: Tuple[int, int], index: KnowledgeIndex) -> None:
+    with _guard:
+        _indexes[clinic_id] = (key, index)
+        _indexes.move_to_end(clinic_id)
+        while len(_indexes) > settings.knowledge_max_clinics:
+            _indexes.popitem(last=False)
+
+
+def get_index(clinic_id: str) -> Optional[KnowledgeIndex]:
+    """The clinic's index (None without documents), loaded from disk when the file changed."""
+    key = _file_key(_path(clinic_id))
+    if key is None:
+        with _guard:
+            _indexes.pop(clinic_id, None)
+        return None
+    cached = _indexes.get(clinic_id)
+    if cached and cached[0] == key:
+        return cached[1]
+    with _lock_for(clinic_id):
+        path = _path(clinic_id)
+        key = _file_key(path)
+        if key is None:
+            return None
+        cached = _indexes.get(clinic_id)
+        if cached and cached[0] == key:
+            return cached[1]
+        start = time.perf_counter()
+        with open(path, "rb") as f:
+            index = KnowledgeIndex.from_bytes(f.read())
+        _remember(clinic_id, key, index)
+        logger.info("Knowledge index loaded", extra={
+            "clinic_id": clinic_id, "passages": index.live, "seconds": round(time.perf_counter() - start, 4),
+        })
+        return index
+
+
+def _save(clinic_id: str, index: KnowledgeIndex) -> int:
+    path = _path(clinic_id)
+    if not index.docs:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        with _guard:
+            _indexes.pop(clinic_id, None)
+        return 0
+    os.makedirs(settings.knowledge_dir, exist_ok=True)
+    data = index.to_bytes()
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    _remember(clinic_id, _file_key(path), index)
+    return len(data)
+
+
+def add_document(clinic_id: str, doc_id: str, title: str, text: str) -> dict:
+    """Index (or re-index) one document for a clinic and persist the clinic's index. Blocking."""
+    with _lock_for(clinic_id):
+        start = time.perf_counter()
+        index = get_index(clinic_id) or KnowledgeIndex()
+        passages = index.add_document(doc_id, title, text)
+        if index.needs_compaction():
+            index = index.compacted()
+        stored = _save(clinic_id, index)
+    return {
+        "doc_id": doc_id,
+        "passages": passages,
+        "documents": len(index.docs),
+        "stored_bytes": stored,
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+
+
+def delete_document(clinic_id: str, doc_id: str) -> bool:
+    with _lock_for(clinic_id):
+        index = get_index(clinic_id)
+        if index is None or not index.remove_document(doc_id):
+            return False
+        if index.needs_compaction():
+            index = index.compacted()
+        _save(clinic_id, index)
+    return True
+
+
+def list_documents(clinic_id: str) -> List[dict]:
+    index = get_index(clinic_id)
+    if index is None:
+        return []
+    return [
+        {"doc_id": doc_id, "title": doc["title"], "passages": len(doc["passages"]), "updated_at": doc["updated_at"]}
+        for doc_id, doc in index.docs.items()
+    ]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def retrieve(clinic_id: str, query: str, token_budget: Optional[int] = None, k: Optional[int] = None) -> List[dict]:
+    """Best-matching passages for `query`, best first, within `token_budget` tokens."""
+    index = get_index(clinic_id)
+    if index is None:
+        return []
+    budget = settings.knowledge_token_budget if token_budget is None else token_budget
+    picked, used = [], 0
+    for score, pid in index.search(query, k or settings.knowledge_top_k):
+        passage = index.passage(pid)
+        if passage is None:
+            continue
+        cost = estimate_tokens(passage["title"]) + estimate_tokens(passage["text"])
+        if used + cost > budget:
+            continue  # a shorter, lower-ranked passage may still fit
+        passage["score"] = round(score, 3)
+        picked.append(passage)
+        used += cost
+    return picked
+
+
+def context_block(passages: List[dict]) -> str:
+    """Prompt section for retrieved passages ("" when there are none)."""
+    if not passages:
+        return ""
+    lines = ["", "Clinic documents (excerpts that may answer the visitor's message; use them when relevant):"]
+    lines += [f"[{p['title']}] {p['text']}" for p in passages]
+    return "\n".join(lines) + "\n"
+
+
+def clear() -> None:
+    with _guard:
+        _indexes.clear()
@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import logging
+import time
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def derive_lead_key(clinic_id: str, session_id: Optional[str], fields: Dict[str, Optional[str]]) -> str:
+    """Idempotency key for a lead without one: clinic, session and a hash of the content."""
+    content = "\x1f".join(f"{k}={(fields.get(k) or '').strip().lower()}" for k in sorted(fields))
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+    return f"{clinic_id}:{session_id or '-'}:{digest}"
+
+
+class LeadDeduper:
+    """Remembers lead idempotency keys for `ttl_seconds` so repeats can be dropped.
+
+    A key is claimed for `pending_seconds` when the lead is accepted, then
+    `confirm`ed for the full TTL once the lead is saved or the clinic notified,
+    or `release`d if neither worked, so a retry is processed again instead of
+    being answered as a duplicate. A claim whose worker died just lapses.
+
+    Uses Redis (SET NX EX, shared by all workers) when a client is passed in,
+    and a per-process dict otherwise or when Redis errors.
+    """
+
+    prefix = "lead:idem:"
+
+    def __init__(self, ttl_seconds: Optional[int] = None, pending_seconds: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds or settings.lead_dedupe_ttl_seconds
+        self.pending_seconds = pending_seconds or settings.lead_dedupe_pending_seconds
+        self._seen: Dict[str, float] = {}
+        self._lock = Lock()
+
+    async def claim(self, key: str, redis: Any = None) -> bool:
+        """True the first time `key` is seen within its claim, False for a duplicate."""
+        if redis is not None:
+            try:
+                return bool(await redis.set(self.prefix + key, b"1", nx=True, ex=self.pending_seconds))
+            except Exception as e:
+                logger.warning("Redis lead dedupe failed; using in-memory fallback", extra={"error": str(e)})
+
+        now = time.monotonic()
+        with self._lock:
+            if len(self._seen) > 10000:
+                self._seen = {k: exp for k, exp in self._seen.items() if exp > now}
+            if self._seen.get(key, 0) > now:
+                return False
+            self._seen[key] = now + self.pending_seconds
+            return True
+
+    async def confirm(self, key: str, redis: Any = None) -> None:
+        """Keep dropping repeats of a lead that was handled for the full TTL."""
+        if redis is not None:
+            try:
+                await redis.set(self.prefix + key, b"1", ex=self.ttl_seconds)
+                return
+            except Exception as e:
+                logger.warning("Redis lead dedupe failed; using in-memory fallback", extra={"error": str(e)})
+        with self._lock:
+            self._seen[key] = time.monotonic() + self.ttl_seconds
+
+    async def release(self, key: str, redis: Any = None) -> None:
+        """Forget a lead that could not be handled, so its retry is accepted."""
+        if redis is not None:
+            try:
+                await redis.delete(self.prefix + key)
+            except Exception as e:
+                logger.warning("Redis lead dedupe failed; using in-memory fallback", extra={"error": str(e)})
+        with self._lock:
+            self._seen.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._seen.clear()
+
+
+class LeadPipeline:
+    """Bounded queue of accepted leads, processed off the request path by async workers.
+
+    `handler(job)` is a coroutine function; it should push blocking work
+    (database writes) to a thread. `submit` returns False when the pipeline is
+    not running or full, so the caller can fall back to a BackgroundTask.
+    """
+
+    def __init__(self, handler: Callable[[dict], Awaitable[None]], maxsize: Optional[int] = None, workers: Optional[int] = None):
+        self._handler = handler
+        self.maxsize = maxsize or settings.lead_queue_size
+        self.workers = workers or settings.lead_workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.stats = {"processed": 0, "failed": 0, "dropped": 0}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Finish queued leads (up to `timeout`), then stop the workers."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Lead pipeline stopped with unprocessed leads", extra={"unprocessed": self._queue.qsize()})
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job: dict) -> bool:
+        """Queue a job. Must be called from the event loop."""
+        if not self.running:
+            return False
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._handler(job)
+                self.stats["processed"] += 1
+            except Exception:
+                self.stats["failed"] += 1
+                logger.exception("Lead pipeline job failed")
+            finally:
+                self._queue.task_done()
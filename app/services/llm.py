@@ -1,31 +1,57 @@
-from openai import AsyncOpenAI
+import logging
+from threading import Lock
+from typing import TYPE_CHECKING, Optional
+
+from app import http_clients
 from app.config import settings
 
-# Initialize client with API key from settings
-aclient = AsyncOpenAI(api_key=settings.openai_api_key)
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+# The openai SDK takes ~0.5s to import; it is loaded on first use (or by
+# warmup at startup) instead of when this module is imported.
+_client: Optional["AsyncOpenAI"] = None
+_client_lock = Lock()
+
+
+def get_client() -> "AsyncOpenAI":
+    """Shared AsyncOpenAI client on the "llm" connection pool, created on first call.
+
+    Rebuilt after shutdown closes the pool (app/http_clients.py).
+    """
+    global _client
+    if _client is None or _client.is_closed():
+        with _client_lock:
+            if _client is None or _client.is_closed():
+                from openai import AsyncOpenAI
+
+                _client = AsyncOpenAI(api_key=settings.openai_api_key, http_client=http_clients.async_client("llm"))
+    return _client
 
-async def chat_completion(system: str, messages: list) -> str:
+async def chat_completion(system: str, messages: list, model: Optional[str] = None) -> str:
     """
-    Generate a chat completion using OpenAI.
+    Generate a chat completion using OpenAI (`model` defaults to OPENAI_MODEL).
     """
     try:
-        response = await aclient.chat.completions.create(
-            model=settings.openai_model,
+        response = await get_client().chat.completions.create(
+            model=model or settings.openai_model,
             messages=[{"role": "system", "content": system}] + messages,
             temperature=0.7,
         )
         return response.choices[0].message.content or ""
     except Exception as e:
-        print(f"LLM Error: {e}")
+        logger.error("LLM completion failed", extra={"error": str(e)})
         return "I apologize, but I am having trouble processing your request right now."
 
-async def chat_completion_stream(system: str, messages: list):
+async def chat_completion_stream(system: str, messages: list, model: Optional[str] = None):
     """
-    Stream a chat completion using OpenAI.
+    Stream a chat completion using OpenAI (`model` defaults to OPENAI_MODEL).
     """
     try:
-        stream = await aclient.chat.completions.create(
-            model=settings.openai_model,
+        stream = await get_client().chat.completions.create(
+            model=model or settings.openai_model,
             messages=[{"role": "system", "content": system}] + messages,
             temperature=0.7,
             stream=True,
@@ -35,5 +61,5 @@ async def chat_completion_stream(system: str, messages: list):
             if content:
                 yield content
     except Exception as e:
-        print(f"LLM Stream Error: {e}")
+        logger.error("LLM stream failed", extra={"error": str(e)})
         yield "I apologize, but I am having trouble processing your request right now."
\ No newline at end of file
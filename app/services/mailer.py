@@ -0,0 +1,594 @@
+"""Outbound mail: a small pool of persistent SMTP connections fed by a bounded async queue.
+
+Messages are handed to `mail_queue.submit()` from request handlers and
+delivered by worker tasks, each holding one pooled connection, so a burst of
+leads reuses a couple of authenticated sessions instead of opening one per
+email. Clinics with `lead_digest_minutes` set get their leads batched into
+one digest email per window.
+
+With Supabase configured, every accepted message is also written to the
+mail_deliveries table (`DeliveryStore`): delivery ids can be polled from any
+worker, and mail a worker accepted but never sent (crash, deploy) is claimed
+and sent by another worker. Delivery is at least once: a worker that dies
+mid-send can leave a message that is sent again.
+"""
+import asyncio
+import email
+import email.policy
+import logging
+import os
+import smtplib
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from email.message import Message
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+class SMTPPool:
+    """Thread-safe pool of logged-in smtplib connections, reused across sends."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str = "",
+        password: str = "",
+        starttls: bool = True,
+        timeout: float = 10.0,
+        size: int = 2,
+        max_idle_seconds: float = 60.0,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.size = size
+        self.max_idle_seconds = max_idle_seconds
+        self._idle: Deque[Tuple[smtplib.SMTP, float]] = deque()
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+
+    @classmethod
+    def from_settings(cls) -> "SMTPPool":
+        return cls(
+            host=settings.smtp_host,
+            port=settings.smtp_port,
+            user=settings.smtp_user,
+            password=settings.smtp_password,
+            starttls=settings.smtp_starttls,
+            timeout=settings.smtp_timeout,
+            size=settings.smtp_pool_size,
+        )
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                conn.starttls()
+            if self.user and self.password:
+                conn.login(self.user, self.password)
+        except Exception:
+            self._discard(conn)
+            raise
+        self.connections_opened += 1
+        return conn
+
+    @staticmethod
+    def _discard(conn: smtplib.SMTP) -> None:
+        try:
+            conn.quit()
+        except Exception:
+            conn.close()
+
+    def _acquire(self) -> smtplib.SMTP:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, last_used = self._idle.pop()
+            if time.monotonic() - last_used < self.max_idle_seconds:
+                return conn
+            # Servers drop idle sessions; check before reusing an old one.
+            try:
+                if conn.noop()[0] == 250:
+                    return conn
+            except Exception:
+                pass
+            self._discard(conn)
+        return self._connect()
+
+    def _release(self, conn: smtplib.SMTP) -> None:
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((conn, time.monotonic()))
+                return
+        self._discard(conn)
+
+    def _send_fresh(self, msg: Message) -> None:
+        conn = self._connect()
+        try:
+            conn.send_message(msg)
+        except Exception:
+            self._discard(conn)
+            raise
+        self._release(conn)
+
+    def send(self, msg: Message) -> None:
+        """Send on a pooled connection; one reconnect if the connection went stale."""
+        conn = self._acquire()
+        try:
+            conn.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self._discard(conn)
+            return self._send_fresh(msg)
+        except smtplib.SMTPException:
+            # Message-level rejection: the session itself is still usable.
+            try:
+                conn.rset()
+                self._release(conn)
+            except Exception:
+                self._discard(conn)
+            raise
+        except OSError:
+            self._discard(conn)
+            return self._send_fresh(msg)
+        self._release(conn)
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+_ACTIVE = ("queued", "sending", "retrying")
+
+
+def _epoch(value: Optional[str]) -> Optional[float]:
+    from app.utils.pagination import parse_timestamp
+
+    return parse_timestamp(value).timestamp() if value else None
+
+
+class DeliveryStore:
+    """mail_deliveries rows (app/supabase_db.py) behind the calls MailQueue makes.
+
+    Methods block on the database; the queue calls them from worker threads.
+    """
+
+    def create(self, record: dict, message: str, worker: str) -> str:
+        """Store a new delivery and return the id to hand out.
+
+        If an unfailed delivery already holds the record's idempotency key
+        (possibly queued by another worker), its id is returned instead and
+        nothing is stored.
+        """
+        from app import supabase_db as db
+
+        key = record.get("key")
+        if key:
+            existing = db.get_mail_delivery_by_key(key)
+            if existing and existing["status"] != "failed":
+                return existing["id"]
+            if existing:
+                db.update_mail_delivery(existing["id"], {"idempotency_key": None})
+        now = datetime.now(timezone.utc).isoformat()
+        row = {
+            "id": record["id"],
+            "idempotency_key": key,
+            "status": record["status"],
+            "to_email": record["to"],
+            "subject": record["subject"],
+            "message": message,
+            "claimed_by": worker,
+            "claimed_at": now,
+        }
+        if not db.insert_mail_delivery(row):
+            # Another worker stored the same key between our lookup and insert.
+            existing = db.get_mail_delivery_by_key(key)
+            return existing["id"] if existing else record["id"]
+        return record["id"]
+
+    def update(self, delivery_id: str, fields: dict) -> None:
+        from app import supabase_db as db
+
+        row = {k: v for k, v in fields.items() if k in ("status", "attempts", "error")}
+        now = datetime.now(timezone.utc).isoformat()
+        row.update(updated_at=now, claimed_at=now)
+        if row.get("status") == "sent":
+            row["message"] = None
+        db.update_mail_delivery(delivery_id, row)
+
+    def get(self, delivery_id: str) -> Optional[dict]:
+        from app import supabase_db as db
+
+        row = db.get_mail_delivery(delivery_id)
+        if not row:
+            return None
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "to": row.get("to_email"),
+            "subject": row.get("subject"),
+            "attempts": row.get("attempts", 0),
+            "error": row.get("error"),
+            "key": row.get("idempotency_key"),
+            "updated_at": _epoch(row.get("updated_at")),
+        }
+
+    def claim(self, worker: str, stale_seconds: int, limit: int) -> List[dict]:
+        """Unsent deliveries taken over from workers that stopped refreshing their claim."""
+        from app import supabase_db as db
+
+        return db.claim_mail_deliveries(worker, stale_seconds, limit)
+
+    def touch(self, worker: str, delivery_ids: List[str]) -> None:
+        from app import supabase_db as db
+
+        db.touch_mail_deliveries(worker, delivery_ids)
+
+    def release(self, worker: str) -> None:
+        from app import supabase_db as db
+
+        db.release_mail_deliveries(worker)
+
+
+def default_delivery_store() -> Optional[DeliveryStore]:
+    """The mail_deliveries store, or None when Supabase is not configured or persistence is off."""
+    if not settings.mail_persist_deliveries:
+        return None
+    if not (settings.supabase_url.strip() and settings.supabase_service_role_key.strip()):
+        return None
+    return DeliveryStore()
+
+
+class MailQueue:
+    """Bounded queue of outgoing messages, drained by async workers with retries.
+
+    Every accepted message gets a delivery id whose status (queued, sending,
+    retrying, sent, failed) can be polled with `delivery()`. Status is kept
+    in memory for the most recent `max_tracked` deliveries of this process
+    and, when a `DeliveryStore` is available, in the database, where other
+    workers can read it and recover messages this process never sent.
+    """
+
+    def __init__(
+        self,
+        pool_factory: Callable[[], SMTPPool] = SMTPPool.from_settings,
+        maxsize: Optional[int] = None,
+        workers: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        retry_delay: float = 1.0,
+        max_tracked: int = 10000,
+        store_factory: Callable[[], Optional[DeliveryStore]] = default_delivery_store,
+        recover_interval: Optional[float] = None,
+        stale_seconds: Optional[int] = None,
+    ):
+        self._pool_factory = pool_factory
+        self._store_factory = store_factory
+        self.maxsize = maxsize or settings.mail_queue_size
+        self.workers = workers or settings.smtp_pool_size
+        self.max_attempts = max_attempts or settings.mail_max_attempts
+        self.retry_delay = retry_delay
+        self.max_tracked = max_tracked
+        self.recover_interval = recover_interval or settings.mail_recover_interval_seconds
+        self.stale_seconds = settings.mail_claim_stale_seconds if stale_seconds is None else stale_seconds
+        self.pool: Optional[SMTPPool] = None
+        self.store: Optional[DeliveryStore] = None
+        self.worker_id = ""
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._deliveries: "OrderedDict[str, dict]" = OrderedDict()
+        self._by_key: Dict[str, str] = {}
+        self._writes: Dict[str, asyncio.Future] = {}
+        self._sent_hooks: Dict[str, Callable[[str], None]] = {}
+        self.stats = {"sent": 0, "failed": 0, "retried": 0, "dropped": 0, "recovered": 0}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self.pool = self._pool_factory()
+        self.store = self._store_factory()
+        # Per process, and set here rather than at import so forked workers differ.
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.store:
+            self._tasks.append(asyncio.create_task(self._recover()))
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Deliver what is queued (up to `timeout`), then stop workers and close connections."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Mail queue stopped with undelivered messages", extra={"undelivered": self._queue.qsize()})
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.store:
+            try:
+                await asyncio.to_thread(self.store.release, self.worker_id)
+            except Exception as e:
+                logger.warning("Could not release unsent mail deliveries", extra={"error": str(e)})
+        self.pool.close()
+
+    def register_sent_hook(self, prefix: str, hook: Callable[[str], None]) -> None:
+        """Run `hook(rest)` after sending a message queued under the key "<prefix>:<rest>".
+
+        Unlike `on_sent`, hooks also run for deliveries recovered from another
+        worker, whose callbacks did not survive it.
+        """
+        self._sent_hooks[prefix] = hook
+
+    def submit(self, msg: Message) -> bool:
+        """Queue a message for delivery. Returns False if not running or the queue is full."""
+        return self.enqueue(msg) is not None
+
+    def enqueue(
+        self,
+        msg: Message,
+        idempotency_key: Optional[str] = None,
+        on_sent: Optional[Callable[[], None]] = None,
+    ) -> Optional[str]:
+        """Queue a message and return its delivery id (None if not running or full).
+
+        With an `idempotency_key`, a message already queued or sent under the
+        same key is not queued again; its existing delivery id is returned.
+        `on_sent` runs in a worker thread after a successful send. Safe to
+        call from threadpool handlers as well as from the event loop.
+
+        From a threadpool handler the delivery is stored before this returns,
+        so the key is checked across workers. On the event loop the row is
+        written in the background and the key is only checked in this process.
+        """
+        if not self.running:
+            return None
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            return self._enqueue(msg, idempotency_key, on_sent)
+
+        delivery_id = None
+        if self.store:
+            if idempotency_key:
+                existing = self._deliveries.get(self._by_key.get(idempotency_key, ""))
+                if existing and existing["status"] != "failed":
+                    return existing["id"]
+            delivery_id = uuid4().hex
+            try:
+                stored_id = self.store.create(self._record(delivery_id, msg, idempotency_key), msg.as_string(), self.worker_id)
+            except Exception as e:
+                logger.warning("Could not store mail delivery; tracking it in this process only", extra={"error": str(e)})
+                stored_id = delivery_id
+            if stored_id != delivery_id:
+                return stored_id
+
+        async def enqueue_on_loop():
+            return self._enqueue(msg, idempotency_key, on_sent, delivery_id)
+
+        queued_id = asyncio.run_coroutine_threadsafe(enqueue_on_loop(), self._loop).result(timeout=5)
+        if delivery_id and queued_id != delivery_id:
+            # Stored but not queued (queue full); don't let another worker send it later.
+            try:
+                self.store.update(delivery_id, {"status": "failed", "error": "mail queue full"})
+            except Exception as e:
+                logger.warning("Could not fail unqueued mail delivery", extra={"error": str(e)})
+        return queued_id
+
+    @staticmethod
+    def _record(delivery_id: str, msg: Message, idempotency_key: Optional[str]) -> dict:
+        return {
+            "id": delivery_id,
+            "status": "queued",
+            "to": msg["To"],
+            "subject": msg["Subject"],
+            "attempts": 0,
+            "error": None,
+            "key": idempotency_key,
+            "updated_at": time.time(),
+        }
+
+    def _enqueue(
+        self,
+        msg: Message,
+        idempotency_key: Optional[str],
+        on_sent: Optional[Callable[[], None]],
+        stored_id: Optional[str] = None,
+    ) -> Optional[str]:
+        if idempotency_key:
+            existing = self._deliveries.get(self._by_key.get(idempotency_key, ""))
+            if existing and existing["status"] != "failed":
+                return existing["id"]
+
+        delivery_id = stored_id or uuid4().hex
+        try:
+            self._queue.put_nowait((delivery_id, msg, on_sent))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            logger.warning("Mail queue full; rejecting message", extra={"maxsize": self.maxsize, "to": msg["To"]})
+            return None
+
+        record = self._record(delivery_id, msg, idempotency_key)
+        if self.store and not stored_id:
+            self._writes[delivery_id] = asyncio.ensure_future(
+                asyncio.to_thread(self.store.create, dict(record), msg.as_string(), self.worker_id)
+            )
+        self._track(record)
+        return delivery_id
+
+    def _track(self, record: dict) -> None:
+        self._deliveries[record["id"]] = record
+        if record["key"]:
+            self._by_key[record["key"]] = record["id"]
+        while len(self._deliveries) > self.max_tracked:
+            old_id, old = self._deliveries.popitem(last=False)
+            if old.get("key") and self._by_key.get(old["key"]) == old_id:
+                del self._by_key[old["key"]]
+
+    def delivery(self, delivery_id: str) -> Optional[dict]:
+        """Status of a delivery; falls back to the store for ids queued by other workers.
+
+        Blocks on the database in that case, so call it from a threadpool handler.
+        """
+        record = self._deliveries.get(delivery_id)
+        if record:
+            return dict(record)
+        if self.store and delivery_id:
+            try:
+                return self.store.get(delivery_id)
+            except Exception as e:
+                logger.warning("Could not read mail delivery", extra={"error": str(e)})
+        return None
+
+    async def _update(self, delivery_id: str, **fields) -> None:
+        record = self._deliveries.get(delivery_id)
+        if record:
+            record.update(fields, updated_at=time.time())
+        if self.store:
+            try:
+                await asyncio.to_thread(self.store.update, delivery_id, fields)
+            except Exception as e:
+                logger.warning("Could not store mail delivery status", extra={"error": str(e)})
+
+    async def _worker(self) -> None:
+        while True:
+            delivery_id, msg, on_sent = await self._queue.get()
+            try:
+                write = self._writes.pop(delivery_id, None)
+                if write:
+                    # Status updates must not overtake the row's insert.
+                    try:
+                        await write
+                    except Exception as e:
+                        logger.warning("Could not store mail delivery; tracking it in this process only", extra={"error": str(e)})
+                callback = on_sent or self._sent_hook(delivery_id)
+                if await self._deliver(delivery_id, msg) and callback:
+                    try:
+                        await asyncio.to_thread(callback)
+                    except Exception as e:
+                        logger.warning("Mail on_sent callback failed", extra={"error": str(e)})
+            finally:
+                self._queue.task_done()
+
+    def _sent_hook(self, delivery_id: str) -> Optional[Callable[[], None]]:
+        key = (self._deliveries.get(delivery_id) or {}).get("key") or ""
+        prefix, _, rest = key.partition(":")
+        hook = self._sent_hooks.get(prefix) if rest else None
+        return (lambda: hook(rest)) if hook else None
+
+    async def _recover(self) -> None:
+        """Keep this worker's claims fresh and take over mail other workers left unsent."""
+        while True:
+            try:
+                active = [i for i, r in self._deliveries.items() if r["status"] in _ACTIVE]
+                free = self.maxsize - self._queue.qsize()
+                for row in await asyncio.to_thread(self._claim, active, free):
+                    self._requeue(row)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Mail delivery recovery failed", extra={"error": str(e)})
+            await asyncio.sleep(self.recover_interval)
+
+    def _claim(self, active: List[str], free: int) -> List[dict]:
+        if active:
+            self.store.touch(self.worker_id, active)
+        return self.store.claim(self.worker_id, self.stale_seconds, free) if free > 0 else []
+
+    def _requeue(self, row: dict) -> None:
+        msg = email.message_from_string(row["message"], policy=email.policy.default)
+        record = self._record(row["id"], msg, row.get("idempotency_key"))
+        record["attempts"] = row.get("attempts") or 0
+        self._queue.put_nowait((row["id"], msg, None))
+        self._track(record)
+        self.stats["recovered"] += 1
+        logger.info("Recovered unsent mail delivery", extra={"delivery_id": row["id"], "to": msg["To"]})
+
+    async def _deliver(self, delivery_id: str, msg: Message) -> bool:
+        delay = self.retry_delay
+        for attempt in range(1, self.max_attempts + 1):
+            await self._update(delivery_id, status="sending", attempts=attempt)
+            try:
+                await asyncio.to_thread(self.pool.send, msg)
+                self.stats["sent"] += 1
+                await self._update(delivery_id, status="sent", error=None)
+                return True
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    self.stats["failed"] += 1
+                    await self._update(delivery_id, status="failed", error=str(e))
+                    logger.error("Mail delivery failed", extra={"to": msg["To"], "attempts": attempt, "error": str(e)})
+                    return False
+                self.stats["retried"] += 1
+                await self._update(delivery_id, status="retrying", error=str(e))
+                await asyncio.sleep(delay)
+                delay *= 2
+        return False
+
+
+class LeadDigest:
+    """Collects leads per clinic and recipient and emits one digest message per window."""
+
+    def __init__(
+        self,
+        mail_queue: MailQueue,
+        build_message: Callable[[str, str, List[dict]], Message],
+        max_leads: Optional[int] = None,
+    ):
+        self._mail_queue = mail_queue
+        self._build_message = build_message
+        self.max_leads = max_leads or settings.lead_digest_max_leads
+        self._pending: Dict[Tuple[str, str], dict] = {}
+
+    def add(self, to_email: str, clinic_name: str, lead: dict, window_seconds: float) -> None:
+        """Buffer a lead; the first lead for a clinic/recipient starts its window."""
+        key = (clinic_name, to_email)
+        entry = self._pending.get(key)
+        if entry is None:
+            loop = asyncio.get_running_loop()
+            entry = {"leads": [], "timer": loop.call_later(window_seconds, self.flush, key)}
+            self._pending[key] = entry
+        entry["leads"].append(lead)
+        if len(entry["leads"]) >= self.max_leads:
+            self.flush(key)
+
+    def flush(self, key: Tuple[str, str]) -> None:
+        entry = self._pending.pop(key, None)
+        if not entry:
+            return
+        entry["timer"].cancel()
+        clinic_name, to_email = key
+        msg = self._build_message(to_email, clinic_name, entry["leads"])
+        if not self._mail_queue.submit(msg):
+            logger.warning("Lead digest could not be queued", extra={"to": to_email, "leads": len(entry["leads"])})
+
+    def flush_all(self) -> None:
+        for key in list(self._pending):
+            self.flush(key)
+
+    @property
+    def pending(self) -> int:
+        return sum(len(e["leads"]) for e in self._pending.values())
+
+
+mail_queue = MailQueue()
@@ -0,0 +1,140 @@
+"""Model tiering: send simple chat turns to a fast model, the rest to the quality model.
+
+A local classifier looks at the message length, a keyword intent and how
+deep the conversation is. Greetings, thanks and short questions about
+hours, location or contact details go to the fast tier (OPENAI_FAST_MODEL);
+pricing, insurance and treatment questions, messages no intent matches,
+long or multi-part messages and long conversations go to the quality tier
+(OPENAI_MODEL).
+
+MODEL_TIER_BY_PLAN sets the policy per clinic plan, e.g.
+"free:fast,pro:auto,enterprise:quality"; other plans use MODEL_TIER_DEFAULT.
+"auto" runs the classifier, "fast"/"quality" pin the tier.
+
+Every choice is logged ("Model tier chosen") with the features behind it,
+and thumbs up/down feedback on a session is logged against the session's
+last choice ("Model tier feedback"), so the thresholds can be tuned from
+the logs. The tier counters are in app/metrics.py.
+"""
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from app.config import settings
+from app.metrics import MODEL_TIER_FEEDBACK_TOTAL, MODEL_TIER_TOTAL
+
+logger = logging.getLogger(__name__)
+
+TIERS = ("fast", "quality")
+
+# First match wins; only the simple intents can go to the fast tier. English
+# and Swedish, like the rest of the chat path.
+INTENT_PATTERNS = [
+    ("pricing", r"\b(prices?|pricing|costs?|fees?|how much|expensive|cheap|payments?|pay|kr|sek|usd|eur"
+                r"|pris(er|et|erna)?|kostar|kosta|kostnad(er)?|avgift(er)?|betala|betalning|dyr[at]?|billig[at]?"
+                r"|hur mycket|kronor)\b|[$€£]"),
+    ("insurance", r"\b(insurance|insured|coverage|covers?|covered|reimburse\w*"
+                  r"|försäkr\w*|högkostnadsskydd\w*|tandvårdsstöd\w*|ersättning\w*|frikort)\b"),
+    ("treatment", r"\b(implants?|crowns?|veneers?|braces|invisalign|root canal|extractions?|whitening|fillings?|procedures?|treatments?"
+                  r"|implantat\w*|kron(a|an|or)|skalfasad\w*|tandställning\w*|rotfyllning\w*|utdragning\w*|dra ut"
+                  r"|blekning\w*|fyllning\w*|lagning\w*|behandling\w*|ingrepp\w*)\b"),
+    ("comparison", r"\b(compare|comparison|difference|better|versus|vs|jämför\w*|skillnad\w*|bättre)\b"),
+    ("booking", r"\b(book|booking|appointments?|schedule|reschedule|cancel|available|availability"
+                r"|boka|bokning\w*|omboka|avboka\w*|ledig(a)? tid(er)?|besökstid\w*)\b"),
+    ("hours", r"\b(open|opening|hours|close|closing|today|tomorrow|weekend|saturday|sunday"
+              r"|öppet|öppna[rs]?|öppettider(na)?|stänger|stängt|idag|imorgon|helg(en|er)?|lördag(ar)?|söndag(ar)?)\b"),
+    ("location", r"\b(where|address|located|location|parking|directions"
+                 r"|var ligger|adress(en)?|parkering\w*|hitta hit|vägbeskrivning)\b"),
+    ("contact", r"\b(phone|call|email|contact|reach|telefon\w*|ringa?|mejl\w*|mail|e-post|kontakt\w*)\b"),
+    ("greeting", r"^\W*(hi|hello|hey|hej|hallå|hallo|tjena|god (morgon|middag|kväll)|good (morning|afternoon|evening))\b"),
+    ("thanks", r"\b(thanks|thank you|thx|tack|great|perfect|ok|okay|bye|goodbye|toppen|perfekt|okej|hejdå|hej då)\b"),
+]
+_INTENTS = [(name, re.compile(pattern, re.IGNORECASE)) for name, pattern in INTENT_PATTERNS]
+SIMPLE_INTENTS = {"greeting", "thanks", "hours", "location", "contact", "booking"}
+
+# Last choice per session, for attributing feedback (process-local, bounded).
+_MAX_SESSIONS = 10000
+_choices: "OrderedDict[str, dict]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def detect_intent(text: str) -> str:
+    for name, pattern in _INTENTS:
+        if pattern.search(text):
+            return name
+    return "other"
+
+
+def classify(text: str, history_depth: int) -> tuple[str, str, str]:
+    """(tier, reason, intent) for a message with `history_depth` earlier messages."""
+    intent = detect_intent(text)
+    if intent == "other":
+        # Nothing recognised it, so it may well be a clinical question: don't guess cheap.
+        return "quality", "unknown_intent", intent
+    if intent not in SIMPLE_INTENTS:
+        return "quality", "intent", intent
+    if len(text) > settings.model_tier_max_fast_chars:
+        return "quality", "long_message", intent
+    if text.count("?") > 1:
+        return "quality", "multi_question", intent
+    if history_depth > settings.model_tier_max_fast_history:
+        return "quality", "deep_history", intent
+    return "fast", "simple", intent
+
+
+def policy_for(clinic: dict) -> str:
+    plan = clinic.get("plan")
+    policy = settings.model_tier_by_plan().get(plan) if plan else None
+    return policy or settings.model_tier_default
+
+
+def model_for(tier: str) -> str:
+    if tier == "fast":
+        return settings.openai_fast_model or settings.openai_model
+    return settings.openai_model
+
+
+def choose(clinic: dict, text: str, history_depth: int, session_id: Optional[str] = None) -> dict:
+    """Pick the tier and model for one chat turn, log it, and remember it for feedback."""
+    policy = policy_for(clinic)
+    if policy in TIERS:
+        tier, reason, intent = policy, "plan", detect_intent(text)
+    else:
+        tier, reason, intent = classify(text, history_depth)
+    choice = {
+        "tier": tier,
+        "model": model_for(tier),
+        "reason": reason,
+        "intent": intent,
+        "chars": len(text),
+        "history_depth": history_depth,
+        "plan": clinic.get("plan"),
+    }
+    MODEL_TIER_TOTAL.labels(tier, reason).inc()
+    logger.info("Model tier chosen", extra=choice)
+    if session_id:
+        with _lock:
+            _choices[session_id] = choice
+            _choices.move_to_end(session_id)
+            while len(_choices) > _MAX_SESSIONS:
+                _choices.popitem(last=False)
+    return choice
+
+
+def record_feedback(session_id: str, rating: str) -> Optional[dict]:
+    """Log feedback against the session's last tier choice (if this worker made it)."""
+    with _lock:
+        choice = _choices.get(session_id)
+    if choice is None:
+        return None
+    MODEL_TIER_FEEDBACK_TOTAL.labels(choice["tier"], rating if rating in ("up", "down") else "other").inc()
+    logger.info("Model tier feedback", extra={**choice, "rating": rating})
+    return choice
+
+
+def clear() -> None:
+    with _lock:
+        _choices.clear()
+
@@ -0,0 +1,168 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from app.config import settings
+from app.utils.pagination import parse_timestamp
+from app.supabase_db import (
+    delete_messages,
+    ensure_message_partitions,
+    get_session_archives,
+    iter_expired_messages,
+    iter_retention_clinics,
+    upsert_session_archives,
+)
+
+logger = logging.getLogger(__name__)
+
+RETENTION_MODES = ("archive", "delete")
+
+# Transcript kept in chat_session_archives.summary, per session.
+ARCHIVE_SUMMARY_CHARS = 2000
+
+# Report of the most recent run in this process (for GET /admin/cron/retention).
+LAST_REPORT: Optional[dict] = None
+
+
+def retention_days_for(clinic: dict) -> int:
+    """Clinic override, then plan default, then the global default. 0 keeps forever."""
+    if clinic.get("retention_days") is not None:
+        return int(clinic["retention_days"])
+    by_plan = settings.retention_days_by_plan()
+    plan = clinic.get("plan")
+    if plan in by_plan:
+        return by_plan[plan]
+    return settings.chat_retention_days
+
+
+def _content_bytes(row: dict) -> int:
+    return len((row.get("content") or "").encode("utf-8"))
+
+
+def _compact(clinic_uuid: str, rows: list[dict]) -> tuple[list[dict], int]:
+    """Fold a batch of expired messages into one archive row per session.
+
+    Returns the archive rows to upsert and how many summary bytes they add.
+    Messages are archived oldest first, so any message at or before a
+    session's archived last_message_at is already in its archive: an earlier
+    run upserted the archive but failed to delete them. Those are skipped
+    here (and deleted by the caller) instead of being counted twice.
+    """
+    by_session: dict[str, list[dict]] = {}
+    for row in rows:
+        by_session.setdefault(row["session_id"], []).append(row)
+
+    existing = {a["session_id"]: a for a in get_session_archives(list(by_session))}
+    archives = []
+    added_bytes = 0
+    for session_uuid, msgs in by_session.items():
+        prev = existing.get(session_uuid) or {}
+        if prev.get("last_message_at"):
+            archived_until = parse_timestamp(prev["last_message_at"])
+            msgs = [m for m in msgs if parse_timestamp(m["created_at"]) > archived_until]
+            if not msgs:
+                continue
+        transcript = "\n".join(f"{m.get('role')}: {m.get('content') or ''}" for m in msgs)
+        summary = "\n".join(s for s in (prev.get("summary"), transcript) if s)[:ARCHIVE_SUMMARY_CHARS]
+        added_bytes += len(summary.encode("utf-8")) - len((prev.get("summary") or "").encode("utf-8"))
+        first = min([m["created_at"] for m in msgs] + ([prev["first_message_at"]] if prev.get("first_message_at") else []), key=parse_timestamp)
+        last = max([m["created_at"] for m in msgs] + ([prev["last_message_at"]] if prev.get("last_message_at") else []), key=parse_timestamp)
+        archives.append({
+            "session_id": session_uuid,
+            "clinic_id": clinic_uuid,
+            "message_count": (prev.get("message_count") or 0) + len(msgs),
+            "content_bytes": (prev.get("content_bytes") or 0) + sum(_content_bytes(m) for m in msgs),
+            "first_message_at": first,
+            "last_message_at": last,
+            "summary": summary,
+            "archived_at": datetime.now(timezone.utc).isoformat(),
+        })
+    return archives, added_bytes
+
+
+def run_retention(
+    mode: str = "archive",
+    dry_run: bool = False,
+    batch_size: Optional[int] = None,
+    max_batches: Optional[int] = None,
+) -> dict:
+    """Delete (or compact, then delete) chat messages past each clinic's retention window.
+
+    Work is done in batches of at most `batch_size` messages and stops after
+    `max_batches`; `complete` is False when a run was cut short, and the next
+    run picks up from the oldest remaining message. Returns a report of rows
+    and content bytes reclaimed.
+    """
+    global LAST_REPORT
+    if mode not in RETENTION_MODES:
+        raise ValueError(f"mode must be one of: {', '.join(RETENTION_MODES)}")
+    batch_size = batch_size or settings.retention_batch_size
+    max_batches = max_batches or settings.retention_max_batches
+
+    now = datetime.now(timezone.utc)
+    report = {
+        "mode": mode,
+        "dry_run": dry_run,
+        "started_at": now.isoformat(),
+        "clinics_processed": 0,
+        "sessions_compacted": 0,
+        "messages_deleted": 0,
+        "bytes_deleted": 0,
+        "bytes_archived": 0,
+        "bytes_reclaimed": 0,
+        "batches": 0,
+        "complete": True,
+    }
+
+    if not dry_run:
+        # Keep the monthly chat_messages partitions ahead of the clock.
+        # A failure here does not stop the purge, but is reported: without new
+        # partitions every later message lands in chat_messages_default.
+        try:
+            report["partitions"] = ensure_message_partitions()
+        except Exception as e:
+            report["partitions_error"] = str(e)
+            logger.error("ensure_chat_messages_partitions failed", extra={"error": str(e)}, exc_info=True)
+
+    for clinics in iter_retention_clinics():
+        for clinic in clinics:
+            days = retention_days_for(clinic)
+            if days <= 0:
+                continue
+            report["clinics_processed"] += 1
+            cutoff = (now - timedelta(days=days)).isoformat()
+
+            for rows in iter_expired_messages(clinic["id"], cutoff, page_size=batch_size):
+                if report["batches"] >= max_batches:
+                    report["complete"] = False
+                    break
+                report["batches"] += 1
+                deleted_bytes = sum(_content_bytes(r) for r in rows)
+
+                if mode == "archive":
+                    if dry_run:
+                        report["sessions_compacted"] += len({r["session_id"] for r in rows})
+                    else:
+                        archives, archived_bytes = _compact(clinic["id"], rows)
+                        upsert_session_archives(archives)
+                        report["sessions_compacted"] += len(archives)
+                        report["bytes_archived"] += archived_bytes
+
+                if not dry_run:
+                    delete_messages([r["id"] for r in rows])
+                report["messages_deleted"] += len(rows)
+                report["bytes_deleted"] += deleted_bytes
+
+            if not report["complete"]:
+                break
+        if not report["complete"]:
+            break
+
+    report["bytes_reclaimed"] = report["bytes_deleted"] - report["bytes_archived"]
+    report["finished_at"] = datetime.now(timezone.utc).isoformat()
+    LAST_REPORT = report
+    logger.info(
+        "Retention dry run finished" if dry_run else "Retention run finished",
+        extra={k: report[k] for k in ("mode", "messages_deleted", "sessions_compacted", "bytes_reclaimed", "complete") if k in report},
+    )
+    return report
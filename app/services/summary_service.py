@@ -1,15 +1,19 @@
-import smtplib
+import logging
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from app.config import settings
 from app.supabase_db import get_feedback_counts
+from app.utils.email import send_message
+
+logger = logging.getLogger(__name__)
 
 def send_weekly_summary_email(target_email: str):
     """Generates and sends a weekly feedback summary email."""
-    # 1. Calculate Date Range (Last 7 Days)
-    end_date = datetime.utcnow()
+    # 1. Calculate Date Range (the last 7 whole UTC days; the end bound is exclusive)
+    end_date = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
     start_date = end_date - timedelta(days=7)
+    last_day = end_date - timedelta(days=1)
     
     # 2. Fetch Data
     stats = get_feedback_counts(
@@ -18,7 +22,7 @@ def send_weekly_summary_email(target_email: str):
     )
     
     if not stats:
-        print("No feedback data found for weekly summary.")
+        logger.info("No feedback data found for weekly summary")
         return
 
     # 3. Format Email Content (HTML)
@@ -26,7 +30,7 @@ def send_weekly_summary_email(target_email: str):
     <html>
     <body>
         <h2>Weekly Feedback Summary</h2>
-        <p><strong>Period:</strong> {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}</p>
+        <p><strong>Period:</strong> {start_date.strftime('%Y-%m-%d')} to {last_day.strftime('%Y-%m-%d')}</p>
         <table border="1" cellpadding="5" style="border-collapse: collapse; width: 100%;">
             <tr style="background-color: #f2f2f2;">
                 <th style="text-align: left;">Clinic Name</th>
@@ -62,15 +66,10 @@ def send_weekly_summary_email(target_email: str):
     msg = MIMEMultipart()
     msg['From'] = settings.email_from
     msg['To'] = target_email
-    msg['Subject'] = f"Weekly Feedback Summary - {end_date.strftime('%Y-%m-%d')}"
+    msg['Subject'] = f"Weekly Feedback Summary - {last_day.strftime('%Y-%m-%d')}"
     msg.attach(MIMEText(html_content, 'html'))
 
-    try:
-        server = smtplib.SMTP(settings.smtp_host, settings.smtp_port)
-        server.starttls()
-        server.login(settings.smtp_user, settings.smtp_password)
-        server.send_message(msg)
-        server.quit()
-        print(f"Weekly summary email sent to {target_email}")
-    except Exception as e:
-        print(f"Failed to send summary email: {e}")
\ No newline at end of file
+    if send_message(msg):
+        logger.info("Weekly summary email sent", extra={"to": target_email})
+    else:
+        logger.error("Failed to send weekly summary email", extra={"to": target_email})
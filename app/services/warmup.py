@@ -0,0 +1,130 @@
+"""Startup warmup and readiness.
+
+After a deploy each worker runs a list of warmup steps in the background:
+connect Redis, build the static asset table, import the SDKs, load active
+clinics (and their prompts) into the clinic cache, and open a connection to
+the LLM endpoint. `/health` answers as soon as the process is up (liveness);
+`/ready` returns 503 until the steps have finished, so the load balancer only
+routes traffic to warm workers.
+
+A failing step is logged and recorded but does not keep the worker out of
+rotation: the request path has fallbacks for all of them. WARMUP_TIMEOUT_SECONDS
+caps the whole phase.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+Step = Tuple[str, Callable[[], Awaitable[object]]]
+
+
+class Warmup:
+    def __init__(self) -> None:
+        self.ready = False
+        self.draining = False
+        self.timed_out = False
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.steps: Dict[str, dict] = {}
+
+    def reset(self) -> None:
+        self.__init__()
+
+    async def _run_step(self, name: str, fn: Callable[[], Awaitable[object]]) -> None:
+        start = time.perf_counter()
+        self.steps[name] = {"status": "running"}
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self.steps[name] = {"status": "cancelled", "seconds": round(time.perf_counter() - start, 3)}
+            raise
+        except Exception as e:
+            self.steps[name] = {"status": "failed", "seconds": round(time.perf_counter() - start, 3), "error": str(e)}
+            logger.warning("Warmup step failed", extra={"step": name, "error": str(e)})
+            return
+        self.steps[name] = {"status": "ok", "seconds": round(time.perf_counter() - start, 3)}
+        if result is not None:
+            self.steps[name]["result"] = result
+
+    async def run(self, steps: List[Step], timeout: Optional[float] = None) -> None:
+        """Run `steps` in order, then mark the worker ready (also on timeout)."""
+        self.started_at = time.time()
+
+        async def run_all() -> None:
+            for name, fn in steps:
+                await self._run_step(name, fn)
+
+        try:
+            await asyncio.wait_for(run_all(), timeout)
+        except asyncio.TimeoutError:
+            self.timed_out = True
+            logger.warning("Warmup timed out; serving anyway", extra={"timeout": timeout})
+        self.finished_at = time.time()
+        self.ready = not self.draining
+        logger.info("Warmup finished", extra={"seconds": round(self.finished_at - self.started_at, 3), "steps": self.steps})
+
+    def drain(self) -> None:
+        """Shutting down: fail readiness so no new traffic arrives while in-flight work finishes."""
+        self.ready = False
+        self.draining = True
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "draining": self.draining,
+            "timed_out": self.timed_out,
+            "seconds": round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else None,
+            "steps": self.steps,
+        }
+
+
+warmup = Warmup()
+
+
+def preload_sdks() -> None:
+    """Import the heavy SDKs and build their clients (blocking; run in a thread)."""
+    from app.services.llm import get_client
+    from app.supabase_db import get_supabase_client
+    from app.utils.email import _get_env
+
+    get_client()
+    _get_env()
+    get_supabase_client()
+
+
+def prefetch_clinics(limit: Optional[int] = None) -> int:
+    """Load up to `limit` active clinics into the clinic cache and build their prompts.
+
+    Blocking (run in a thread). The first page also opens the pooled
+    connection to the data API.
+    """
+    from app.services import clinic_cache
+    from app.supabase_db import iter_active_clinics
+
+    limit = settings.warmup_clinic_limit if limit is None else limit
+    primed = 0
+    for page in iter_active_clinics(page_size=min(limit, 500)):
+        primed += clinic_cache.prime(page[: limit - primed])
+        if primed >= limit:
+            break
+    return primed
+
+
+async def open_llm_connection() -> None:
+    """Open (and authenticate) a pooled connection to the LLM API with one cheap request."""
+    from openai import APIStatusError
+
+    from app.services.llm import get_client
+
+    client = get_client().with_options(timeout=settings.warmup_llm_timeout_seconds, max_retries=0)
+    try:
+        await client.models.list()
+    except APIStatusError as e:
+        # The server answered, so the connection is open; a 401 still means a bad key.
+        if e.status_code in (401, 403):
+            raise
@@ -0,0 +1,156 @@
+"""Static widget assets: precompressed, content-hash fingerprinted, served by Accept-Encoding.
+
+Every file in static/ is read once and kept in memory with gzip and (when the
+optional `brotli` package is installed) brotli variants. Each file is served at
+its plain path (/static/widget.js, short cache + ETag revalidation) and at a
+fingerprinted path (/static/widget.<hash>.js, cached for a year as immutable).
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from threading import Lock
+from typing import Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from app.config import settings
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "..", "static")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+# Compressing tiny files costs more in headers than it saves.
+MIN_COMPRESS_BYTES = 512
+
+_FINGERPRINT_RE = re.compile(r"^(?P<stem>.+)\.(?P<hash>[0-9a-f]{12})(?P<ext>\.[^.]+)$")
+
+router = APIRouter(tags=["static"])
+
+_assets: Optional[Dict[str, dict]] = None
+_lock = Lock()
+
+
+def _brotli_compress(data: bytes) -> Optional[bytes]:
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(data, quality=11)
+
+
+def _build_asset(name: str, data: bytes) -> dict:
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    stem, ext = os.path.splitext(name)
+    variants = {"identity": data}
+    if len(data) >= MIN_COMPRESS_BYTES:
+        variants["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+        br = _brotli_compress(data)
+        if br is not None:
+            variants["br"] = br
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type in ("application/javascript", "application/json"):
+        media_type += "; charset=utf-8"
+    return {
+        "name": name,
+        "hash": digest,
+        "fingerprinted": f"{stem}.{digest}{ext}",
+        "media_type": media_type,
+        "variants": variants,
+    }
+
+
+def build_assets(directory: str = STATIC_DIR) -> Dict[str, dict]:
+    """Read and compress every file under `directory`; returns assets by relative path."""
+    assets: Dict[str, dict] = {}
+    if not os.path.isdir(directory):
+        return assets
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, directory).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                assets[name] = _build_asset(name, f.read())
+    return assets
+
+
+def load_assets(directory: str = STATIC_DIR) -> Dict[str, dict]:
+    """Build the asset table once per process (at startup, or on first request)."""
+    global _assets
+    with _lock:
+        if _assets is None:
+            _assets = build_assets(directory)
+        return _assets
+
+
+def asset_path(name: str) -> Optional[str]:
+    """Fingerprinted URL path for a static file, e.g. /static/widget.1a2b3c4d5e6f.js."""
+    asset = load_assets().get(name)
+    return f"/static/{asset['fingerprinted']}" if asset else None
+
+
+def versioned_widget_src(widget_src: str) -> str:
+    """Point a widget URL served by this API at its fingerprinted version.
+
+    Only URLs ending in /static/widget.js are rewritten; a widget hosted
+    elsewhere (CDN, Vercel) is returned unchanged.
+    """
+    if not widget_src.endswith("/static/widget.js"):
+        return widget_src
+    path = asset_path("widget.js")
+    return widget_src[: -len("/static/widget.js")] + path if path else widget_src
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    accepted: Dict[str, float] = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding: str, available) -> str:
+    accepted = _accepted_encodings(accept_encoding)
+    for coding in ("br", "gzip"):
+        if coding in available and accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return "identity"
+
+
+@router.api_route("/static/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+def static_asset(path: str, request: Request):
+    assets = load_assets()
+    asset = assets.get(path)
+    cache_control = f"public, max-age={settings.static_max_age}"
+    if asset is None:
+        match = _FINGERPRINT_RE.match(path)
+        asset = assets.get(match["stem"] + match["ext"]) if match else None
+        if asset is None:
+            raise HTTPException(status_code=404, detail="Not found")
+        # A stale hash (old embed) still gets the current file, just not cached forever.
+        if match["hash"] == asset["hash"]:
+            cache_control = IMMUTABLE_CACHE
+
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""), asset["variants"])
+    # Each encoding is a different representation, so it gets its own strong ETag.
+    etag = f'"{asset["hash"]}"' if encoding == "identity" else f'"{asset["hash"]}-{encoding}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if etag in [t.strip().removeprefix("W/") for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    body = asset["variants"][encoding]
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    if request.method == "HEAD":
+        headers["Content-Length"] = str(len(body))
+        body = b""
+    return Response(content=body, media_type=asset["media_type"], headers=headers)
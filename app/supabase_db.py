@@ -1,9 +1,13 @@
 from __future__ import annotations
 
-from typing import Optional
-from supabase import Client, create_client
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Callable, Iterator, Optional
+from app import http_clients
 from app.config import settings
 
+if TYPE_CHECKING:
+    from supabase import Client
+
 
 # Lazy-init supabase client so imports don't crash when env vars are missing.
 _sb: Optional[Client] = None
@@ -25,14 +29,30 @@ def get_supabase_client() -> Client:
     if not supabase_url or not supabase_key:
         raise RuntimeError("Supabase URL/service role key are not configured. Set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY.")
 
+    # Imported here: supabase (with postgrest, gotrue, storage) is slow to import.
+    from supabase import create_client
+
     try:
         _sb = create_client(supabase_url, supabase_key)
     except Exception as exc:  # surface clear error if the key is wrong
         raise RuntimeError("Failed to create Supabase client (check SUPABASE_SERVICE_ROLE_KEY)") from exc
 
+    _use_shared_pool(_sb)
     return _sb
 
 
+def _use_shared_pool(sb: Client) -> None:
+    """Send table/rpc calls through the shared "data" connection pool (app/http_clients.py).
+
+    The postgrest client is built once per Client; with the service role key
+    no auth events replace it, so swapping its session here is enough.
+    """
+    rest = sb.postgrest
+    own = rest.session
+    rest.session = http_clients.sync_client("data", base_url=own.base_url, headers=own.headers)
+    own.close()
+
+
 def get_clinic_by_public_id(public_clinic_id: str) -> Optional[dict]:
     sb = get_supabase_client()
     res = (
@@ -45,6 +65,23 @@ def get_clinic_by_public_id(public_clinic_id: str) -> Optional[dict]:
     data = res.data or []
     return data[0] if data else None
 
+def upsert_clinics(rows: list[dict]) -> list[dict]:
+    """Multi-row upsert on clinic_id. All rows must carry the same columns."""
+    if not rows:
+        return []
+    sb = get_supabase_client()
+    res = sb.table("clinics").upsert(rows, on_conflict="clinic_id").execute()
+    return res.data or []
+
+def mark_onboarding_email_sent(public_clinic_id: str) -> None:
+    sb = get_supabase_client()
+    (
+        sb.table("clinics")
+        .update({"onboarding_email_sent_at": datetime.now(timezone.utc).isoformat()})
+        .eq("clinic_id", public_clinic_id)
+        .execute()
+    )
+
 def get_or_create_session(
         clinic_uuid: str,
         session_key: str,
@@ -132,17 +169,6 @@ def delete_session_messages(session_uuid: str) -> None:
     sb = get_supabase_client()
     sb.table("chat_messages").delete().eq("session_id", session_uuid).execute()
 
-def get_competitor_queries(limit: int = 50) -> list[dict]:
-    sb = get_supabase_client()
-    res = (
-        sb.table("competitor_queries")
-        .select("*, clinics(clinic_name, clinic_id)")
-        .order("created_at", desc=True)
-        .limit(limit)
-        .execute()
-    )
-    return res.data or []
-
 def insert_feedback(clinic_uuid: str, session_uuid: str, rating: str, comment: Optional[str]) -> None:
     sb = get_supabase_client()
     sb.table("chat_feedback").insert({
@@ -152,38 +178,339 @@ def insert_feedback(clinic_uuid: str, session_uuid: str, rating: str, comment: O
         "comment": comment,
     }).execute()
 
-def get_feedback_stats(limit: int = 100) -> list[dict]:
+def _project(row: dict, fields: list[str]) -> dict:
+    out = {f: row.get(f) for f in fields if f != "clinics"}
+    if "clinics" in fields:
+        clinic = row.get("clinics") or {}
+        out["clinics"] = {"clinic_name": clinic.get("clinic_name"), "clinic_id": clinic.get("clinic_id")} if clinic else None
+    return out
+
+def _date_range(query: Any, start_date: Optional[str], end_date: Optional[str]) -> Any:
+    if start_date:
+        query = query.gte("created_at", start_date)
+    if end_date:
+        query = query.lte("created_at", end_date)
+    return query
+
+def list_clinics(
+    fields: list[str],
+    cursor: Optional[tuple[str, str]] = None,
+    limit: int = 100,
+    clinic_id: Optional[str] = None,
+    plan: Optional[str] = None,
+    status: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+) -> tuple[list[dict], Optional[tuple[str, str]]]:
+    """One keyset page of clinics, newest first, with only `fields` in each row."""
     sb = get_supabase_client()
-    res = (
-        sb.table("chat_feedback")
-        .select("*, clinics(clinic_name, clinic_id)")
-        .order("created_at", desc=True)
-        .limit(limit)
-        .execute()
-    )
-    return res.data or []
+    select = ",".join(sorted(set(fields) | {"id", "created_at"}))
 
-def get_feedback_counts(start_date: Optional[str] = None, end_date: Optional[str] = None) -> list[dict]:
+    def build_query():
+        query = sb.table("clinics").select(select)
+        if clinic_id:
+            query = query.eq("clinic_id", clinic_id)
+        if plan:
+            query = query.eq("plan", plan)
+        if status:
+            query = query.eq("status", status)
+        return _date_range(query, start_date, end_date)
+
+    rows, next_cursor = fetch_keyset_page(build_query, cursor, limit)
+    return [_project(r, fields) for r in rows], next_cursor
+
+def _list_clinic_scoped(
+    table: str,
+    fields: list[str],
+    cursor: Optional[tuple[str, str]],
+    limit: int,
+    clinic_id: Optional[str],
+    plan: Optional[str],
+    status: Optional[str],
+    start_date: Optional[str],
+    end_date: Optional[str],
+    filters: Optional[dict] = None,
+) -> tuple[list[dict], Optional[tuple[str, str]]]:
+    """Keyset page over a table that references clinics, filterable by clinic attributes.
+
+    The clinics embed is only selected when asked for in `fields` or needed
+    for a filter (then as an inner join, so non-matching rows drop out).
+    """
     sb = get_supabase_client()
-    
-    # Use the database function (RPC) for efficient server-side aggregation
+    row_fields = [f for f in fields if f != "clinics"]
+    columns = sorted(set(row_fields) | {"id", "created_at"})
+    filter_by_clinic = bool(clinic_id or plan or status)
+    if "clinics" in fields or filter_by_clinic:
+        embed_cols = ["clinic_name", "clinic_id"] + [c for c, v in (("plan", plan), ("status", status)) if v]
+        columns.append(f"clinics{'!inner' if filter_by_clinic else ''}({','.join(embed_cols)})")
+    select = ",".join(columns)
+
+    def build_query():
+        query = sb.table(table).select(select)
+        if clinic_id:
+            query = query.eq("clinics.clinic_id", clinic_id)
+        if plan:
+            query = query.eq("clinics.plan", plan)
+        if status:
+            query = query.eq("clinics.status", status)
+        for column, value in (filters or {}).items():
+            if value is not None:
+                query = query.eq(column, value)
+        return _date_range(query, start_date, end_date)
+
+    rows, next_cursor = fetch_keyset_page(build_query, cursor, limit)
+    return [_project(r, fields) for r in rows], next_cursor
+
+def list_competitor_queries(
+    fields: list[str],
+    cursor: Optional[tuple[str, str]] = None,
+    limit: int = 50,
+    clinic_id: Optional[str] = None,
+    plan: Optional[str] = None,
+    status: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+) -> tuple[list[dict], Optional[tuple[str, str]]]:
+    return _list_clinic_scoped(
+        "competitor_queries", fields, cursor, limit, clinic_id, plan, status, start_date, end_date,
+    )
+
+def list_feedback(
+    fields: list[str],
+    cursor: Optional[tuple[str, str]] = None,
+    limit: int = 100,
+    clinic_id: Optional[str] = None,
+    plan: Optional[str] = None,
+    status: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    rating: Optional[str] = None,
+) -> tuple[list[dict], Optional[tuple[str, str]]]:
+    return _list_clinic_scoped(
+        "chat_feedback", fields, cursor, limit, clinic_id, plan, status, start_date, end_date,
+        filters={"rating": rating},
+    )
+
+def _feedback_count_params(start_date: Optional[str], end_date: Optional[str]) -> dict:
     params = {}
     if start_date:
         params["start_date"] = start_date
     if end_date:
         params["end_date"] = end_date
-        
-    res = sb.rpc("get_clinic_feedback_stats", params).execute()
+    return params
+
+def get_feedback_counts(start_date: Optional[str] = None, end_date: Optional[str] = None) -> list[dict]:
+    """Per-clinic up/down/total counts from the daily rollup table.
+
+    Cost depends on clinics x days in range, not on raw feedback volume.
+    Dates select whole UTC days: from start_date's day up to but excluding
+    end_date's day.
+    """
+    sb = get_supabase_client()
+    res = sb.rpc("get_clinic_feedback_rollup", _feedback_count_params(start_date, end_date)).execute()
     return res.data or []
 
-def export_feedback_data(start_date: Optional[str] = None, end_date: Optional[str] = None) -> list[dict]:
+def get_feedback_counts_raw(start_date: Optional[str] = None, end_date: Optional[str] = None) -> list[dict]:
+    """Same counts aggregated straight from chat_feedback (full scan); used for reconciliation."""
     sb = get_supabase_client()
-    query = sb.table("chat_feedback").select("*, clinics(clinic_name, clinic_id)").order("created_at", desc=True)
-    
-    if start_date:
-        query = query.gte("created_at", start_date)
-    if end_date:
-        query = query.lte("created_at", end_date)
-        
-    res = query.limit(5000).execute()
+    res = sb.rpc("get_clinic_feedback_stats", _feedback_count_params(start_date, end_date)).execute()
+    return res.data or []
+
+def _keyset_filter(cursor: tuple[str, str], desc: bool = True) -> str:
+    """PostgREST `or` filter for rows strictly after `cursor` in (created_at, id) order."""
+    created_at, row_id = cursor
+    op = "lt" if desc else "gt"
+    return f'created_at.{op}."{created_at}",and(created_at.eq."{created_at}",id.{op}.{row_id})'
+
+def _keyset_query(query: Any, cursor: Optional[tuple[str, str]], desc: bool = True) -> Any:
+    if cursor:
+        query = query.or_(_keyset_filter(cursor, desc))
+    direction = "desc" if desc else "asc"
+    # A single `order` param: postgrest-py's .order() would emit one per column.
+    query.params = query.params.add("order", f"created_at.{direction},id.{direction}")
+    return query
+
+def fetch_keyset_page(
+    build_query: Callable[[], Any],
+    cursor: Optional[tuple[str, str]] = None,
+    limit: int = 100,
+    desc: bool = True,
+) -> tuple[list[dict], Optional[tuple[str, str]]]:
+    """Fetch one page after `cursor`; returns (rows, cursor for the next page or None)."""
+    res = _keyset_query(build_query(), cursor, desc).limit(limit + 1).execute()
+    rows = res.data or []
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1]["created_at"], rows[-1]["id"])
+
+def iter_keyset_pages(build_query: Callable[[], Any], page_size: int = 1000, desc: bool = True) -> Iterator[list[dict]]:
+    """Yield pages of rows ordered by (created_at, id), one round-trip per page.
+
+    `build_query` must return a fresh, filtered select builder each call; the
+    selected columns must include `created_at` and `id`. Unlike offset paging
+    the cost of each page stays flat however deep the export goes.
+    """
+    cursor: Optional[tuple[str, str]] = None
+    while True:
+        query = _keyset_query(build_query(), cursor, desc)
+        res = query.limit(page_size).execute()
+        rows = res.data or []
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        cursor = (rows[-1]["created_at"], rows[-1]["id"])
+
+def iter_feedback_export(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    page_size: int = 1000,
+) -> Iterator[list[dict]]:
+    """Page through chat_feedback (newest first) for streaming exports."""
+    sb = get_supabase_client()
+
+    def build_query():
+        query = sb.table("chat_feedback").select("*, clinics(clinic_name, clinic_id)")
+        if start_date:
+            query = query.gte("created_at", start_date)
+        if end_date:
+            query = query.lte("created_at", end_date)
+        return query
+
+    return iter_keyset_pages(build_query, page_size=page_size)
+
+def iter_conversation_export(
+    clinic_uuid: str,
+    message_columns: list[str],
+    session_columns: list[str],
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    page_size: int = 2000,
+) -> Iterator[list[dict]]:
+    """Page through a clinic's chat_messages joined with their chat_sessions, oldest first.
+
+    Only the requested columns are fetched; `id` and `created_at` are always
+    included because they drive the keyset cursor.
+    """
+    sb = get_supabase_client()
+    msg_cols = sorted(set(message_columns) | {"id", "created_at"})
+    sess_cols = sorted(set(session_columns) | {"clinic_id"})
+    select = f"{','.join(msg_cols)},chat_sessions!inner({','.join(sess_cols)})"
+
+    def build_query():
+        query = sb.table("chat_messages").select(select).eq("chat_sessions.clinic_id", clinic_uuid)
+        if start_date:
+            query = query.gte("created_at", start_date)
+        if end_date:
+            query = query.lte("created_at", end_date)
+        return query
+
+    return iter_keyset_pages(build_query, page_size=page_size, desc=False)
+
+def iter_active_clinics(page_size: int = 500) -> Iterator[list[dict]]:
+    """Page through active clinics, newest first, as full rows (the shape the clinic cache stores)."""
+    sb = get_supabase_client()
+    return iter_keyset_pages(
+        lambda: sb.table("clinics").select("*").eq("status", "active"),
+        page_size=page_size,
+    )
+
+def iter_retention_clinics(page_size: int = 500) -> Iterator[list[dict]]:
+    """Page through clinics with the fields the retention job needs."""
+    sb = get_supabase_client()
+    return iter_keyset_pages(
+        lambda: sb.table("clinics").select("id,clinic_id,plan,retention_days,created_at"),
+        page_size=page_size,
+        desc=False,
+    )
+
+def iter_expired_messages(clinic_uuid: str, cutoff: str, page_size: int = 500) -> Iterator[list[dict]]:
+    """Page through a clinic's chat_messages older than `cutoff`, oldest first."""
+    sb = get_supabase_client()
+    return iter_keyset_pages(
+        lambda: (
+            sb.table("chat_messages")
+            .select("id,session_id,role,content,created_at,chat_sessions!inner(clinic_id)")
+            .eq("chat_sessions.clinic_id", clinic_uuid)
+            .lt("created_at", cutoff)
+        ),
+        page_size=page_size,
+        desc=False,
+    )
+
+def get_session_archives(session_uuids: list[str]) -> list[dict]:
+    sb = get_supabase_client()
+    res = sb.table("chat_session_archives").select("*").in_("session_id", session_uuids).execute()
+    return res.data or []
+
+def upsert_session_archives(rows: list[dict]) -> None:
+    sb = get_supabase_client()
+    sb.table("chat_session_archives").upsert(rows, on_conflict="session_id").execute()
+
+def delete_messages(message_ids: list[str], chunk_size: int = 100) -> None:
+    """Delete chat_messages by id, in chunks that keep the request URL short."""
+    sb = get_supabase_client()
+    for i in range(0, len(message_ids), chunk_size):
+        sb.table("chat_messages").delete().in_("id", message_ids[i:i + chunk_size]).execute()
+
+def ensure_message_partitions(months_ahead: int = 3) -> list[str]:
+    sb = get_supabase_client()
+    res = sb.rpc("ensure_chat_messages_partitions", {"months_ahead": months_ahead}).execute()
+    return res.data or []
+
+_ACTIVE_MAIL_STATUSES = ["queued", "sending", "retrying"]
+
+def insert_mail_delivery(row: dict) -> bool:
+    """Insert a mail_deliveries row; False if its idempotency_key is already taken."""
+    sb = get_supabase_client()
+    res = sb.table("mail_deliveries").upsert(row, on_conflict="idempotency_key", ignore_duplicates=True).execute()
+    return bool(res.data)
+
+def get_mail_delivery(delivery_id: str) -> Optional[dict]:
+    sb = get_supabase_client()
+    res = sb.table("mail_deliveries").select("*").eq("id", delivery_id).limit(1).execute()
+    return res.data[0] if res.data else None
+
+def get_mail_delivery_by_key(idempotency_key: str) -> Optional[dict]:
+    sb = get_supabase_client()
+    res = sb.table("mail_deliveries").select("*").eq("idempotency_key", idempotency_key).limit(1).execute()
+    return res.data[0] if res.data else None
+
+def update_mail_delivery(delivery_id: str, fields: dict) -> None:
+    sb = get_supabase_client()
+    sb.table("mail_deliveries").update(fields).eq("id", delivery_id).execute()
+
+def claim_mail_deliveries(worker: str, stale_seconds: int, max_rows: int) -> list[dict]:
+    """Take over unsent deliveries nobody has touched for `stale_seconds` (see the migration)."""
+    sb = get_supabase_client()
+    res = sb.rpc(
+        "claim_mail_deliveries",
+        {"worker": worker, "stale_seconds": stale_seconds, "max_rows": max_rows},
+    ).execute()
     return res.data or []
+
+def touch_mail_deliveries(worker: str, delivery_ids: list[str], chunk_size: int = 100) -> None:
+    """Refresh this worker's claim on deliveries it still has queued, so no one else takes them."""
+    sb = get_supabase_client()
+    now = datetime.now(timezone.utc).isoformat()
+    for i in range(0, len(delivery_ids), chunk_size):
+        (
+            sb.table("mail_deliveries")
+            .update({"claimed_at": now})
+            .eq("claimed_by", worker)
+            .in_("id", delivery_ids[i:i + chunk_size])
+            .execute()
+        )
+
+def release_mail_deliveries(worker: str) -> None:
+    """Drop this worker's claim on unsent deliveries so the next claim picks them up at once."""
+    sb = get_supabase_client()
+    (
+        sb.table("mail_deliveries")
+        .update({"claimed_by": None, "claimed_at": None})
+        .eq("claimed_by", worker)
+        .in_("status", _ACTIVE_MAIL_STATUSES)
+        .execute()
+    )
@@ -0,0 +1,85 @@
+"""Request deadlines shared by every stage of a chat request.
+
+The widget stops waiting after about 20 seconds, so anything still running
+after that is wasted work. A `Deadline` is created when the request starts
+(CHAT_DEADLINE_SECONDS) and each stage runs inside whatever is left of it:
+
+    deadline = Deadline(settings.chat_deadline_seconds)
+    clinic = await deadline.run("clinic_lookup", get_clinic, clinic_id)
+    history = await deadline.run("history_fetch", fetch, reserve=8.0)
+    reply = await deadline.wait("llm_total", chat_completion(...))
+
+`reserve` keeps time back for later stages: a stage is skipped outright if
+the remaining budget minus `reserve` is gone. Skipped and timed-out stages
+raise DeadlineExceeded and are counted in deadline_exceeded_total.
+
+Blocking calls (the Supabase client is synchronous) run in a thread, so the
+request stops waiting at the deadline even though the call itself finishes
+in the background, bounded by the data pool's timeouts.
+
+Production runs on Python 3.9 (render.yaml), so this uses asyncio.wait_for
+rather than asyncio.timeout() and calls __anext__() directly.
+"""
+import asyncio
+import time
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
+from app.metrics import count_deadline
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage: str) -> None:
+        super().__init__(f"deadline exceeded in {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    def __init__(self, seconds: float) -> None:
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self, reserve: float = 0.0) -> float:
+        return max(0.0, self.expires_at - reserve - time.monotonic())
+
+    def _exceeded(self, stage: str, outcome: str) -> DeadlineExceeded:
+        count_deadline(stage, outcome)
+        return DeadlineExceeded(stage)
+
+    async def run(self, stage: str, fn: Callable[..., T], *args, reserve: float = 0.0, **kwargs) -> T:
+        """Run blocking `fn` in a thread, giving up when the budget (less `reserve`) runs out."""
+        budget = self.remaining(reserve)
+        if budget <= 0:
+            raise self._exceeded(stage, "skipped")
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(fn, *args, **kwargs), budget)
+        except asyncio.TimeoutError:
+            raise self._exceeded(stage, "timed_out") from None
+
+    async def wait(self, stage: str, aw: Awaitable[T]) -> T:
+        """Await `aw` with the remaining budget; it is cancelled at the deadline."""
+        if self.remaining() <= 0:
+            if asyncio.iscoroutine(aw):
+                aw.close()
+            raise self._exceeded(stage, "skipped")
+        try:
+            return await asyncio.wait_for(aw, self.remaining())
+        except asyncio.TimeoutError:
+            raise self._exceeded(stage, "timed_out") from None
+
+    async def iterate(self, stage: str, agen: AsyncIterator[T]) -> AsyncIterator[T]:
+        """Yield from `agen` until it ends or the deadline passes (then DeadlineExceeded)."""
+        try:
+            while True:
+                # The timeout only covers waiting for the next item, never our consumer.
+                try:
+                    item = await asyncio.wait_for(agen.__anext__(), self.remaining())
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise self._exceeded(stage, "timed_out") from None
+                yield item
+        finally:
+            aclose = getattr(agen, "aclose", None)
+            if aclose is not None:
+                await aclose()
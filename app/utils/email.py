@@ -1,41 +1,48 @@
-
-import smtplib
-from email.message import EmailMessage
+from email.message import EmailMessage, Message
 from app.config import settings
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from app.services.mailer import LeadDigest, SMTPPool, mail_queue
 import os
-from typing import Optional
+from typing import Callable, List, Optional
 
 
 _TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), '..', 'templates')
-_env = Environment(
-    loader=FileSystemLoader(_TEMPLATES_DIR),
-    autoescape=select_autoescape(['html', 'xml'])
-)
+# Built on first render; most requests never send mail.
+_env = None
+
+# Pool for synchronous sends (weekly summary, scripts); queued mail uses mail_queue's own pool.
+_direct_pool: Optional[SMTPPool] = None
+
+
+def _get_env():
+    global _env
+    if _env is None:
+        from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+        _env = Environment(
+            loader=FileSystemLoader(_TEMPLATES_DIR),
+            autoescape=select_autoescape(['html', 'xml'])
+        )
+    return _env
 
 
 def _render_template(name: str, context: dict) -> str:
-    tpl = _env.get_template(name)
+    tpl = _get_env().get_template(name)
     return tpl.render(**context)
 
 
-def _send_message(msg: EmailMessage) -> bool:
+def send_message(msg: Message) -> bool:
+    """Send one message now over the pooled SMTP connections; False if it failed."""
+    global _direct_pool
+    if _direct_pool is None:
+        _direct_pool = SMTPPool.from_settings()
     try:
-        with smtplib.SMTP(settings.smtp_host, settings.smtp_port, timeout=10) as s:
-            s.starttls()
-            if settings.smtp_user and settings.smtp_password:
-                s.login(settings.smtp_user, settings.smtp_password)
-            s.send_message(msg)
+        _direct_pool.send(msg)
         return True
     except Exception:
         return False
 
 
-def send_lead_email(to_email: str, clinic_name: str, lead: dict, logo_url: Optional[str] = None, theme: Optional[str] = None):
-    """Send a CRM-style lead notification email (HTML + plain-text fallback)."""
-    if not to_email:
-        return False
-
+def build_lead_email(to_email: str, clinic_name: str, lead: dict, logo_url: Optional[str] = None, theme: Optional[str] = None) -> EmailMessage:
     html = _render_template('lead_email.html', { 'clinic_name': clinic_name, 'lead': lead, 'logo_url': logo_url, 'theme': theme })
     text = f"New lead: {lead.get('name')} — {lead.get('phone')} — {lead.get('email')}\nMessage: {lead.get('message')}"
 
@@ -43,19 +50,57 @@ def send_lead_email(to_email: str, clinic_name: str, lead: dict, logo_url: Optio
     msg['Subject'] = f"New lead from {clinic_name or 'Dental Bot'}"
     msg['From'] = settings.email_from
     msg['To'] = to_email
-    
+
     if lead.get('email'):
         msg['Reply-To'] = lead.get('email')
 
     msg.set_content(text)
     msg.add_alternative(html, subtype='html')
+    return msg
 
-    return _send_message(msg)
 
-def send_onboarding_email(to_email: str, clinic_name: str, snippet: str, logo_url: Optional[str] = None, preview_text: Optional[str] = None):
+def build_lead_digest_email(to_email: str, clinic_name: str, leads: List[dict]) -> EmailMessage:
+    html = _render_template('lead_digest_email.html', { 'clinic_name': clinic_name, 'leads': leads })
+    text = "\n\n".join(
+        f"New lead: {l.get('name')} — {l.get('phone')} — {l.get('email')}\nMessage: {l.get('message')}"
+        for l in leads
+    )
+
+    msg = EmailMessage()
+    msg['Subject'] = f"{len(leads)} new lead{'s' if len(leads) != 1 else ''} from {clinic_name or 'Dental Bot'}"
+    msg['From'] = settings.email_from
+    msg['To'] = to_email
+    msg.set_content(text)
+    msg.add_alternative(html, subtype='html')
+    return msg
+
+
+lead_digest = LeadDigest(mail_queue, build_lead_digest_email)
+
+
+def send_lead_email(to_email: str, clinic_name: str, lead: dict, logo_url: Optional[str] = None, theme: Optional[str] = None):
+    """Send a CRM-style lead notification email (HTML + plain-text fallback)."""
     if not to_email:
         return False
 
+    return send_message(build_lead_email(to_email, clinic_name, lead, logo_url, theme))
+
+
+def queue_lead_email(to_email: str, clinic_name: str, lead: dict, digest_minutes: Optional[int] = None) -> bool:
+    """Hand a lead notification to the mail queue, or to the clinic's digest if it has one.
+
+    Must be called from the event loop. Returns False when the queue is not
+    running or full, so the caller can fall back to a direct send.
+    """
+    if not to_email:
+        return False
+    if digest_minutes and mail_queue.running:
+        lead_digest.add(to_email, clinic_name, lead, window_seconds=digest_minutes * 60)
+        return True
+    return mail_queue.submit(build_lead_email(to_email, clinic_name, lead))
+
+
+def build_onboarding_email(to_email: str, clinic_name: str, snippet: str, logo_url: Optional[str] = None, preview_text: Optional[str] = None) -> EmailMessage:
     html = _render_template('onboarding_email.html', { 'clinic_name': clinic_name, 'snippet': snippet, 'logo_url': logo_url, 'preview_text': preview_text })
     text = f"Welcome to Dental Bot. Paste this snippet into your site's HTML:\n\n{snippet}\n"
 
@@ -65,5 +110,44 @@ def send_onboarding_email(to_email: str, clinic_name: str, snippet: str, logo_ur
     msg['To'] = to_email
     msg.set_content(text)
     msg.add_alternative(html, subtype='html')
+    return msg
+
+
+def send_onboarding_email(to_email: str, clinic_name: str, snippet: str, logo_url: Optional[str] = None, preview_text: Optional[str] = None):
+    if not to_email:
+        return False
+
+    return send_message(build_onboarding_email(to_email, clinic_name, snippet, logo_url, preview_text))
+
+
+def queue_onboarding_email(
+    clinic_id: str,
+    to_email: str,
+    clinic_name: str,
+    snippet: str,
+    logo_url: Optional[str] = None,
+    preview_text: Optional[str] = None,
+    on_sent: Optional[Callable[[], None]] = None,
+) -> Optional[str]:
+    """Queue the onboarding email once per clinic and return its delivery id.
+
+    Re-queuing while an earlier onboarding email for the same clinic is
+    queued or sent returns the earlier delivery id. Returns None when the
+    queue is not running or full.
+    """
+    if not to_email:
+        return None
+    msg = build_onboarding_email(to_email, clinic_name, snippet, logo_url, preview_text)
+    return mail_queue.enqueue(msg, idempotency_key=f"onboarding:{clinic_id}", on_sent=on_sent)
+
+
+async def start_mail() -> None:
+    await mail_queue.start()
+
 
-    return _send_message(msg)
+async def stop_mail() -> None:
+    """Flush pending lead digests into the queue, then drain and close it."""
+    lead_digest.flush_all()
+    await mail_queue.stop()
+    if _direct_pool is not None:
+        _direct_pool.close()
@@ -0,0 +1,6 @@
+import orjson
+
+
+def ndjson_line(obj) -> bytes:
+    """One NDJSON record: compact JSON plus a trailing newline, as bytes."""
+    return orjson.dumps(obj) + b"\n"
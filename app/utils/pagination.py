@@ -0,0 +1,55 @@
+import base64
+import json
+import re
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+_FRACTION_RE = re.compile(r"(\.)(\d+)")
+
+
+def encode_cursor(cursor: Optional[Tuple[str, str]]) -> Optional[str]:
+    """Opaque, URL-safe token for a (created_at, id) keyset position."""
+    if not cursor:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode()).decode().rstrip("=")
+
+
+def parse_timestamp(value: str) -> datetime:
+    """datetime.fromisoformat for PostgREST timestamps, on every supported Python."""
+    # PostgREST trims trailing zeros from fractional seconds and may send "Z";
+    # fromisoformat before 3.11 only takes 3 or 6 digits and "+00:00".
+    value = _FRACTION_RE.sub(lambda m: m.group(1) + m.group(2).ljust(6, "0")[:6], value)
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    return datetime.fromisoformat(value)
+
+
+def decode_cursor(token: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Inverse of encode_cursor; raises ValueError on a malformed token.
+
+    The values end up in a PostgREST filter, so only a [timestamp, uuid]
+    pair is accepted and both are returned in canonical form.
+    """
+    if not token:
+        return None
+    try:
+        value = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if not isinstance(value, list) or len(value) != 2 or not all(isinstance(v, str) for v in value):
+            raise ValueError("not a [created_at, id] pair")
+        created_at = parse_timestamp(value[0])
+        row_id = uuid.UUID(value[1])
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+    return created_at.isoformat(), str(row_id)
+
+
+def parse_fields(fields: Optional[str], allowed: List[str], default: List[str]) -> List[str]:
+    """Validate a comma-separated column projection against an allow-list."""
+    if not fields:
+        return list(default)
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return selected
@@ -0,0 +1,69 @@
+"""Multi-worker support: post-fork reset and a startup check for process-local state.
+
+With several workers (gunicorn.conf.py, or `uvicorn --workers`), anything
+kept in a module-level dict is private to one worker. Some of that is fine:
+the clinic cache is bounded by its TTL, and each worker has its own mail
+pool. Some of it changes behaviour. Rate limits multiply by the worker
+count, the compat heartbeat queue loses messages, and metrics only cover
+the worker that was scraped. `check_shared_state()` logs a warning for each
+such item at startup so a scaled-out deploy does not degrade silently.
+"""
+import logging
+import os
+from typing import List
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def process_local_state(workers: int) -> List[str]:
+    """State that should be shared across `workers` workers but is kept per process."""
+    issues = [
+        f"/chat rate limit (app/utils/rate_limit.py) counts per worker: a client gets up to {workers}x the limit",
+        "backward-compat /heartbeat message queue and /feedback stats (_OLD_API_* in app/main.py) are per worker",
+    ]
+    if not settings.redis_url:
+        issues += [
+            f"REDIS_URL is not set: /lead rate limits count per worker ({workers}x the limit)",
+            "REDIS_URL is not set: lead idempotency keys are per worker, so a retried lead on another worker is saved twice",
+        ]
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        issues.append("PROMETHEUS_MULTIPROC_DIR is not set: /metrics only reports the worker that answers the scrape")
+    issues.append("model tier feedback (app/services/model_tier.py) is only attributed when it reaches the worker that answered the session")
+    issues.append("lead digest batches are per worker: a clinic with lead_digest_minutes gets one digest per worker per window")
+    from app.services.mailer import default_delivery_store
+
+    if default_delivery_store() is None:
+        issues.append(
+            "mail deliveries are not stored (Supabase not configured or MAIL_PERSIST_DELIVERIES off): "
+            "/admin/mail/{id} only knows the worker's own deliveries, and queued mail is lost on restart"
+        )
+    issues.append("GET /admin/cron/retention reports the last run of the worker that answers (retention_service.LAST_REPORT)")
+    return issues
+
+
+def check_shared_state() -> List[str]:
+    """Warn about process-local state when running more than one worker (WEB_CONCURRENCY)."""
+    workers = settings.web_concurrency
+    if workers <= 1:
+        return []
+    issues = process_local_state(workers)
+    for issue in issues:
+        logger.warning("Process-local state with multiple workers", extra={"workers": workers, "issue": issue})
+    return issues
+
+
+def reset_after_fork() -> None:
+    """Drop clients a preloading master may have built; each worker creates its own on first use.
+
+    Sockets and connection pools must not be shared across processes.
+    """
+    from app import http_clients, supabase_db
+    from app.services import llm
+    from app.utils import email
+
+    http_clients.reset()
+    supabase_db._sb = None
+    llm._client = None
+    email._direct_pool = None
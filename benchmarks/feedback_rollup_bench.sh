@@ -0,0 +1,84 @@
+#!/bin/bash
+# Benchmark: raw get_clinic_feedback_stats vs the chat_feedback_daily rollup.
+#
+# Needs a local Postgres 13+ and psql; connection comes from the usual libpq
+# env vars (PGHOST, PGPORT, PGUSER, PGPASSWORD). For example:
+#   docker run -d --name pg-bench -e POSTGRES_PASSWORD=postgres -p 5432:5432 postgres:16
+#   PGHOST=localhost PGUSER=postgres PGPASSWORD=postgres bash benchmarks/feedback_rollup_bench.sh
+#
+# Usage: bash benchmarks/feedback_rollup_bench.sh [feedback_rows]   (default 1000000)
+# The scratch database ($BENCH_DB, default dental_bot_bench) is dropped and recreated.
+
+set -e
+
+ROWS="${1:-1000000}"
+BENCH_DB="${BENCH_DB:-dental_bot_bench}"
+ROOT="$(cd "$(dirname "$0")/.." && pwd)"
+PSQL="psql -X -q -v ON_ERROR_STOP=1 -d $BENCH_DB"
+
+echo "== Preparing $BENCH_DB with $ROWS feedback rows"
+dropdb --if-exists "$BENCH_DB"
+createdb "$BENCH_DB"
+$PSQL -f "$ROOT/benchmarks/sql/bootstrap.sql"
+for f in 20240524000000 20240524000001 20240524000002; do
+    $PSQL -f "$ROOT"/app/routes/${f}_*.sql
+done
+$PSQL -v clinics=300 -v sessions=50000 -v messages_per_session=0 -v feedback="$ROWS" -v competitor=0 \
+    -f "$ROOT/benchmarks/sql/seed.sql"
+
+echo "== Raw aggregation (get_clinic_feedback_stats)"
+$PSQL <<'SQL'
+\timing on
+select count(*) as clinics from get_clinic_feedback_stats(now() - interval '7 days', now());
+select count(*) as clinics from get_clinic_feedback_stats(now() - interval '7 days', now());
+select count(*) as clinics from get_clinic_feedback_stats(null, null);
+\timing off
+explain (analyze, buffers, costs off)
+select f.clinic_id, c.clinic_name,
+       count(*) filter (where f.rating = 'up'), count(*) filter (where f.rating = 'down'), count(*)
+from chat_feedback f left join clinics c on f.clinic_id = c.id
+where f.created_at >= now() - interval '7 days' and f.created_at <= now()
+group by f.clinic_id, c.clinic_name;
+\echo '-- 10k-row insert without trigger'
+\timing on
+insert into chat_feedback (clinic_id, session_id, rating, created_at)
+select clinic_id, id, 'up', now() from chat_sessions limit 10000;
+\timing off
+SQL
+
+echo "== Applying rollup migration (includes backfill)"
+time $PSQL -f "$ROOT/app/routes/20240524000003_create_feedback_daily_rollup.sql"
+
+echo "== Rollup (get_clinic_feedback_rollup)"
+$PSQL <<'SQL'
+\timing on
+select count(*) as clinics from get_clinic_feedback_rollup(now() - interval '7 days', now());
+select count(*) as clinics from get_clinic_feedback_rollup(now() - interval '7 days', now());
+select count(*) as clinics from get_clinic_feedback_rollup(null, null);
+\timing off
+explain (analyze, buffers, costs off)
+select d.clinic_id, c.clinic_name, sum(d.up), sum(d.down), sum(d.total)
+from chat_feedback_daily d left join clinics c on d.clinic_id = c.id
+where d.day >= (now() - interval '7 days')::date and d.day <= now()::date
+group by d.clinic_id, c.clinic_name;
+\echo '-- 10k-row insert with statement-level rollup trigger'
+\timing on
+insert into chat_feedback (clinic_id, session_id, rating, created_at)
+select clinic_id, id, 'down', now() from chat_sessions limit 10000;
+\echo '-- 200 single-row inserts with trigger'
+do $$
+declare s record;
+begin
+    for s in select clinic_id, id from chat_sessions limit 200 loop
+        insert into chat_feedback (clinic_id, session_id, rating) values (s.clinic_id, s.id, 'up');
+    end loop;
+end;
+$$;
+\timing off
+\echo '-- Reconciliation: clinics whose rollup totals differ from a raw scan (expect 0)'
+select count(*) as mismatches
+from get_clinic_feedback_stats(null, null) r
+full join get_clinic_feedback_rollup(null, null) d using (clinic_id)
+where r.clinic_id is not null
+  and (r.up, r.down, r.total) is distinct from (d.up, d.down, d.total);
+SQL
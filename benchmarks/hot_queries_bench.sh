@@ -0,0 +1,45 @@
+#!/bin/bash
+# Benchmark: EXPLAIN ANALYZE of the chat hot-path queries before and after the
+# index (20240524000004) and chat_messages partitioning (20240524000005) migrations.
+#
+# Needs a local Postgres 13+ and psql; connection comes from the usual libpq
+# env vars (PGHOST, PGPORT, PGUSER, PGPASSWORD). For example:
+#   docker run -d --name pg-bench -e POSTGRES_PASSWORD=postgres -p 5432:5432 postgres:16
+#   PGHOST=localhost PGUSER=postgres PGPASSWORD=postgres bash benchmarks/hot_queries_bench.sh
+#
+# Usage: bash benchmarks/hot_queries_bench.sh [sessions]   (default 200000, 10 messages each)
+# The scratch database ($BENCH_DB, default dental_bot_bench) is dropped and recreated.
+
+set -e
+
+SESSIONS="${1:-200000}"
+BENCH_DB="${BENCH_DB:-dental_bot_bench}"
+ROOT="$(cd "$(dirname "$0")/.." && pwd)"
+PSQL="psql -X -q -v ON_ERROR_STOP=1 -d $BENCH_DB"
+
+echo "== Preparing $BENCH_DB with $SESSIONS sessions"
+dropdb --if-exists "$BENCH_DB"
+createdb "$BENCH_DB"
+$PSQL -f "$ROOT/benchmarks/sql/bootstrap.sql"
+for f in 20240524000000 20240524000001 20240524000002 20240524000003; do
+    $PSQL -f "$ROOT"/app/routes/${f}_*.sql 2>/dev/null
+done
+$PSQL -v clinics=500 -v sessions="$SESSIONS" -v messages_per_session=10 \
+    -v feedback="$SESSIONS" -v competitor="$((SESSIONS / 4))" \
+    -f "$ROOT/benchmarks/sql/seed.sql"
+
+echo
+echo "################ BEFORE ################"
+$PSQL -f "$ROOT/benchmarks/sql/hot_queries.sql"
+
+echo
+echo "== Applying index and partitioning migrations"
+time {
+    $PSQL -f "$ROOT/app/routes/20240524000004_add_hot_path_indexes.sql"
+    $PSQL -f "$ROOT/app/routes/20240524000005_partition_chat_messages.sql"
+}
+$PSQL -c "analyze"
+
+echo
+echo "################ AFTER ################"
+$PSQL -f "$ROOT/benchmarks/sql/hot_queries.sql"
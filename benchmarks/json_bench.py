@@ -0,0 +1,104 @@
+"""Before/after JSON serialization benchmark on payloads shaped like the API's.
+
+Compares the stdlib encoders the app used (json.dumps for NDJSON chunks,
+Starlette's JSONResponse for route results) with orjson (ORJSONResponse and
+app.utils.ndjson.ndjson_line), and shows what gzip saves on each payload.
+FastAPI runs jsonable_encoder before either renderer for plain dict returns;
+that cost is listed separately since it is the same for both.
+
+Usage: python benchmarks/json_bench.py [--number N]
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import timeit
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from app.utils.ndjson import ndjson_line
+
+NOW = datetime(2024, 5, 24, tzinfo=timezone.utc)
+
+
+def _ts(i: int) -> str:
+    return (NOW - timedelta(minutes=i)).isoformat()
+
+
+def chat_history(n: int = 50) -> dict:
+    """GET /chat/history: the last 50 messages of a session."""
+    text = "Hej! Vi har öppet 8–17 på vardagar. Tandblekning kostar 2 500–3 900 kr beroende på metod. "
+    return {"history": [
+        {"role": "user" if i % 2 else "assistant", "content": text * (1 + i % 4), "created_at": _ts(i)}
+        for i in range(n)
+    ]}
+
+
+def clinic_listing(n: int = 500) -> dict:
+    """GET /admin/clinics?fields=... : a full page with most columns."""
+    return {"clinics": [
+        {
+            "id": str(uuid.UUID(int=i)), "clinic_id": f"clinic-{i:05d}", "clinic_name": f"Smile Clinic {i}",
+            "status": "active", "plan": ("free", "pro", "enterprise")[i % 3], "created_at": _ts(i),
+            "location": f"Storgatan {i}, Stockholm", "opening_hours": "Mon-Fri 08-17",
+            "booking_url": f"https://book.example.com/{i}", "contact_phone": "+46 8 123 45 67",
+            "contact_email": f"info{i}@example.com", "languages": ["sv", "en"],
+            "services": ["Cleaning", "Whitening", "Implants", "Orthodontics"], "retention_days": None,
+        }
+        for i in range(n)
+    ], "next_cursor": "eyJ0IjoiMjAyNC0wNS0yNCIsImlkIjoiMSJ9"}
+
+
+def feedback_page(n: int = 500) -> dict:
+    """GET /admin/feedback-stats: feedback rows with the embedded clinic name."""
+    return {"feedback": [
+        {
+            "id": str(uuid.UUID(int=i)), "clinic_id": str(uuid.UUID(int=i % 40)), "session_id": str(uuid.UUID(int=10**6 + i)),
+            "rating": "up" if i % 3 else "down", "comment": "Snabbt svar, tack!" if i % 5 == 0 else None,
+            "created_at": _ts(i), "clinics": {"clinic_name": f"Smile Clinic {i % 40}", "clinic_id": f"clinic-{i % 40:05d}"},
+        }
+        for i in range(n)
+    ], "next_cursor": None}
+
+
+def stream_chunks(n: int = 400) -> list:
+    """/chat?stream=true: one {"text": ...} line per LLM delta, then the done line."""
+    return [{"text": " tand" if i % 2 else "läkare"} for i in range(n)] + [{"done": True, "booking_url": "https://book.example.com/1"}]
+
+
+def _bench(fn, number: int) -> float:
+    """Best-of-5 microseconds per call."""
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'payload':<16}{'bytes':>9}{'gzip':>8}{'encoder':>11}{'stdlib us':>11}{'orjson us':>11}{'speedup':>9}")
+    for name, payload in (("chat_history", chat_history()), ("clinic_listing", clinic_listing()), ("feedback_page", feedback_page())):
+        body = ORJSONResponse(payload).body
+        assert json.loads(body) == json.loads(JSONResponse(payload).body)
+        encoder = _bench(lambda: jsonable_encoder(payload), max(args.number // 10, 5))
+        before = _bench(lambda: JSONResponse(payload).body, args.number)
+        after = _bench(lambda: ORJSONResponse(payload).body, args.number)
+        print(f"{name:<16}{len(body):>9}{len(gzip.compress(body, 6)):>8}{encoder:>11.0f}{before:>11.0f}{after:>11.0f}{before / after:>8.1f}x")
+
+    chunks = stream_chunks()
+    body = b"".join(ndjson_line(c) for c in chunks)
+    before = _bench(lambda: [(json.dumps(c) + "\n").encode() for c in chunks], args.number)
+    after = _bench(lambda: [ndjson_line(c) for c in chunks], args.number)
+    print(f"{'ndjson_stream':<16}{len(body):>9}{'-':>8}{'-':>11}{before:>11.0f}{after:>11.0f}{before / after:>8.1f}x")
+    print("\nencoder = FastAPI's jsonable_encoder pass (unchanged); route handlers that return "
+          "an ORJSONResponse directly skip it. ndjson_stream is not gzipped (streams are excluded).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Benchmark for the clinic knowledge index (app/services/knowledge.py).
+
+For a few synthetic clinic corpus sizes it reports:
+  - build: total time to ingest every document one upload at a time, and
+    the cost of the last upload (re-indexing one document into a full index)
+  - storage: raw text bytes vs the compressed file, and the time to load
+    (decompress + rebuild postings) it in a fresh worker
+  - memory: bytes the built index keeps alive (tracemalloc)
+  - query: search latency p50/p95/p99 for 2-8 word questions, and
+    retrieve() with the default top-k and token budget
+
+Documents are built from a Zipf-weighted vocabulary of clinic words and
+filler, so term frequencies look like real FAQ text. Results are printed
+and saved to benchmarks/results/knowledge-<timestamp>.json.
+
+Usage: python benchmarks/knowledge.py [--sizes 20,100,500] [--words 300] [--queries 1000]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from statistics import quantiles
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import orjson
+
+from app.services import knowledge
+from app.services.knowledge import KnowledgeIndex
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+DOMAIN = (
+    "implant crown veneer whitening cleaning checkup filling extraction root canal braces invisalign aligner "
+    "price cost fee insurance coverage payment invoice installment booking appointment cancel reschedule "
+    "opening hours saturday evening parking address emergency pain swelling anaesthesia sedation child "
+    "pregnant x-ray hygienist dentist orthodontist gum bleeding sensitive enamel plaque tartar fluoride "
+    "warranty aftercare recovery visit consultation referral senior student discount kr sek"
+).split()
+FILLER = (
+    "the a and of to in for with our your we you is are be can will may on at by from about after before "
+    "during each every more most other some such than then there these this those when where which while "
+    "patients clinic team treatment time week day month year first next usually often also please contact"
+).split()
+
+
+def _vocabulary(rng: random.Random, extra: int = 3000) -> List[str]:
+    letters = "abcdefghijklmnoprstuvy"
+    made = {"".join(rng.choice(letters) for _ in range(rng.randint(4, 10))) for _ in range(extra)}
+    return FILLER + DOMAIN + sorted(made)
+
+
+def corpus(n_docs: int, words_per_doc: int, seed: int = 7) -> List[tuple]:
+    rng = random.Random(seed)
+    vocab = _vocabulary(rng)
+    weights = [1 / (rank + 1) for rank in range(len(vocab))]
+    docs = []
+    for i in range(n_docs):
+        words = rng.choices(vocab, weights, k=words_per_doc)
+        # Paragraphs of 30-90 words with sentence ends, like an FAQ page.
+        paragraphs, pos = [], 0
+        while pos < len(words):
+            size = rng.randint(30, 90)
+            chunk = words[pos:pos + size]
+            sentences = [" ".join(chunk[j:j + 12]).capitalize() + "." for j in range(0, len(chunk), 12)]
+            paragraphs.append(" ".join(sentences))
+            pos += size
+        docs.append((f"doc-{i:04d}", f"{rng.choice(DOMAIN).title()} FAQ {i}", "\n\n".join(paragraphs)))
+    return docs
+
+
+def queries(n: int, seed: int = 11) -> List[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(DOMAIN + FILLER, k=rng.randint(2, 8))) + "?" for _ in range(n)]
+
+
+def _percentiles(samples: List[float]) -> dict:
+    cuts = quantiles(samples, n=100)
+    return {"p50_us": round(cuts[49] * 1e6, 1), "p95_us": round(cuts[94] * 1e6, 1), "p99_us": round(cuts[98] * 1e6, 1)}
+
+
+def bench_size(n_docs: int, words_per_doc: int, n_queries: int) -> dict:
+    docs = corpus(n_docs, words_per_doc)
+    raw_bytes = sum(len(text.encode("utf-8")) for _, _, text in docs)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    index = KnowledgeIndex()
+    per_upload = []
+    for doc_id, title, text in docs:
+        start = time.perf_counter()
+        index.add_document(doc_id, title, text)
+        per_upload.append(time.perf_counter() - start)
+    gc.collect()
+    index_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    # Re-upload one document into the full index (replace = remove + add).
+    doc_id, title, text = docs[len(docs) // 2]
+    start = time.perf_counter()
+    index.add_document(doc_id, title, text)
+    replace_seconds = time.perf_counter() - start
+
+    stored = index.to_bytes()
+    start = time.perf_counter()
+    KnowledgeIndex.from_bytes(stored)
+    load_seconds = time.perf_counter() - start
+
+    qs = queries(n_queries)
+    search_times = []
+    for q in qs:
+        start = time.perf_counter()
+        index.search(q, 5)
+        search_times.append(time.perf_counter() - start)
+
+    # retrieve() end to end: file-change check, search, budget packing.
+    knowledge._save("bench-clinic", index)
+    retrieve_times = []
+    for q in qs:
+        start = time.perf_counter()
+        knowledge.retrieve("bench-clinic", q)
+        retrieve_times.append(time.perf_counter() - start)
+
+    return {
+        "documents": n_docs,
+        "words": n_docs * words_per_doc,
+        "passages": index.live,
+        "terms": len(index.postings),
+        "build_seconds": round(sum(per_upload), 4),
+        "upload_p50_ms": round(sorted(per_upload)[len(per_upload) // 2] * 1000, 3),
+        "replace_one_ms": round(replace_seconds * 1000, 3),
+        "raw_bytes": raw_bytes,
+        "stored_bytes": len(stored),
+        "load_ms": round(load_seconds * 1000, 2),
+        "memory_bytes": index_bytes,
+        "search": _percentiles(search_times),
+        "retrieve": _percentiles(retrieve_times),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="20,100,500", help="documents per clinic, comma separated")
+    parser.add_argument("--words", type=int, default=300, help="words per document")
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    import logging
+    import tempfile
+    logging.disable(logging.CRITICAL)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        knowledge.settings.knowledge_dir = tmp
+        for size in (int(s) for s in args.sizes.split(",")):
+            results.append(bench_size(size, args.words, args.queries))
+            knowledge.clear()
+
+    print(f"{'docs':>6}{'passages':>10}{'build s':>9}{'replace ms':>12}{'stored KB':>11}{'raw KB':>8}"
+          f"{'load ms':>9}{'mem KB':>9}{'search p50/p95 us':>20}{'retrieve p95 us':>17}")
+    for r in results:
+        print(f"{r['documents']:>6}{r['passages']:>10}{r['build_seconds']:>9.3f}{r['replace_one_ms']:>12.2f}"
+              f"{r['stored_bytes'] / 1024:>11.0f}{r['raw_bytes'] / 1024:>8.0f}{r['load_ms']:>9.1f}"
+              f"{r['memory_bytes'] / 1024:>9.0f}{r['search']['p50_us']:>11.0f}/{r['search']['p95_us']:<8.0f}"
+              f"{r['retrieve']['p95_us']:>17.0f}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(RESULTS_DIR, f"knowledge-{stamp}.json")
+    with open(path, "wb") as f:
+        f.write(orjson.dumps({
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "words_per_doc": args.words,
+            "sizes": results,
+        }, option=orjson.OPT_INDENT_2) + b"\n")
+    print(f"saved: {path}")
+
+
+if __name__ == "__main__":
+    main()
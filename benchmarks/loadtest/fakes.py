@@ -0,0 +1,307 @@
+"""Local stand-ins for the load test: OpenAI, Supabase (PostgREST) and SMTP.
+
+All three run in one process and one event loop:
+
+- an OpenAI-compatible `POST /v1/chat/completions` that streams (SSE) or
+  returns `--tokens` tokens, waiting `--ttft-ms` before the first and
+  `--token-ms` between the rest;
+- a PostgREST subset under `/rest/v1/{table}` (select with eq/neq/gt/gte/lt/lte
+  filters, order, limit; insert, upsert, update, delete) backed by in-memory
+  tables for clinics, chat_sessions, chat_messages, leads, chat_feedback and
+  competitor_queries, with `--db-latency-ms` added to every call. Clinics
+  load-clinic-000..N are seeded at startup;
+- an SMTP sink that accepts and counts messages.
+
+`GET /_stats` on the PostgREST port reports request and row counts.
+
+Usage: python benchmarks/loadtest/fakes.py --openai-port 9101 --postgrest-port 9102 --smtp-port 9103
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import orjson
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+TABLES = ("clinics", "chat_sessions", "chat_messages", "leads", "chat_feedback", "competitor_queries")
+# Columns the app filters on with eq; rows are bucketed by them so lookups stay
+# O(1) however many messages a long run has written.
+INDEXED = {
+    "clinics": ("clinic_id",),
+    "chat_sessions": ("session_key",),
+    "chat_messages": ("session_id",),
+}
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+stats: Dict[str, int] = defaultdict(int)
+
+
+def _json(data, status: int = 200, headers: Optional[dict] = None) -> Response:
+    return Response(orjson.dumps(data), status_code=status, media_type="application/json", headers=headers)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def seed_clinic(i: int) -> dict:
+    return {
+        "id": str(uuid.UUID(int=i + 1)),
+        "clinic_id": f"load-clinic-{i:03d}",
+        "clinic_name": f"Load Test Dental {i:03d}",
+        "location": "Storgatan 1, Stockholm",
+        "opening_hours": "Mon-Fri 8-17",
+        "services": ["Cleaning", "Whitening", "Implants", "Checkup"],
+        "insurance": ["Folktandvården", "Försäkringskassan"],
+        "price_ranges": {"cleaning": "900-1200 kr", "whitening": "2500-3900 kr"},
+        "languages": ["Swedish", "English"],
+        "booking_url": f"https://example.com/book/{i}",
+        "emergency_instructions": "Call 112 for emergencies.",
+        "contact_phone": "+46 8 000 00 00",
+        "contact_email": f"clinic{i}@example.com",
+        "plan": "pro",
+        "status": "active",
+        "created_at": _now(),
+    }
+
+
+class Store:
+    """In-memory tables with eq-indexes on the columns the app looks rows up by."""
+
+    def __init__(self) -> None:
+        self.rows: Dict[str, List[dict]] = {t: [] for t in TABLES}
+        self.index: Dict[str, Dict[str, Dict[str, List[dict]]]] = {
+            t: {c: defaultdict(list) for c in cols} for t, cols in INDEXED.items()
+        }
+
+    def insert(self, table: str, row: dict) -> dict:
+        row = {"id": str(uuid.uuid4()), "created_at": _now(), **row}
+        self.rows[table].append(row)
+        for column, buckets in self.index.get(table, {}).items():
+            buckets[str(row.get(column))].append(row)
+        return row
+
+    def remove(self, table: str, doomed: List[dict]) -> None:
+        ids = {id(r) for r in doomed}
+        self.rows[table] = [r for r in self.rows[table] if id(r) not in ids]
+        for column, buckets in self.index.get(table, {}).items():
+            for row in doomed:
+                bucket = buckets.get(str(row.get(column)), [])
+                bucket[:] = [r for r in bucket if id(r) not in ids]
+
+    def candidates(self, table: str, filters: List[tuple]) -> List[dict]:
+        for column, op, value in filters:
+            if op == "eq" and column in self.index.get(table, {}):
+                return self.index[table][column].get(value, [])
+        return self.rows[table]
+
+
+def _parse_filters(request: Request) -> List[tuple]:
+    filters = []
+    for key, raw in request.query_params.multi_items():
+        if key in RESERVED_PARAMS or "." in key:
+            # "clinics.clinic_id" style filters target embeds, which are not modelled.
+            continue
+        op, _, value = raw.partition(".")
+        filters.append((key, op, value))
+    return filters
+
+
+def _matches(row: dict, filters: List[tuple]) -> bool:
+    for column, op, value in filters:
+        actual = row.get(column)
+        actual = "" if actual is None else str(actual)
+        if op == "eq" and actual != value:
+            return False
+        if op == "neq" and actual == value:
+            return False
+        if op in ("gt", "gte", "lt", "lte"):
+            value = value.strip('"')
+            if (op == "gt" and not actual > value) or (op == "gte" and not actual >= value) \
+                    or (op == "lt" and not actual < value) or (op == "lte" and not actual <= value):
+                return False
+    return True
+
+
+def _project(rows: List[dict], select: str) -> List[dict]:
+    if not select or select == "*":
+        return rows
+    columns = [c.strip() for c in select.split(",") if c.strip() and "(" not in c and ")" not in c]
+    if "*" in columns:
+        return rows
+    return [{c: r.get(c) for c in columns} for r in rows]
+
+
+def _order(rows: List[dict], order: Optional[str]) -> List[dict]:
+    for part in reversed((order or "").split(",")):
+        if not part:
+            continue
+        column, _, direction = part.partition(".")
+        rows = sorted(rows, key=lambda r: str(r.get(column) or ""), reverse=direction.startswith("desc"))
+    return rows
+
+
+def postgrest_app(store: Store, latency: float) -> Starlette:
+    async def table(request: Request) -> Response:
+        name = request.path_params["table"]
+        if name not in store.rows:
+            return _json({"message": f"relation {name} does not exist"}, 404)
+        stats[f"db_{request.method.lower()}"] += 1
+        if latency:
+            await asyncio.sleep(latency)
+
+        filters = _parse_filters(request)
+        if request.method == "GET":
+            rows = [r for r in store.candidates(name, filters) if _matches(r, filters)]
+            rows = _order(rows, request.query_params.get("order"))
+            offset = int(request.query_params.get("offset", 0))
+            if "limit" in request.query_params:
+                rows = rows[offset: offset + int(request.query_params["limit"])]
+            return _json(_project(rows, request.query_params.get("select", "*")))
+
+        if request.method == "POST":
+            payload = orjson.loads(await request.body())
+            payload = payload if isinstance(payload, list) else [payload]
+            conflict = request.query_params.get("on_conflict")
+            out = []
+            for row in payload:
+                existing = None
+                if conflict:
+                    key = [(conflict, "eq", str(row.get(conflict)))]
+                    existing = next((r for r in store.candidates(name, key) if _matches(r, key)), None)
+                if existing is not None:
+                    existing.update(row)
+                    out.append(existing)
+                else:
+                    out.append(store.insert(name, row))
+            return _json(out, 201)
+
+        matched = [r for r in store.candidates(name, filters) if _matches(r, filters)]
+        if request.method == "PATCH":
+            changes = orjson.loads(await request.body())
+            for row in matched:
+                row.update(changes)
+            return _json(matched)
+        if request.method == "DELETE":
+            store.remove(name, matched)
+            return _json(matched)
+        return _json({"message": "method not allowed"}, 405)
+
+    async def report(request: Request) -> Response:
+        return _json({**stats, "rows": {t: len(rows) for t, rows in store.rows.items()}})
+
+    return Starlette(routes=[
+        Route("/rest/v1/{table}", table, methods=["GET", "POST", "PATCH", "DELETE"]),
+        Route("/_stats", report),
+    ])
+
+
+def openai_app(ttft: float, token_delay: float, tokens: int) -> Starlette:
+    def words() -> List[str]:
+        base = "Vi har öppet måndag till fredag och du kan boka tid direkt på vår hemsida ".split()
+        return [base[i % len(base)] + " " for i in range(tokens)]
+
+    def envelope(kind: str) -> dict:
+        return {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": kind, "created": int(time.time()), "model": "fake-gpt"}
+
+    async def completions(request: Request) -> Response:
+        body = orjson.loads(await request.body())
+        stats["llm_requests"] += 1
+        if not body.get("stream"):
+            await asyncio.sleep(ttft + token_delay * max(tokens - 1, 0))
+            return _json({
+                **envelope("chat.completion"),
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "".join(words())}}],
+                "usage": {"prompt_tokens": 200, "completion_tokens": tokens, "total_tokens": 200 + tokens},
+            })
+
+        async def events():
+            head = envelope("chat.completion.chunk")
+            await asyncio.sleep(ttft)
+            for i, word in enumerate(words()):
+                if i:
+                    await asyncio.sleep(token_delay)
+                chunk = {**head, "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}
+                yield b"data: " + orjson.dumps(chunk) + b"\n\n"
+            done = {**head, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield b"data: " + orjson.dumps(done) + b"\n\ndata: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return Starlette(routes=[Route("/v1/chat/completions", completions, methods=["POST"])])
+
+
+async def _smtp_session(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Just enough SMTP for smtplib: EHLO, MAIL, RCPT, DATA, RSET, NOOP, QUIT."""
+    stats["smtp_connections"] += 1
+
+    def reply(line: str) -> None:
+        writer.write((line + "\r\n").encode())
+
+    reply("220 loadtest sink")
+    try:
+        while line := await reader.readline():
+            cmd = line.decode(errors="replace").strip().upper()
+            if cmd.startswith(("EHLO", "HELO")):
+                reply("250 sink")
+            elif cmd.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                reply("250 OK")
+            elif cmd.startswith("DATA"):
+                reply("354 End data with <CR><LF>.<CR><LF>")
+                while (chunk := await reader.readline()) not in (b".\r\n", b".\n", b""):
+                    pass
+                stats["smtp_messages"] += 1
+                reply("250 Queued")
+            elif cmd.startswith("QUIT"):
+                reply("221 Bye")
+                break
+            else:
+                reply("502 Not implemented")
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(args: argparse.Namespace) -> None:
+    store = Store()
+    for i in range(args.clinics):
+        store.insert("clinics", seed_clinic(i))
+
+    servers = [
+        uvicorn.Server(uvicorn.Config(
+            openai_app(args.ttft_ms / 1000, args.token_ms / 1000, args.tokens),
+            host="127.0.0.1", port=args.openai_port, log_level="warning", access_log=False,
+        )),
+        uvicorn.Server(uvicorn.Config(
+            postgrest_app(store, args.db_latency_ms / 1000),
+            host="127.0.0.1", port=args.postgrest_port, log_level="warning", access_log=False,
+        )),
+    ]
+    smtp = await asyncio.start_server(_smtp_session, "127.0.0.1", args.smtp_port)
+    async with smtp:
+        await asyncio.gather(*(s.serve() for s in servers))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--openai-port", type=int, default=9101)
+    parser.add_argument("--postgrest-port", type=int, default=9102)
+    parser.add_argument("--smtp-port", type=int, default=9103)
+    parser.add_argument("--clinics", type=int, default=20)
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--db-latency-ms", type=float, default=5.0)
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
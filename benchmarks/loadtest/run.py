@@ -0,0 +1,349 @@
+"""End-to-end load test of app.main:app against local fakes (no OpenAI tokens, no Supabase).
+
+Boots benchmarks/loadtest/fakes.py and the API under uvicorn. The API points
+at the fakes through OPENAI_BASE_URL, SUPABASE_URL and SMTP_HOST. Then
+`--users` concurrent widget sessions are driven until `--sessions` have
+finished. Each scripted session:
+
+    POST /heartbeat, then `--turns` x (POST /chat, or POST /chat?stream=true
+    with probability `--stream-ratio`, then POST /heartbeat), then POST /lead
+    with probability `--lead-ratio`.
+
+Every virtual user gets its own client IP via X-Forwarded-For (uvicorn runs
+with --proxy-headers), so per-IP rate limits act as they would in production
+instead of throttling the whole run.
+
+The report has throughput, p50/p95/p99 latency per endpoint and
+time-to-first-token for streamed chats. Results are written to
+benchmarks/results/loadtest-<timestamp>.json. With a baseline
+(benchmarks/results/loadtest-baseline.json, or --baseline) the run exits 1
+when p95/p99 latency or TTFT grows, or throughput drops, by more than
+`--tolerance`. `--save-baseline` records the run as the new baseline.
+
+Usage: python benchmarks/loadtest/run.py [--users 20] [--sessions 200] [--workers 1]
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+import orjson
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+BASELINE = os.path.join(RESULTS_DIR, "loadtest-baseline.json")
+
+MESSAGES = [
+    "Hej! Vilka öppettider har ni?",
+    "How much does whitening cost?",
+    "Do you accept Folktandvården insurance?",
+    "Can I book a cleaning next week?",
+    "Which languages do your staff speak?",
+    "Where is the clinic located?",
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile; None for no samples."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.ttft: List[float] = []
+        self.status: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.sessions = 0
+
+    def add(self, endpoint: str, seconds: float, status: int) -> None:
+        self.latency[endpoint].append(seconds)
+        self.status[endpoint][status] += 1
+        if status >= 400:
+            self.errors[endpoint] += 1
+
+
+async def _timed(rec: Recorder, endpoint: str, client: httpx.AsyncClient, path: str, **kwargs) -> Optional[httpx.Response]:
+    start = time.perf_counter()
+    try:
+        response = await client.post(path, **kwargs)
+    except httpx.HTTPError:
+        rec.add(endpoint, time.perf_counter() - start, 599)
+        return None
+    rec.add(endpoint, time.perf_counter() - start, response.status_code)
+    return response
+
+
+async def _stream_chat(rec: Recorder, client: httpx.AsyncClient, **kwargs) -> None:
+    start = time.perf_counter()
+    first: Optional[float] = None
+    status = 599
+    try:
+        async with client.stream("POST", "/chat", params={"stream": "true"}, **kwargs) as response:
+            status = response.status_code
+            async for line in response.aiter_lines():
+                if first is None and '"text"' in line:
+                    first = time.perf_counter() - start
+                if '"error"' in line:
+                    status = 598
+    except httpx.HTTPError:
+        pass
+    rec.add("chat_stream", time.perf_counter() - start, status)
+    if first is not None:
+        rec.ttft.append(first)
+
+
+async def widget_session(client: httpx.AsyncClient, rec: Recorder, args: argparse.Namespace, clinic_id: str, ip: str) -> None:
+    session_id = str(uuid.uuid4())
+    headers = {"X-Forwarded-For": ip, "User-Agent": "loadtest-widget/1.0"}
+    beat = {"clinic_id": clinic_id, "session_id": session_id}
+    think = args.think_ms / 1000
+
+    await _timed(rec, "heartbeat", client, "/heartbeat", json=beat, headers=headers)
+    for _ in range(args.turns):
+        body = {"clinic_id": clinic_id, "session_id": session_id, "message": random.choice(MESSAGES),
+                "metadata": {"page_url": "https://example.com/"}}
+        if random.random() < args.stream_ratio:
+            await _stream_chat(rec, client, json=body, headers=headers)
+        else:
+            await _timed(rec, "chat", client, "/chat", json=body, headers=headers)
+        await _timed(rec, "heartbeat", client, "/heartbeat", json=beat, headers=headers)
+        if think:
+            await asyncio.sleep(random.uniform(0, 2 * think))
+    if random.random() < args.lead_ratio:
+        lead = {"clinic_id": clinic_id, "session_id": session_id, "name": "Load Test",
+                "phone": "+46700000000", "email": f"{session_id[:8]}@example.com", "message": "Please call me"}
+        await _timed(rec, "lead", client, "/lead", json=lead, headers=headers)
+    rec.sessions += 1
+
+
+async def drive(args: argparse.Namespace, base_url: str, clinic_ids: List[str]) -> tuple:
+    rec = Recorder()
+    remaining = iter(range(args.sessions))
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+
+    async def user(n: int, client: httpx.AsyncClient) -> None:
+        ip = f"10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}"
+        for i in remaining:
+            await widget_session(client, rec, args, clinic_ids[i % len(clinic_ids)], ip)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(user(n, client) for n in range(args.users)))
+        elapsed = time.perf_counter() - start
+    return rec, elapsed
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return round(value * 1000, 1) if value is not None else None
+
+
+def summarize(rec: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    for endpoint, samples in sorted(rec.latency.items()):
+        endpoints[endpoint] = {
+            "requests": len(samples),
+            "errors": rec.errors.get(endpoint, 0),
+            "status": {str(k): v for k, v in sorted(rec.status[endpoint].items())},
+            "rps": round(len(samples) / elapsed, 2),
+            "p50_ms": _ms(percentile(samples, 50)),
+            "p95_ms": _ms(percentile(samples, 95)),
+            "p99_ms": _ms(percentile(samples, 99)),
+            "max_ms": _ms(max(samples)),
+        }
+    total = sum(len(s) for s in rec.latency.values())
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "sessions": rec.sessions,
+        "sessions_per_s": round(rec.sessions / elapsed, 2),
+        "requests": total,
+        "rps": round(total / elapsed, 2),
+        "errors": sum(rec.errors.values()),
+        "ttft": {
+            "samples": len(rec.ttft),
+            "p50_ms": _ms(percentile(rec.ttft, 50)),
+            "p95_ms": _ms(percentile(rec.ttft, 95)),
+            "p99_ms": _ms(percentile(rec.ttft, 99)),
+        },
+        "endpoints": endpoints,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regressions of `current` against `baseline` beyond `tolerance` (0.2 = 20%)."""
+    problems = []
+
+    def slower(label: str, now: Optional[float], before: Optional[float]) -> None:
+        if now is not None and before and now > before * (1 + tolerance):
+            problems.append(f"{label}: {before} -> {now} ms (+{(now / before - 1) * 100:.0f}%)")
+
+    for endpoint, stats in current["endpoints"].items():
+        old = baseline["endpoints"].get(endpoint)
+        if not old:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            slower(f"{endpoint} {key}", stats[key], old[key])
+    for key in ("p95_ms", "p99_ms"):
+        slower(f"ttft {key}", current["ttft"][key], baseline["ttft"][key])
+    if baseline["rps"] and current["rps"] < baseline["rps"] * (1 - tolerance):
+        problems.append(f"throughput: {baseline['rps']} -> {current['rps']} req/s")
+    if current["errors"] > baseline["errors"]:
+        problems.append(f"errors: {baseline['errors']} -> {current['errors']}")
+    return problems
+
+
+def print_report(summary: dict) -> None:
+    print(f"\n{summary['sessions']} sessions, {summary['requests']} requests in {summary['elapsed_s']}s "
+          f"({summary['rps']} req/s, {summary['sessions_per_s']} sessions/s, {summary['errors']} errors)")
+    print(f"{'endpoint':<12} {'reqs':>7} {'err':>5} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)")
+    for endpoint, s in summary["endpoints"].items():
+        print(f"{endpoint:<12} {s['requests']:>7} {s['errors']:>5} {s['rps']:>8} {s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8} {s['max_ms']:>8}")
+    t = summary["ttft"]
+    if t["samples"]:
+        print(f"{'ttft':<12} {t['samples']:>7} {'':>5} {'':>8} {t['p50_ms']:>8} {t['p95_ms']:>8} {t['p99_ms']:>8}")
+
+
+def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"{' '.join(proc.args[:4])} exited with {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Timed out waiting for {url}")
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=20, help="concurrent widget sessions")
+    parser.add_argument("--sessions", type=int, default=200, help="total sessions to run")
+    parser.add_argument("--turns", type=int, default=3, help="chat messages per session")
+    parser.add_argument("--stream-ratio", type=float, default=0.7)
+    parser.add_argument("--lead-ratio", type=float, default=0.2)
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between turns")
+    parser.add_argument("--clinics", type=int, default=20, help="seeded clinics to spread sessions over")
+    parser.add_argument("--clinic-ids", default="", help="comma-separated clinic_ids instead of the seeded ones")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the API")
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="fake LLM time to first token")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="fake LLM delay between tokens")
+    parser.add_argument("--tokens", type=int, default=40, help="fake LLM tokens per reply")
+    parser.add_argument("--db-latency-ms", type=float, default=5.0, help="added to every fake PostgREST call")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    ports = {name: _free_port() for name in ("openai", "postgrest", "smtp", "api")}
+
+    fakes = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "benchmarks", "loadtest", "fakes.py"),
+        "--openai-port", str(ports["openai"]), "--postgrest-port", str(ports["postgrest"]),
+        "--smtp-port", str(ports["smtp"]), "--clinics", str(args.clinics),
+        "--ttft-ms", str(args.ttft_ms), "--token-ms", str(args.token_ms), "--tokens", str(args.tokens),
+        "--db-latency-ms", str(args.db_latency_ms),
+    ])
+    env = {
+        **os.environ,
+        "APP_ENV": "loadtest",
+        "OPENAI_API_KEY": "sk-loadtest",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{ports['openai']}/v1",
+        "SUPABASE_URL": f"http://127.0.0.1:{ports['postgrest']}",
+        "SUPABASE_SERVICE_ROLE_KEY": "loadtest.fake.key",
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": str(ports["smtp"]),
+        "SMTP_STARTTLS": "false",
+        "SMTP_USER": "",
+        "SMTP_PASSWORD": "",
+        "REDIS_URL": "",
+        "LOG_LEVEL": "WARNING",
+    }
+    log_path = os.path.join(RESULTS_DIR, f"loadtest-{stamp}.log")
+    with open(log_path, "wb") as log:
+        api = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(ports["api"]),
+            "--workers", str(args.workers), "--proxy-headers", "--forwarded-allow-ips", "*", "--no-access-log",
+        ], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        _wait_ready(f"http://127.0.0.1:{ports['postgrest']}/_stats", fakes)
+        # /ready: the API's warmup has loaded the seeded clinics and opened its connections.
+        _wait_ready(f"http://127.0.0.1:{ports['api']}/ready", api)
+        clinic_ids = [c for c in args.clinic_ids.split(",") if c] or [f"load-clinic-{i:03d}" for i in range(args.clinics)]
+        rec, elapsed = asyncio.run(drive(args, f"http://127.0.0.1:{ports['api']}", clinic_ids))
+        # Let the lead pipeline and mail queue drain before reading the fakes' counters.
+        time.sleep(1.0)
+        backend = httpx.get(f"http://127.0.0.1:{ports['postgrest']}/_stats").json()
+    finally:
+        for proc in (api, fakes):
+            proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    summary = summarize(rec, elapsed)
+    print_report(summary)
+    print(f"backend: {backend}")
+    config = {k: v for k, v in vars(args).items() if k not in ("baseline", "save_baseline")}
+    result = {"created_at": stamp, "git_rev": _git_rev(), "config": config, "summary": summary, "backend": backend}
+
+    out = os.path.join(RESULTS_DIR, f"loadtest-{stamp}.json")
+    with open(out, "wb") as f:
+        f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2))
+    print(f"results: {out} (API log: {log_path})")
+
+    if args.save_baseline:
+        with open(args.baseline, "wb") as f:
+            f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2))
+        print(f"saved baseline: {args.baseline}")
+        return
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "rb") as f:
+            baseline = orjson.loads(f.read())
+        if baseline.get("config") != config:
+            print("note: baseline was recorded with different settings; comparison is indicative only")
+        problems = compare(summary, baseline["summary"], args.tolerance)
+        if problems:
+            print(f"REGRESSIONS vs {args.baseline} (rev {baseline.get('git_rev')}):")
+            for problem in problems:
+                print(f"  {problem}")
+            sys.exit(1)
+        print(f"no regressions vs baseline (rev {baseline.get('git_rev')}, tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""Micro-benchmarks for hot pure-Python paths, with allocation tracking and a regression check.
+
+Cases: system prompt building, the guardrail keyword checks, hash_ip, both
+rate limiters (chat's per-IP list and the leads limiter's in-memory
+fallback) hammered from 8 threads, NDJSON chunk encoding, CSV export row
+formatting and Jinja email rendering.
+
+Each case reports the median-of-`--repeat` time per call and, from a separate
+tracemalloc pass, the peak memory one call allocates and the bytes still
+held per call after many calls (a leak shows up there). Timing and
+allocation passes are kept apart because tracing slows everything down.
+
+Timings are also stored relative to a fixed pure-Python calibration loop:
+each case sample is paired with a calibration sample taken right after it,
+and the median of those ratios is kept, so a baseline recorded on one
+machine stays usable on a faster or slower one and momentary CPU contention
+cancels out. `--check` compares against benchmarks/results/micro-baseline.json
+and exits 1 when a case is more than `--threshold` slower (or allocates that
+much more at peak; some cases allow more, see CASE_THRESHOLDS);
+`--save-baseline` records the current run.
+
+Usage: python benchmarks/micro.py [--check | --save-baseline] [--filter guardrail] [--threshold 0.25]
+"""
+import argparse
+import gc
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import orjson
+from fastapi import HTTPException
+
+from app import rate_limit as lead_rate_limit
+from app.prompts import get_system_prompt
+from app.services.export_service import _csv_chunks
+from app.services.guardrails import is_emergency, is_symptom_or_diagnosis_request
+from app.utils import rate_limit as chat_rate_limit
+from app.utils.email import _render_template
+from app.utils.ndjson import ndjson_line
+from app.utils.privacy import hash_ip
+
+BASELINE = os.path.join(os.path.dirname(__file__), "results", "micro-baseline.json")
+THREADS = 8
+NOW = datetime(2024, 5, 24, tzinfo=timezone.utc)
+
+CLINIC = {
+    "clinic_id": "smile-city-001",
+    "clinic_name": "Smile City Dental",
+    "location": "Storgatan 1, Stockholm",
+    "opening_hours": "Mon-Fri 8-17, Sat 10-14",
+    "services": ["Cleaning", "Whitening", "Implants", "Orthodontics", "Checkup", "Root canal"],
+    "insurance": ["Folktandvården", "Försäkringskassan", "Dental Plus"],
+    "price_ranges": {"cleaning": "900-1200 kr", "whitening": "2500-3900 kr", "implant": "18000-25000 kr"},
+    "languages": ["Swedish", "English", "Arabic"],
+    "booking_url": "https://booking.smile-city.example/book",
+    "emergency_instructions": "Call 112 for emergencies, or our emergency line +46 8 123 45 67.",
+    "contact_phone": "+46 8 123 45 67",
+    "contact_email": "hello@smile-city.example",
+}
+# No keyword matches, so every keyword is scanned: the common (and slowest) case.
+BENIGN_MESSAGE = "Hej! Jag undrar vad en vanlig tandrengöring kostar och om ni har lediga tider nästa vecka?"
+LEAD = {"name": "Anna Svensson", "phone": "+46 70 123 45 67", "email": "anna@example.com",
+        "message": "Hej, jag vill boka en tid för tandblekning.", "session_id": "3f1c8e2a-0000-4000-8000-000000000001"}
+FEEDBACK_PAGE = [
+    {
+        "id": f"00000000-0000-4000-8000-{i:012d}", "clinic_id": f"clinic-{i % 40:05d}", "session_id": f"s-{i}",
+        "rating": "up" if i % 3 else "down", "comment": 'Snabbt svar, "tack"!\nBra' if i % 5 == 0 else None,
+        "created_at": (NOW - timedelta(minutes=i)).isoformat(),
+        "clinics": {"clinic_name": f"Smile Clinic {i % 40}", "clinic_id": f"clinic-{i % 40:05d}"},
+    }
+    for i in range(500)
+]
+
+
+def _request(ip: str) -> SimpleNamespace:
+    return SimpleNamespace(client=SimpleNamespace(host=ip), app=SimpleNamespace(state=SimpleNamespace(redis=None)))
+
+
+REQUESTS = [_request(f"10.0.{i // 256}.{i % 256}") for i in range(1024)]
+
+
+def _run_sync(coro):
+    """Drive a coroutine that never suspends (the lead limiter without Redis)."""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("coroutine suspended")
+
+
+class Contended:
+    """`calls` calls of `fn(request)` spread over THREADS threads, round-robin over 1024 client IPs."""
+
+    def __init__(self, fn: Callable, calls: int = 800):
+        self.fn = fn
+        self.calls = calls
+        self.pool: Optional[ThreadPoolExecutor] = None
+
+    def _worker(self, offset: int) -> None:
+        fn = self.fn
+        for i in range(offset, self.calls, THREADS):
+            try:
+                fn(REQUESTS[i % len(REQUESTS)])
+            except HTTPException:
+                pass
+
+    def __call__(self) -> None:
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(THREADS)
+        for future in [self.pool.submit(self._worker, t) for t in range(THREADS)]:
+            future.result()
+
+
+def _chat_limit(request) -> None:
+    chat_rate_limit.limit(request, max_per_minute=90)
+
+
+def _lead_limit(request) -> None:
+    _run_sync(lead_rate_limit._redis_limit(request, 5, 60))
+
+
+def _reset_limiters() -> None:
+    chat_rate_limit._request_counts.clear()
+    lead_rate_limit._store.clear()
+
+
+def _calibrate() -> int:
+    total = 0
+    for i in range(10000):
+        total += i * i % 7
+    return total
+
+
+# name -> (callable, calls per timed op, per-repeat setup)
+CASES: Dict[str, tuple] = {
+    "prompt.get_system_prompt": (lambda: get_system_prompt(CLINIC), 1, None),
+    "guardrail.is_emergency": (lambda: is_emergency(BENIGN_MESSAGE), 1, None),
+    "guardrail.is_symptom_or_diagnosis_request": (lambda: is_symptom_or_diagnosis_request(BENIGN_MESSAGE), 1, None),
+    "privacy.hash_ip": (lambda: hash_ip("203.0.113.42", "salt-0123456789abcdef"), 1, None),
+    "rate_limit.chat_contended": (Contended(_chat_limit), 800, _reset_limiters),
+    "rate_limit.lead_contended": (Contended(_lead_limit), 800, _reset_limiters),
+    "ndjson.stream_chunk": (lambda: ndjson_line({"text": " tandläkare"}), 1, None),
+    "export.csv_row": (lambda: b"".join(_csv_chunks([FEEDBACK_PAGE])), len(FEEDBACK_PAGE), None),
+    "email.lead_render": (lambda: _render_template("lead_email.html", {"clinic_name": CLINIC["clinic_name"], "lead": LEAD, "logo_url": None, "theme": None}), 1, None),
+    "email.digest_render": (lambda: _render_template("lead_digest_email.html", {"clinic_name": CLINIC["clinic_name"], "leads": [LEAD] * 10}), 1, None),
+}
+
+
+# Cases whose timing swings more than the default threshold between clean runs:
+# the Jinja renders allocate and hash far more than the calibration loop, so
+# cache and allocator state move them independently of it.
+CASE_THRESHOLDS: Dict[str, float] = {
+    "email.lead_render": 0.5,
+    "email.digest_render": 0.5,
+}
+
+
+def _loops_for(fn: Callable, budget: float = 0.05) -> int:
+    """Enough loops for one timing sample to take roughly `budget` seconds."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        if time.perf_counter() - start >= budget or loops >= 1 << 20:
+            return loops
+        loops *= 2
+
+
+def _sample(fn: Callable, loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        fn()
+    return time.perf_counter() - start
+
+
+def time_case(fn: Callable, per_op: int, setup: Optional[Callable], repeat: int) -> tuple:
+    """Median nanoseconds per call, per calibration loop, and of their ratio over `repeat` samples.
+
+    Calibration samples are interleaved with the case's so each pair sees the
+    same CPU conditions (frequency scaling, noisy neighbours). Taking the best
+    of each side separately would pair a lucky case sample with an unrelated
+    lucky calibration sample; the median ratio is what stays put between runs.
+    """
+    if setup:
+        setup()
+    loops = _loops_for(fn)
+    calibration_loops = _loops_for(_calibrate)
+    times, calibrations, ratios = [], [], []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            if setup:
+                setup()
+            ns = _sample(fn, loops) / loops / per_op * 1e9
+            calibration = _sample(_calibrate, calibration_loops) / calibration_loops * 1e9
+            times.append(ns)
+            calibrations.append(calibration)
+            ratios.append(ns / calibration)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return statistics.median(times), statistics.median(calibrations), statistics.median(ratios)
+
+
+def memory_case(fn: Callable, per_op: int, setup: Optional[Callable], calls: int = 200) -> dict:
+    """Peak bytes allocated by one call, and bytes retained per call over `calls` calls."""
+    if setup:
+        setup()
+    fn()  # warm caches (templates, compiled regexes) outside the measurement
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        before, _ = tracemalloc.get_traced_memory()
+        for _ in range(calls):
+            fn()
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_bytes": max(peak - base, 0) // per_op,
+        "retained_bytes_per_call": round(max(after - before, 0) / (calls * per_op), 1),
+    }
+
+
+def run(names: List[str], repeat: int) -> dict:
+    results = {}
+    calibrations = []
+    for name in names:
+        fn, per_op, setup = CASES[name]
+        ns, calibration, relative = time_case(fn, per_op, setup, repeat)
+        calibrations.append(calibration)
+        results[name] = {"ns": round(ns, 1), "relative": round(relative, 6), **memory_case(fn, per_op, setup)}
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "calibration_ns": round(statistics.median(calibrations) if calibrations else 0.0, 1),
+        "cases": results,
+    }
+
+
+def check(current: dict, baseline: dict, threshold: float) -> Dict[str, List[str]]:
+    """Cases slower (calibration-relative) or allocating more at peak than their threshold allows.
+
+    The threshold is `threshold`, or the case's CASE_THRESHOLDS entry if that is larger.
+    """
+    problems: Dict[str, List[str]] = {}
+    for name, now in current["cases"].items():
+        before = baseline["cases"].get(name)
+        if not before:
+            continue
+        allowed = max(threshold, CASE_THRESHOLDS.get(name, 0.0))
+        if now["relative"] > before["relative"] * (1 + allowed):
+            problems.setdefault(name, []).append(
+                f"{now['relative'] / before['relative'] - 1:+.0%} time "
+                f"({before['ns']:.0f} -> {now['ns']:.0f} ns/call before calibration)"
+            )
+        # Ignore peak noise on tiny allocations.
+        if now["peak_bytes"] > max(before["peak_bytes"] * (1 + allowed), before["peak_bytes"] + 256):
+            problems.setdefault(name, []).append(f"peak allocation {before['peak_bytes']} -> {now['peak_bytes']} bytes")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--filter", default="", help="only cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=9)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--retries", type=int, default=2, help="re-measure flagged cases this many times before failing")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--check", action="store_true", help="exit 1 on regressions against the baseline")
+    mode.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    # Keep app logging (e.g. the prompt builder's debug line) out of the numbers.
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    names = [name for name in CASES if args.filter in name]
+    current = run(names, args.repeat)
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "rb") as f:
+            baseline = orjson.loads(f.read())
+
+    if args.check and baseline is not None:
+        # A single slow sample on a busy machine should not fail the check:
+        # re-measure flagged cases and keep their best run.
+        for _ in range(args.retries):
+            flagged = list(check(current, baseline, args.threshold))
+            if not flagged:
+                break
+            for name, r in run(flagged, args.repeat)["cases"].items():
+                if r["relative"] < current["cases"][name]["relative"]:
+                    current["cases"][name] = r
+
+    print(f"calibration loop: {current['calibration_ns'] / 1000:.0f} us")
+    print(f"{'case':<44}{'ns/call':>11}{'vs base':>9}{'peak B':>10}{'retained B':>12}")
+    for name, r in current["cases"].items():
+        before = (baseline or {}).get("cases", {}).get(name)
+        delta = f"{r['relative'] / before['relative'] - 1:+.0%}" if before else "-"
+        print(f"{name:<44}{r['ns']:>11.0f}{delta:>9}{r['peak_bytes']:>10}{r['retained_bytes_per_call']:>12}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        if baseline and args.filter:
+            current["cases"] = {**baseline["cases"], **current["cases"]}
+        with open(args.baseline, "wb") as f:
+            f.write(orjson.dumps(current, option=orjson.OPT_INDENT_2) + b"\n")
+        print(f"saved baseline: {args.baseline}")
+    elif args.check:
+        if baseline is None:
+            sys.exit(f"no baseline at {args.baseline}; run with --save-baseline first")
+        problems = check(current, baseline, args.threshold)
+        if problems:
+            print(f"\nREGRESSIONS (threshold {args.threshold:.0%}):")
+            for name, messages in problems.items():
+                print(f"  {name}: {'; '.join(messages)}")
+            sys.exit(1)
+        print(f"\nno regressions (threshold {args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
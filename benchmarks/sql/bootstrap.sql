@@ -0,0 +1,58 @@
+-- Minimal stand-in for the Supabase schema the app expects, for local
+-- benchmarking only. Migrations under app/routes/*.sql are applied on top.
+do $$
+begin
+    if not exists (select 1 from pg_roles where rolname = 'service_role') then
+        create role service_role;
+    end if;
+end;
+$$;
+
+create table if not exists public.clinics (
+    id uuid primary key default gen_random_uuid(),
+    clinic_id text not null unique,
+    clinic_name text,
+    location text,
+    opening_hours text,
+    services jsonb default '[]'::jsonb,
+    insurance jsonb default '[]'::jsonb,
+    price_ranges jsonb default '{}'::jsonb,
+    languages jsonb default '[]'::jsonb,
+    booking_url text,
+    emergency_instructions text,
+    contact_phone text,
+    contact_email text,
+    plan text default 'free',
+    status text default 'active',
+    created_at timestamp with time zone default timezone('utc'::text, now())
+);
+
+create table if not exists public.chat_sessions (
+    id uuid primary key default gen_random_uuid(),
+    clinic_id uuid references public.clinics(id) on delete cascade,
+    session_key text not null,
+    user_locale text,
+    page_url text,
+    user_agent text,
+    ip_hash text,
+    created_at timestamp with time zone default timezone('utc'::text, now())
+);
+
+create table if not exists public.chat_messages (
+    id uuid primary key default gen_random_uuid(),
+    session_id uuid references public.chat_sessions(id) on delete cascade,
+    role text not null,
+    content text not null,
+    created_at timestamp with time zone default timezone('utc'::text, now())
+);
+
+create table if not exists public.leads (
+    id uuid primary key default gen_random_uuid(),
+    clinic_id uuid references public.clinics(id) on delete cascade,
+    session_id uuid references public.chat_sessions(id) on delete set null,
+    name text,
+    phone text,
+    email text,
+    message text,
+    created_at timestamp with time zone default timezone('utc'::text, now())
+);
@@ -0,0 +1,36 @@
+-- The request hot paths, as PostgREST issues them. Sample keys are picked
+-- from the seeded data so every run hits real rows.
+select session_key as skey, id as sid from public.chat_sessions offset 1234 limit 1 \gset
+select clinic_id as cid from public.clinics offset 42 limit 1 \gset
+
+\echo '--- chat_sessions.session_key equality (get_or_create_session)'
+explain (analyze, buffers, costs off)
+select * from public.chat_sessions where session_key = :'skey' limit 1;
+
+\echo '--- chat_messages by session, newest first (fetch_recent_messages)'
+explain (analyze, buffers, costs off)
+select role, content, created_at from public.chat_messages
+where session_id = :'sid' order by created_at desc limit 10;
+
+\echo '--- clinics.clinic_id equality (get_clinic_by_public_id)'
+explain (analyze, buffers, costs off)
+select * from public.clinics where clinic_id = :'cid' limit 1;
+
+\echo '--- chat_feedback 7-day range, keyset page (feedback export)'
+explain (analyze, buffers, costs off)
+select * from public.chat_feedback
+where created_at >= now() - interval '7 days' and created_at <= now()
+order by created_at desc, id desc limit 1000;
+
+\echo '--- chat_feedback 7-day aggregate (get_clinic_feedback_stats)'
+explain (analyze, buffers, costs off)
+select f.clinic_id, count(*) filter (where f.rating = 'up'), count(*) filter (where f.rating = 'down'), count(*)
+from public.chat_feedback f
+where f.created_at >= now() - interval '7 days' and f.created_at <= now()
+group by f.clinic_id;
+
+\echo '--- competitor_queries 30-day range, newest first (admin listing)'
+explain (analyze, buffers, costs off)
+select * from public.competitor_queries
+where created_at >= now() - interval '30 days'
+order by created_at desc, id desc limit 50;
@@ -0,0 +1,61 @@
+-- Synthetic data spread over the last year.
+-- psql variables: clinics, sessions, messages_per_session, feedback, competitor
+insert into public.clinics (clinic_id, clinic_name, plan, status, created_at)
+select
+    'bench-' || g,
+    'Bench Dental ' || g,
+    (array['free', 'pro', 'agency'])[1 + g % 3],
+    case when g % 20 = 0 then 'inactive' else 'active' end,
+    now() - (g || ' hours')::interval
+from generate_series(1, :clinics) g;
+
+with c as (
+    select id, row_number() over (order by id) - 1 as rn from public.clinics
+)
+insert into public.chat_sessions (clinic_id, session_key, user_locale, created_at)
+select
+    c.id,
+    md5(g::text),
+    'en',
+    now() - random() * interval '365 days'
+from generate_series(1, :sessions) g
+join c on c.rn = g % :clinics;
+
+insert into public.chat_messages (session_id, role, content, created_at)
+select
+    s.id,
+    case when m % 2 = 0 then 'assistant' else 'user' end,
+    repeat('lorem ipsum ', 5 + (m % 20)),
+    s.created_at + (m || ' minutes')::interval
+from public.chat_sessions s
+cross join generate_series(1, :messages_per_session) m;
+
+with s as (
+    select id, clinic_id, created_at, row_number() over (order by id) - 1 as rn
+    from public.chat_sessions
+)
+insert into public.chat_feedback (clinic_id, session_id, rating, comment, created_at)
+select
+    s.clinic_id,
+    s.id,
+    case when random() < 0.8 then 'up' else 'down' end,
+    null,
+    s.created_at + random() * interval '1 hour'
+from generate_series(1, :feedback) g
+join s on s.rn = g % :sessions;
+
+with s as (
+    select id, clinic_id, created_at, row_number() over (order by id) - 1 as rn
+    from public.chat_sessions
+)
+insert into public.competitor_queries (clinic_id, session_id, query, detected_keyword, created_at)
+select
+    s.clinic_id,
+    s.id,
+    'how do you compare you to the other clinic?',
+    'compare you to',
+    s.created_at + random() * interval '1 hour'
+from generate_series(1, :competitor) g
+join s on s.rn = g % :sessions;
+
+analyze;
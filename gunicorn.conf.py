@@ -0,0 +1,59 @@
+"""Gunicorn settings for production: a master process managing several Uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Environment:
+  PORT                          listen port (default 8000)
+  WEB_CONCURRENCY               workers (default: 2 x CPUs + 1, at most 4: inside a container
+                                the CPU count is the host's); also read by the app's
+                                shared-state check
+  GUNICORN_MAX_REQUESTS         recycle a worker after this many requests (default 5000, 0 = never)
+  GUNICORN_MAX_REQUESTS_JITTER  spread recycling so workers don't restart together (default 500)
+  GUNICORN_GRACEFUL_TIMEOUT     seconds a stopping worker gets to finish requests, queued
+                                leads and mail (default 30)
+  PROMETHEUS_MULTIPROC_DIR      metrics directory shared by the workers (default under /tmp;
+                                wiped when the master starts)
+
+The app is imported once in the master (preload_app) so workers fork with
+the code already loaded. Clients and connection pools are created per
+worker, after the fork.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY") or min(2 * multiprocessing.cpu_count() + 1, 4))
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+preload_app = True
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "500"))
+# Covers the app's own shutdown: lead pipeline (10s) and mail queue drain.
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+# Worker heartbeat; async workers keep beating while requests stream.
+timeout = 60
+keepalive = 5
+
+# prometheus_client picks its multiprocess mode when first imported, so the
+# directory has to be in the environment before the app is preloaded.
+# This file is re-read on HUP; only wipe the directory on the first read.
+if not os.environ.get("_GUNICORN_METRICS_DIR_READY"):
+    _metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "dental-bot-metrics"))
+    shutil.rmtree(_metrics_dir, ignore_errors=True)
+    os.makedirs(_metrics_dir, exist_ok=True)
+    os.environ["_GUNICORN_METRICS_DIR_READY"] = "1"
+
+
+def post_fork(server, worker):
+    from app.workers import reset_after_fork
+
+    reset_after_fork()
+
+
+def child_exit(server, worker):
+    from app.metrics import mark_worker_dead
+
+    mark_worker_dead(worker.pid)
@@ -0,0 +1,71 @@
+import socketserver
+import threading
+
+import pytest
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: EHLO, MAIL, RCPT, DATA, RSET, NOOP, QUIT."""
+
+    def _reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        sink = self.server.sink
+        sink.connections += 1
+        self._reply("220 sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode(errors="replace").strip().upper()
+            if cmd.startswith(("EHLO", "HELO")):
+                self._reply("250 sink")
+            elif cmd.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self._reply("250 OK")
+            elif cmd.startswith("DATA"):
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if chunk in (b".\r\n", b".\n", b""):
+                        break
+                    data.append(chunk)
+                if sink.fail_next > 0:
+                    sink.fail_next -= 1
+                    self._reply("451 Temporary failure")
+                else:
+                    sink.messages.append(b"".join(data).decode(errors="replace"))
+                    self._reply("250 Queued")
+            elif cmd.startswith("QUIT"):
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Not implemented")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.sink = self
+        self.messages = []
+        self.connections = 0
+        self.fail_next = 0
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+@pytest.fixture
+def smtp_sink():
+    """Local SMTP stand-in that records delivered messages and connection count."""
+    server = SMTPSink()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
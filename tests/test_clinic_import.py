@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+from app.services import clinic_cache
+from app.services.clinic_import import import_clinics
+
+
+def _profile(clinic_id: str, **extra) -> dict:
+    return {
+        "clinic_id": clinic_id,
+        "clinic_name": f"{clinic_id} Dental",
+        "location": "Main St 1",
+        "opening_hours": "9-17",
+        "services": ["Cleaning"],
+        "insurance": [],
+        "price_ranges": {"cleaning": "500 SEK"},
+        "languages": ["sv"],
+        "booking_url": "https://example.com/book",
+        "emergency_instructions": "Call 112",
+        "contact_phone": "+46 1",
+        "contact_email": "a@example.com",
+        **extra,
+    }
+
+
+async def _chunks(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def _run(data: bytes, fmt: str, batch_size: int = 2):
+    batches = []
+
+    def upsert(rows):
+        batches.append([r["clinic_id"] for r in rows])
+        return rows
+
+    def after_upsert(saved):
+        clinic_cache.prime(saved)
+        return {}
+
+    async def collect():
+        return [r async for r in import_clinics(_chunks(data), fmt, upsert, batch_size, after_upsert)]
+
+    return asyncio.run(collect()), batches
+
+
+def test_ndjson_import_batches_and_reports_rows():
+    lines = [
+        _profile("a"),
+        {"clinic_id": "bad"},
+        _profile("b"),
+        _profile("c"),
+        _profile("a", plan="pro"),  # different columns: starts a new batch
+    ]
+    data = "\n".join(json.dumps(l) for l in lines).encode()
+    results, batches = _run(data, "ndjson")
+
+    assert batches == [["a", "b"], ["c"], ["a"]]
+    assert [r["status"] for r in results if "line" in r] == ["invalid", "upserted", "upserted", "upserted", "upserted"]
+    assert results[0]["line"] == 2 and results[0]["errors"]
+    assert results[-1] == {"done": True, "upserted": 4, "invalid": 1, "failed": 0}
+    assert clinic_cache.get_clinic("c")["clinic_name"] == "c Dental"
+
+
+def test_csv_import_parses_list_cells_and_multiline_quotes():
+    header = "clinic_id,clinic_name,location,opening_hours,services,insurance,price_ranges,languages,booking_url,emergency_instructions,contact_phone,contact_email"
+    row = 'x,X Dental,"Main St 1\nFloor 2",9-17,Cleaning;Implants,[],cleaning=500 SEK;implant=20000 SEK,sv;en,https://x,Call 112,+46 1,x@example.com'
+    results, batches = _run(f"{header}\n{row}\n".encode(), "csv")
+
+    assert batches == [["x"]]
+    assert results[0] == {"line": 2, "clinic_id": "x", "status": "upserted"}
+    clinic = clinic_cache.get_clinic("x")
+    assert clinic["services"] == ["Cleaning", "Implants"]
+    assert clinic["price_ranges"] == {"cleaning": "500 SEK", "implant": "20000 SEK"}
+    assert clinic["location"] == "Main St 1\nFloor 2"
@@ -0,0 +1,38 @@
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.compression import SelectiveGZipMiddleware
+
+
+def _app():
+    app = FastAPI(default_response_class=ORJSONResponse)
+    app.add_middleware(SelectiveGZipMiddleware, minimum_size=100)
+
+    @app.get("/big")
+    def big():
+        return {"rows": [{"n": i} for i in range(100)]}
+
+    @app.get("/small")
+    def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse((b'{"text":"x"}\n' for _ in range(100)), media_type="application/x-ndjson")
+
+    return app
+
+
+def test_gzip_only_buffered_responses_over_threshold():
+    client = TestClient(_app())
+    headers = {"Accept-Encoding": "gzip"}
+
+    big = client.get("/big", headers=headers)
+    assert big.headers["content-encoding"] == "gzip"
+    assert len(big.json()["rows"]) == 100
+
+    assert "content-encoding" not in client.get("/small", headers=headers).headers
+    stream = client.get("/stream", headers=headers)
+    assert "content-encoding" not in stream.headers
+    assert stream.text.count("\n") == 100
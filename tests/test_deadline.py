@@ -0,0 +1,104 @@
+import asyncio
+import builtins
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.routes.chat import deadline_reply, DEMO_CLINICS
+from app.utils.deadline import Deadline, DeadlineExceeded
+
+
+def _deadline_count(client, stage, outcome):
+    needle = f'deadline_exceeded_total{{outcome="{outcome}",route="/chat",stage="{stage}"}} '
+    line = next((l for l in client.get('/metrics', headers={'X-API-Key': settings.api_key}).text.splitlines() if l.startswith(needle)), None)
+    return float(line.split()[-1]) if line else 0.0
+
+
+def test_llm_gets_remaining_budget_and_times_out(monkeypatch):
+    async def slow_completion(system, messages, model=None):
+        await asyncio.sleep(5)
+        return "too late"
+
+    monkeypatch.setattr('app.routes.chat.chat_completion', slow_completion)
+    monkeypatch.setattr('app.routes.chat.settings.chat_deadline_seconds', 0.2)
+    client = TestClient(app)
+    before = _deadline_count(client, "llm_total", "timed_out")
+
+    res = client.post('/chat', json={'clinic_id': 'smile-city-001', 'message': 'hello'})
+    assert res.status_code == 200
+    assert res.json()['reply'] == deadline_reply(DEMO_CLINICS['smile-city-001'])
+    assert _deadline_count(client, "llm_total", "timed_out") == before + 1
+
+
+def test_stream_ends_at_deadline_with_partial_answer(monkeypatch):
+    async def stalling_stream(system, messages, model=None):
+        yield "Hello"
+        await asyncio.sleep(5)
+        yield " never sent"
+
+    monkeypatch.setattr('app.routes.chat.chat_completion_stream', stalling_stream)
+    monkeypatch.setattr('app.routes.chat.settings.chat_deadline_seconds', 0.3)
+
+    res = TestClient(app).post('/chat?stream=true', json={'clinic_id': 'smile-city-001', 'message': 'hello'})
+    lines = [json.loads(l) for l in res.text.splitlines()]
+    assert lines[0] == {"text": "Hello"}
+    assert lines[-1]["done"] is True and lines[-1]["timed_out"] is True
+
+
+def test_history_is_skipped_when_budget_is_short(monkeypatch):
+    clinic = dict(DEMO_CLINICS['smile-city-001'], id="0b9c6a4e-clinic", clinic_id="deadline-clinic")
+    seen = {}
+
+    async def completion(system, messages, model=None):
+        seen["messages"] = messages
+        return "Hi!"
+
+    def fetch_history(*args, **kwargs):
+        raise AssertionError("history should be skipped")
+
+    monkeypatch.setattr('app.routes.chat.clinic_cache.is_cached', lambda cid: True)
+    monkeypatch.setattr('app.routes.chat.clinic_cache.get_clinic', lambda cid: clinic)
+    monkeypatch.setattr('app.routes.chat.get_or_create_session', lambda **kw: {"id": "s1"})
+    monkeypatch.setattr('app.routes.chat.fetch_recent_messages', fetch_history)
+    monkeypatch.setattr('app.routes.chat.insert_message', lambda *a: None)
+    monkeypatch.setattr('app.routes.chat.chat_completion', completion)
+    # Enough for the session lookup, but history would eat into the LLM's minimum
+    monkeypatch.setattr('app.routes.chat.settings.chat_deadline_seconds', 5.0)
+    monkeypatch.setattr('app.routes.chat.settings.chat_min_llm_seconds', 4.99)
+
+    res = TestClient(app).post('/chat', json={'clinic_id': 'deadline-clinic', 'message': 'hello'})
+    assert res.json()['reply'] == "Hi!"
+    assert seen["messages"] == [{"role": "user", "content": "hello"}]
+
+
+def test_deadline_works_without_python_311_asyncio_apis(monkeypatch):
+    # Render runs 3.9 (render.yaml), which has no asyncio.timeout/timeout_at and no anext().
+    for name in ("timeout", "timeout_at"):
+        monkeypatch.delattr(asyncio, name, raising=False)
+    monkeypatch.delattr(builtins, "anext", raising=False)
+
+    async def ticks():
+        for i in range(3):
+            yield i
+        await asyncio.sleep(5)
+        yield 99
+
+    async def scenario():
+        deadline = Deadline(0.3)
+        assert await deadline.run("clinic_lookup", lambda x: x * 2, 21) == 42
+        assert await deadline.wait("llm_total", asyncio.sleep(0, result="ok")) == "ok"
+        seen = []
+        with pytest.raises(DeadlineExceeded):
+            async for item in deadline.iterate("llm_stream", ticks()):
+                seen.append(item)
+        assert seen == [0, 1, 2]
+        with pytest.raises(DeadlineExceeded):
+            await deadline.wait("llm_total", asyncio.sleep(5))
+        with pytest.raises(DeadlineExceeded):
+            await deadline.run("history_fetch", time.sleep, 0, reserve=10)
+
+    asyncio.run(scenario())
@@ -0,0 +1,154 @@
+import csv
+import gzip
+import io
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.services.export_service import (
+    FEEDBACK_CSV_HEADER,
+    conversation_source_fields,
+    resolve_conversation_columns,
+    stream_conversation_export,
+    stream_feedback_export,
+)
+
+
+def _feedback_pages(n_pages: int, page_size: int, fetched: list):
+    """Keyset-style pages of chat_feedback rows; records each page as it is fetched."""
+    for p in range(n_pages):
+        fetched.append(p)
+        yield [
+            {
+                "id": f"fb-{p}-{i}",
+                "created_at": f"2024-05-{20 - p:02d}T10:00:{59 - i:02d}+00:00",
+                "clinic_id": "c-uuid",
+                "session_id": f"s-{p}-{i}",
+                "rating": "up" if i % 2 else "down",
+                "comment": None if i % 3 else "Great, thanks",
+                "clinics": {"clinic_name": "Smile City", "clinic_id": "smile-city-001"} if i else None,
+            }
+            for i in range(page_size)
+        ]
+
+
+def _body(fmt: str, compress: bool = False, n_pages: int = 3, page_size: int = 4):
+    body, media_type, filename = stream_feedback_export(_feedback_pages(n_pages, page_size, []), fmt, compress)
+    return b"".join(body), media_type, filename
+
+
+def test_csv_export_has_header_and_every_row():
+    data, media_type, filename = _body("csv")
+    rows = list(csv.reader(io.StringIO(data.decode())))
+
+    assert media_type == "text/csv" and filename == "feedback_export.csv"
+    assert rows[0] == FEEDBACK_CSV_HEADER
+    assert len(rows) == 1 + 3 * 4
+    assert rows[1][1] == "Unknown" and rows[1][5] == "Great, thanks"
+    assert rows[2] == ["2024-05-20T10:00:58+00:00", "Smile City", "c-uuid", "s-0-1", "up", ""]
+
+
+def test_ndjson_and_gzip_exports_match():
+    data, media_type, _ = _body("ndjson")
+    records = [json.loads(line) for line in data.splitlines()]
+    assert media_type == "application/x-ndjson"
+    assert len(records) == 12
+    assert set(records[0]) == {"created_at", "clinic_name", "clinic_id", "session_id", "rating", "comment"}
+
+    zipped, media_type, filename = _body("ndjson", compress=True)
+    assert media_type == "application/gzip" and filename == "feedback_export.ndjson.gz"
+    assert gzip.decompress(zipped) == data
+    assert gzip.decompress(_body("csv", compress=True)[0]) == _body("csv")[0]
+
+
+def test_export_pulls_one_page_at_a_time():
+    fetched = []
+    body, _, _ = stream_feedback_export(_feedback_pages(50, 100, fetched), "csv")
+    assert fetched == []  # nothing is read until the response starts streaming
+
+    next(body)  # header
+    next(body)
+    assert fetched == [0]
+    next(body)
+    assert fetched == [0, 1]
+
+
+def test_feedback_export_route_streams_requested_format(monkeypatch):
+    monkeypatch.setattr('app.routes.admin.iter_feedback_export', lambda start, end: _feedback_pages(2, 3, []))
+    client = TestClient(app)
+    headers = {"x-api-key": settings.api_key}
+
+    res = client.get('/admin/feedback/export?format=ndjson&gzip=true', headers=headers)
+    assert res.status_code == 200
+    assert "feedback_export.ndjson.gz" in res.headers["content-disposition"]
+    assert len(gzip.decompress(res.content).splitlines()) == 6
+    assert client.get('/admin/feedback/export?format=xml', headers=headers).status_code == 400
+
+
+def _conversation_pages(n_pages: int, page_size: int, fetched: list):
+    for p in range(n_pages):
+        fetched.append(p)
+        yield [
+            {
+                "id": f"m-{p}-{i}",
+                "session_id": f"s-{p}",
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": f"message {p}.{i}",
+                "created_at": f"2024-05-{p + 1:02d}T09:00:{i:02d}+00:00",
+                "chat_sessions": {"session_key": f"key-{p}", "clinic_id": "c-uuid", "created_at": "2024-05-01T08:00:00+00:00"},
+            }
+            for i in range(page_size)
+        ]
+
+
+def test_arrow_and_parquet_exports_keep_projection_and_rows():
+    columns = resolve_conversation_columns("message_id,content,created_at,session_key")
+    assert conversation_source_fields(columns) == (["id", "content", "created_at"], ["session_key"])
+
+    body, media_type, filename = stream_conversation_export(_conversation_pages(3, 5, []), columns, "arrow")
+    table = pa.ipc.open_stream(b"".join(body)).read_all()
+    assert media_type == "application/vnd.apache.arrow.stream" and filename.endswith(".arrows")
+    assert table.column_names == columns and table.num_rows == 15
+    assert table.schema.field("created_at").type == pa.timestamp("us", tz="UTC")
+    assert table.column("session_key").to_pylist()[-1] == "key-2"
+
+    body, _, filename = stream_conversation_export(_conversation_pages(3, 5, []), columns, "parquet")
+    table = pq.read_table(io.BytesIO(b"".join(body)))
+    assert filename.endswith(".parquet")
+    assert table.column_names == columns and table.num_rows == 15
+
+
+def test_arrow_export_flushes_each_page_before_reading_the_next():
+    fetched = []
+    columns = resolve_conversation_columns(None)
+    body, _, _ = stream_conversation_export(_conversation_pages(20, 50, fetched), columns, "arrow")
+    assert fetched == []
+
+    first = next(body)
+    assert fetched == [0]
+    # The first chunk already holds the schema and the first page as a readable batch.
+    assert pa.ipc.open_stream(first).read_next_batch().num_rows == 50
+    next(body)
+    assert fetched == [0, 1]
+
+
+def test_conversation_export_route_rejects_unknown_columns(monkeypatch):
+    monkeypatch.setattr('app.routes.admin.get_clinic_by_public_id', lambda cid: {"id": "c-uuid"})
+    monkeypatch.setattr(
+        'app.routes.admin.iter_conversation_export',
+        lambda *args, **kwargs: _conversation_pages(2, 3, []),
+    )
+    client = TestClient(app)
+    headers = {"x-api-key": settings.api_key}
+
+    res = client.get('/admin/conversations/export?clinic_id=smile-city-001&columns=role,content', headers=headers)
+    assert res.status_code == 200
+    assert "smile-city-001_conversations_export.arrows" in res.headers["content-disposition"]
+    assert pa.ipc.open_stream(res.content).read_all().column_names == ["role", "content"]
+
+    res = client.get('/admin/conversations/export?clinic_id=smile-city-001&columns=password', headers=headers)
+    assert res.status_code == 400
@@ -0,0 +1,126 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.services import summary_service
+
+CLINICS = {"c1": "Smile City", "c2": "North Dental"}
+HEADERS = {"x-api-key": settings.api_key}
+
+
+def _ts(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+class FakeFeedbackDB:
+    """chat_feedback rows plus both count RPCs, with the SQL functions' bound semantics."""
+
+    def __init__(self, feedback):
+        self.feedback = feedback
+        self.calls = []
+
+    def daily(self):
+        # What the statement-level triggers keep in chat_feedback_daily: (clinic, UTC day) -> counts.
+        days = {}
+        for f in self.feedback:
+            key = (f["clinic_id"], _ts(f["created_at"]).astimezone(timezone.utc).date())
+            days.setdefault(key, Counter())[f["rating"]] += 1
+        return days
+
+    @staticmethod
+    def _row(clinic_id, counts):
+        return {"clinic_id": clinic_id, "clinic_name": CLINICS[clinic_id],
+                "up": counts["up"], "down": counts["down"], "total": counts["up"] + counts["down"]}
+
+    def rollup(self, start_date=None, end_date=None):
+        start = _ts(start_date).astimezone(timezone.utc).date() if start_date else None
+        end = _ts(end_date).astimezone(timezone.utc).date() if end_date else None
+        totals = {}
+        for (clinic_id, day), counts in self.daily().items():
+            if (start is None or day >= start) and (end is None or day < end):
+                totals.setdefault(clinic_id, Counter()).update(counts)
+        return [self._row(c, counts) for c, counts in totals.items()]
+
+    def raw(self, start_date=None, end_date=None):
+        totals = {}
+        for f in self.feedback:
+            at = _ts(f["created_at"])
+            if (start_date is None or at >= _ts(start_date)) and (end_date is None or at <= _ts(end_date)):
+                totals.setdefault(f["clinic_id"], Counter())[f["rating"]] += 1
+        return [self._row(c, counts) for c, counts in totals.items()]
+
+    def rpc(self, name, params):
+        self.calls.append((name, params))
+        fn = {"get_clinic_feedback_rollup": self.rollup, "get_clinic_feedback_stats": self.raw}[name]
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=fn(**params)))
+
+
+@pytest.fixture
+def db(monkeypatch):
+    feedback = [
+        {"clinic_id": "c1", "rating": "up", "created_at": "2024-05-09T23:59:59+00:00"},  # day before the range
+        {"clinic_id": "c1", "rating": "up", "created_at": "2024-05-10T00:00:00+00:00"},
+        {"clinic_id": "c1", "rating": "down", "created_at": "2024-05-12T13:30:00+00:00"},
+        {"clinic_id": "c2", "rating": "up", "created_at": "2024-05-16T23:59:59.999+00:00"},
+        {"clinic_id": "c2", "rating": "down", "created_at": "2024-05-17T00:00:00+00:00"},  # day after the range
+        {"clinic_id": "c2", "rating": "up", "created_at": "2024-05-13T01:00:00+02:00"},  # 12 May in UTC
+    ]
+    fake = FakeFeedbackDB(feedback)
+    monkeypatch.setattr('app.supabase_db.get_supabase_client', lambda: fake)
+    return fake
+
+
+def test_reconcile_matches_rollup_and_raw_counts_over_whole_days(db):
+    res = TestClient(app).get('/admin/feedback-counts/reconcile?start_date=2024-05-10&end_date=2024-05-16', headers=HEADERS)
+
+    assert res.json() == {"ok": True, "clinics_checked": 2, "mismatches": []}
+    rollup_params = next(p for name, p in db.calls if name == "get_clinic_feedback_rollup")
+    assert rollup_params == {"start_date": "2024-05-10T00:00:00+00:00", "end_date": "2024-05-17T00:00:00+00:00"}
+
+
+def test_reconcile_reports_a_drifted_rollup(db, monkeypatch):
+    drifted = db.rollup
+
+    def rollup(**params):
+        rows = drifted(**params)
+        rows[0]["up"] += 1
+        rows[0]["total"] += 1
+        return rows
+
+    monkeypatch.setattr(db, "rollup", rollup)
+    body = TestClient(app).get('/admin/feedback-counts/reconcile', headers=HEADERS).json()
+    assert body["ok"] is False and len(body["mismatches"]) == 1
+    assert body["mismatches"][0]["rollup"]["up"] == body["mismatches"][0]["raw"]["up"] + 1
+
+
+def test_rollup_end_bound_is_exclusive(db):
+    counts = TestClient(app).get(
+        '/admin/feedback-counts?start_date=2024-05-10&end_date=2024-05-17', headers=HEADERS,
+    ).json()["counts"]
+    assert {r["clinic_id"]: r["total"] for r in counts} == {"c1": 2, "c2": 2}
+
+    first = db.rollup("2024-05-03T00:00:00+00:00", "2024-05-10T00:00:00+00:00")
+    second = db.rollup("2024-05-10T00:00:00+00:00", "2024-05-17T00:00:00+00:00")
+    assert sum(r["total"] for r in first + second) == 5  # consecutive ranges share no day
+
+
+def test_weekly_summary_covers_the_last_seven_whole_days(monkeypatch):
+    ranges = []
+
+    def get_feedback_counts(start_date, end_date):
+        ranges.append((datetime.fromisoformat(start_date), datetime.fromisoformat(end_date)))
+        return []
+
+    monkeypatch.setattr(summary_service, "get_feedback_counts", get_feedback_counts)
+    summary_service.send_weekly_summary_email("owner@example.com")
+
+    start, end = ranges[0]
+    today = datetime.now(timezone.utc).date()
+    assert end == datetime.combine(today, datetime.min.time(), tzinfo=timezone.utc)
+    assert end - start == timedelta(days=7)
+    assert start.date() == today - timedelta(days=7)
@@ -0,0 +1,64 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app import http_clients
+from app.metrics import HTTP_CLIENT_CONNECTIONS, HTTP_CLIENT_REQUESTS
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        if self.path == "/slow-headers":
+            time.sleep(0.5)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        if self.path == "/slow-body":
+            self.wfile.flush()
+            time.sleep(0.5)
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    http_clients.reset()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    http_clients.reset()
+
+
+def _count(metric, *labels):
+    return metric.labels(*labels)._value.get()
+
+
+def test_clients_on_one_pool_reuse_connections(server):
+    opened = _count(HTTP_CLIENT_CONNECTIONS, "data")
+    sent = _count(HTTP_CLIENT_REQUESTS, "data", "http11")
+
+    for _ in range(2):
+        client = http_clients.sync_client("data", base_url=server)
+        for _ in range(3):
+            assert client.get("/").text == "ok"
+
+    assert _count(HTTP_CLIENT_REQUESTS, "data", "http11") - sent == 6
+    assert _count(HTTP_CLIENT_CONNECTIONS, "data") - opened == 1
+
+
+def test_first_byte_timeout_only_covers_response_headers(server, monkeypatch):
+    monkeypatch.setattr(http_clients.settings, "data_first_byte_timeout", 0.2)
+    monkeypatch.setattr(http_clients.settings, "http_read_timeout", 2.0)
+    client = http_clients.sync_client("data", base_url=server)
+
+    with pytest.raises(httpx.ReadTimeout):
+        client.get("/slow-headers")
+    assert client.get("/slow-body").text == "ok"
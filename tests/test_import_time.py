@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+# SDKs that must load on first use / during background startup, not on import.
+DEFERRED = ("openai", "supabase", "postgrest", "gotrue", "jinja2", "redis", "pyarrow")
+
+# Cumulative import time of app.main in a fresh interpreter; override on slow CI.
+BUDGET_SECONDS = float(os.environ.get("IMPORT_BUDGET_SECONDS", "0.8"))
+
+
+def _import_app() -> subprocess.CompletedProcess:
+    code = (
+        "import sys, app.main; "
+        f"print(','.join(m for m in {DEFERRED!r} if m in sys.modules))"
+    )
+    env = {**os.environ, "OPENAI_API_KEY": "test"}
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+
+
+def test_heavy_sdks_are_not_imported_with_the_app():
+    assert _import_app().stdout.strip() == ""
+
+
+def test_app_import_time_within_budget():
+    # -X importtime lines: "import time: self [us] | cumulative | name"
+    result = _import_app()
+    cumulative = next(
+        int(line.split("|")[1])
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:") and line.split("|")[2].strip() == "app.main"
+    )
+    assert cumulative / 1e6 < BUDGET_SECONDS, f"import app.main took {cumulative / 1e6:.2f}s"
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.routes.chat import DEMO_CLINICS
+from app.services import knowledge
+from app.services.knowledge import KnowledgeIndex
+
+IMPLANTS = """Dental implants
+
+An implant replaces a missing tooth root with a titanium post. Treatment takes two visits.
+
+Implant prices start at 18 000 kr including the crown."""
+HOURS = "We are open Monday to Friday 8-17 and Saturdays 10-14. Parking is available behind the building."
+
+
+@pytest.fixture(autouse=True)
+def knowledge_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "knowledge_dir", str(tmp_path))
+    knowledge.clear()
+    yield tmp_path
+    knowledge.clear()
+
+
+def _texts(index, query, k=3):
+    return [index.passage(pid)["text"] for _, pid in index.search(query, k)]
+
+
+def test_index_ranks_replaces_and_round_trips():
+    index = KnowledgeIndex()
+    index.add_document("implants", "Implants", IMPLANTS)
+    index.add_document("hours", "Opening hours", HOURS)
+
+    assert "18 000 kr" in _texts(index, "How much do implants cost?")[0]
+    assert "Saturdays" in _texts(index, "when are you open on saturday")[0]
+
+    index.add_document("hours", "Opening hours", "Closed for the summer in July.")
+    assert _texts(index, "parking") == []
+    assert "July" in _texts(index, "summer")[0]
+
+    loaded = KnowledgeIndex.from_bytes(index.to_bytes())
+    assert _texts(loaded, "implant price") == _texts(index, "implant price")
+
+
+def test_retrieve_keeps_within_token_budget():
+    knowledge.add_document("c1", "implants", "Implants", IMPLANTS)
+    knowledge.add_document("c1", "hours", "Opening hours", HOURS)
+
+    everything = knowledge.retrieve("c1", "implant opening hours parking", token_budget=10_000)
+    assert {p["doc_id"] for p in everything} == {"implants", "hours"}
+    budget = knowledge.estimate_tokens("Opening hours") + knowledge.estimate_tokens(HOURS)
+    assert [p["doc_id"] for p in knowledge.retrieve("c1", "opening hours parking implant", token_budget=budget)] == ["hours"]
+    assert knowledge.retrieve("no-docs", "implant") == []
+
+
+def test_uploaded_document_reaches_chat_prompt(monkeypatch):
+    monkeypatch.setattr('app.routes.admin.clinic_cache.get_clinic', lambda cid: DEMO_CLINICS.get(cid))
+    seen = {}
+
+    async def completion(system, messages, model=None):
+        seen["system"] = system
+        return "ok"
+
+    monkeypatch.setattr('app.routes.chat.chat_completion', completion)
+    client = TestClient(app)
+    headers = {"X-API-Key": settings.api_key}
+
+    url = '/admin/clinics/smile-city-001/documents/implants?title=Implants'
+    assert client.put(url, content=IMPLANTS.encode(), headers={}).status_code == 401
+    res = client.put(url, content=IMPLANTS.encode(), headers=headers)
+    assert res.status_code == 200 and res.json()["passages"] >= 1
+    assert client.put('/admin/clinics/unknown/documents/x', content=b"text", headers=headers).status_code == 404
+
+    client.post('/chat', json={'clinic_id': 'smile-city-001', 'message': 'What does an implant cost?'})
+    assert "18 000 kr" in seen["system"]
+
+    assert client.delete('/admin/clinics/smile-city-001/documents/implants', headers=headers).status_code == 200
+    client.post('/chat', json={'clinic_id': 'smile-city-001', 'message': 'What does an implant cost?'})
+    assert "18 000 kr" not in seen["system"]
+
+
+def test_slow_retrieval_runs_off_the_event_loop_and_is_skipped_at_deadline(monkeypatch):
+    threads = {}
+
+    def slow_retrieve(clinic_id, query):
+        threads["retrieve"] = threading.get_ident()
+        time.sleep(1.0)  # a cold index load
+        return [{"title": "Late", "text": "never used"}]
+
+    async def completion(system, messages, model=None):
+        threads["loop"] = threading.get_ident()
+        threads["system"] = system
+        return "ok"
+
+    monkeypatch.setattr('app.routes.chat.knowledge.retrieve', slow_retrieve)
+    monkeypatch.setattr('app.routes.chat.chat_completion', completion)
+    monkeypatch.setattr('app.routes.chat.settings.chat_deadline_seconds', 0.6)
+    monkeypatch.setattr('app.routes.chat.settings.chat_min_llm_seconds', 0.3)
+
+    res = TestClient(app).post('/chat', json={'clinic_id': 'smile-city-001', 'message': 'implant price'})
+    assert res.json()['reply'] == "ok"
+    assert threads["retrieve"] != threads["loop"]
+    assert "never used" not in threads["system"]
@@ -10,6 +10,8 @@ def patch_db_functions(monkeypatch):
     monkeypatch.setattr('app.routes.leads.get_clinic_by_public_id', lambda cid: {"id": "fake-clinic-1"} if cid == "test-clinic" else None)
     monkeypatch.setattr('app.routes.leads.get_or_create_session', lambda **kwargs: {"id": "sess-1"})
     monkeypatch.setattr('app.routes.leads.create_lead', lambda **kwargs: None)
+    from app.routes.leads import lead_dedupe
+    lead_dedupe.clear()
     # ensure rate limiter store is cleared for tests
     try:
         import app.rate_limit as rl
@@ -50,3 +52,42 @@ def test_lead_rate_limit():
         assert r.status_code == 200
     r6 = client.post('/leads', json=payload)
     assert r6.status_code == 429
+
+
+def test_lead_duplicates_are_dropped(monkeypatch):
+    created = []
+    monkeypatch.setattr('app.routes.leads.create_lead', lambda **kwargs: created.append(kwargs))
+    client = TestClient(app)
+    payload = {'clinic_id': 'test-clinic', 'session_id': 's3', 'name': 'B', 'phone': '+2', 'message': 'm'}
+
+    first = client.post('/leads', json=payload)
+    again = client.post('/leads', json=payload)
+    assert first.json() == {'ok': True, 'duplicate': False}
+    assert again.json() == {'ok': True, 'duplicate': True}
+
+    # An explicit key wins over content: same key with edited content is still a repeat
+    keyed = client.post('/leads', json={**payload, 'message': 'm2'}, headers={'Idempotency-Key': 'k1'})
+    retry = client.post('/leads', json={**payload, 'message': 'm3'}, headers={'Idempotency-Key': 'k1'})
+    assert keyed.json()['duplicate'] is False
+    assert retry.json()['duplicate'] is True
+    assert len(created) == 2
+
+
+def test_a_lead_that_was_not_kept_can_be_retried(monkeypatch):
+    attempts = []
+
+    def create_lead(**kwargs):
+        attempts.append(kwargs)
+        if len(attempts) == 1:
+            raise RuntimeError("connection reset")
+
+    monkeypatch.setattr('app.routes.leads.create_lead', create_lead)
+    client = TestClient(app)
+    payload = {'clinic_id': 'test-clinic', 'session_id': 's4', 'name': 'C', 'phone': '+3', 'message': 'm'}
+
+    # No contact email and the insert failed: the lead is nowhere, so the retry is processed
+    assert client.post('/leads', json=payload).json()['duplicate'] is False
+    assert client.post('/leads', json=payload).json()['duplicate'] is False
+    # Saved on the second try: from now on it is a duplicate
+    assert client.post('/leads', json=payload).json()['duplicate'] is True
+    assert len(attempts) == 2
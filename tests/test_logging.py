@@ -0,0 +1,56 @@
+import logging
+import queue
+
+import orjson
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.logging_config import (
+    ContextFilter,
+    DroppingQueueHandler,
+    JSONFormatter,
+    RequestContextMiddleware,
+    bind_clinic,
+)
+
+
+def _capture():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=10))
+    handler.addFilter(ContextFilter())
+    logger = logging.getLogger("test.logging")
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger, handler
+
+
+def test_records_carry_request_and_clinic_ids():
+    logger, handler = _capture()
+    app = FastAPI()
+    app.add_middleware(RequestContextMiddleware)
+
+    @app.get("/ping")
+    def ping():
+        bind_clinic("clinic-1")
+        logger.info("lead %s saved", "abc", extra={"lead_id": "abc"})
+        return {"ok": True}
+
+    client = TestClient(app)
+    response = client.get("/ping", headers={"X-Request-ID": "req-42"})
+    assert response.headers["x-request-id"] == "req-42"
+    assert client.get("/ping").headers["x-request-id"]
+
+    entry = orjson.loads(JSONFormatter().format(handler.queue.get_nowait()))
+    assert entry["msg"] == "lead abc saved"
+    assert entry["request_id"] == "req-42"
+    assert entry["clinic_id"] == "clinic-1"
+    assert entry["lead_id"] == "abc"
+    assert entry["level"] == "info"
+
+
+def test_full_queue_drops_instead_of_blocking():
+    logger, handler = _capture()
+    for i in range(25):
+        logger.warning("burst %d", i)
+    assert handler.queue.qsize() == 10
+    assert handler.dropped == 15
@@ -0,0 +1,212 @@
+import asyncio
+import time
+from email.message import EmailMessage
+
+from app.services.mailer import DeliveryStore, LeadDigest, MailQueue, SMTPPool
+
+
+def _pool(sink, size=2):
+    return SMTPPool("127.0.0.1", sink.port, starttls=False, timeout=5, size=size)
+
+
+def _msg(n: int) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = f"lead {n}"
+    msg["From"] = "bot@example.com"
+    msg["To"] = "clinic@example.com"
+    msg.set_content(f"body {n}")
+    return msg
+
+
+def test_pool_reuses_connection(smtp_sink):
+    pool = _pool(smtp_sink)
+    for i in range(5):
+        pool.send(_msg(i))
+    pool.close()
+    assert len(smtp_sink.messages) == 5
+    assert smtp_sink.connections == 1
+
+
+def test_queue_retries_transient_failure(smtp_sink):
+    smtp_sink.fail_next = 1
+
+    async def run():
+        queue = MailQueue(pool_factory=lambda: _pool(smtp_sink), maxsize=10, workers=1, max_attempts=3, retry_delay=0.01)
+        await queue.start()
+        assert queue.submit(_msg(1))
+        await queue.stop()
+        return queue.stats
+
+    stats = asyncio.run(run())
+    assert stats["sent"] == 1
+    assert stats["retried"] == 1
+    assert len(smtp_sink.messages) == 1
+
+
+def test_queue_is_bounded(smtp_sink):
+    async def run():
+        queue = MailQueue(pool_factory=lambda: _pool(smtp_sink), maxsize=1, workers=1)
+        assert not queue.submit(_msg(0))  # not started
+        await queue.start()
+        accepted = [queue.submit(_msg(i)) for i in range(3)]
+        await queue.stop()
+        return accepted, queue.stats
+
+    accepted, stats = asyncio.run(run())
+    assert accepted == [True, False, False]
+    assert stats["dropped"] == 2
+
+
+def test_digest_batches_leads_per_clinic(smtp_sink):
+    def build(to_email, clinic_name, leads):
+        msg = _msg(len(leads))
+        msg.replace_header("Subject", f"{len(leads)} leads for {clinic_name}")
+        return msg
+
+    async def run():
+        queue = MailQueue(pool_factory=lambda: _pool(smtp_sink), maxsize=10, workers=1)
+        await queue.start()
+        digest = LeadDigest(queue, build, max_leads=10)
+        for i in range(3):
+            digest.add("clinic@example.com", "Smile", {"name": f"n{i}"}, window_seconds=0.05)
+        digest.add("other@example.com", "Other", {"name": "x"}, window_seconds=30)
+        await asyncio.sleep(0.2)
+        assert digest.pending == 1
+        digest.flush_all()
+        await queue.stop()
+
+    asyncio.run(run())
+    subjects = sorted(m.split("Subject: ")[1].split("\n")[0].strip() for m in smtp_sink.messages)
+    assert subjects == ["1 leads for Other", "3 leads for Smile"]
+    assert smtp_sink.connections == 1
+
+
+def test_enqueue_is_idempotent_per_key(smtp_sink):
+    sent = []
+
+    async def run():
+        queue = MailQueue(pool_factory=lambda: _pool(smtp_sink), maxsize=10, workers=1)
+        await queue.start()
+        # Called from a worker thread, as the sync admin routes do.
+        first = await asyncio.to_thread(queue.enqueue, _msg(1), "onboarding:smile", lambda: sent.append(1))
+        again = await asyncio.to_thread(queue.enqueue, _msg(1), "onboarding:smile")
+        await queue.stop()
+        return first, again, queue.delivery(first)
+
+    first, again, delivery = asyncio.run(run())
+    assert first and again == first
+    assert delivery["status"] == "sent"
+    assert sent == [1]
+    assert len(smtp_sink.messages) == 1
+
+
+class FakeDeliveryStore(DeliveryStore):
+    """mail_deliveries shared by several queues, as the table is by several workers."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def create(self, record, message, worker):
+        key = record["key"]
+        existing = next((r for r in self.rows.values() if key and r["key"] == key), None)
+        if existing and existing["status"] != "failed":
+            return existing["id"]
+        if existing:
+            existing["key"] = None
+        self.rows[record["id"]] = dict(record, message=message, claimed_by=worker, claimed_at=time.time())
+        return record["id"]
+
+    def update(self, delivery_id, fields):
+        self.rows[delivery_id].update(fields, claimed_at=time.time())
+
+    def get(self, delivery_id):
+        row = self.rows.get(delivery_id)
+        return {k: v for k, v in row.items() if k not in ("message", "claimed_by", "claimed_at")} if row else None
+
+    def claim(self, worker, stale_seconds, limit):
+        stale = [
+            r for r in self.rows.values()
+            if r["status"] in ("queued", "sending", "retrying")
+            and (r["claimed_at"] is None or r["claimed_at"] < time.time() - stale_seconds)
+            and r["claimed_by"] != worker
+        ][:limit]
+        for r in stale:
+            r.update(claimed_by=worker, claimed_at=time.time(), status="queued")
+        return [dict(r, idempotency_key=r["key"]) for r in stale]
+
+    def touch(self, worker, delivery_ids):
+        for i in delivery_ids:
+            if self.rows.get(i, {}).get("claimed_by") == worker:
+                self.rows[i]["claimed_at"] = time.time()
+
+    def release(self, worker):
+        for r in self.rows.values():
+            if r["claimed_by"] == worker and r["status"] in ("queued", "sending", "retrying"):
+                r.update(claimed_by=None, claimed_at=None)
+
+
+def test_stored_deliveries_are_shared_across_workers(smtp_sink):
+    store = FakeDeliveryStore()
+
+    async def run():
+        a = MailQueue(pool_factory=lambda: _pool(smtp_sink), maxsize=10, workers=1, store_factory=lambda: store)
+        b = MailQueue(pool_factory=lambda: _pool(smtp_sink), maxsize=10, workers=1, store_factory=lambda: store)
+        await a.start()
+        await b.start()
+        first = await asyncio.to_thread(a.enqueue, _msg(1), "onboarding:smile")
+        again = await asyncio.to_thread(b.enqueue, _msg(1), "onboarding:smile")
+        lead = a.enqueue(_msg(2))  # from the loop: stored in the background
+        await a.stop()
+        await b.stop()
+        return first, again, lead, await asyncio.to_thread(b.delivery, first)
+
+    first, again, lead, polled = asyncio.run(run())
+    assert again == first
+    assert polled["status"] == "sent" and polled["to"] == "clinic@example.com"
+    assert store.rows[lead]["status"] == "sent"
+    assert len(smtp_sink.messages) == 2
+
+
+def test_mail_left_by_a_dead_worker_is_recovered(smtp_sink):
+    store = FakeDeliveryStore()
+    marked = []
+
+    async def run():
+        dead = MailQueue(pool_factory=lambda: _pool(smtp_sink), maxsize=10, workers=1, store_factory=lambda: store)
+        await dead.start()
+        for task in dead._tasks:  # the process dies before its worker sends anything
+            task.cancel()
+        delivery_id = await asyncio.to_thread(dead.enqueue, _msg(1), "onboarding:smile")
+        await asyncio.gather(*dead._tasks, return_exceptions=True)
+        assert store.rows[delivery_id]["status"] == "queued"
+
+        live = MailQueue(
+            pool_factory=lambda: _pool(smtp_sink), maxsize=10, workers=1,
+            store_factory=lambda: store, stale_seconds=0,
+        )
+        live.register_sent_hook("onboarding", marked.append)
+        await live.start()
+        await asyncio.sleep(0.2)
+        await live.stop()
+        return delivery_id, live
+
+    delivery_id, live = asyncio.run(run())
+    assert store.rows[delivery_id]["status"] == "sent"
+    assert live.stats["recovered"] == 1
+    assert marked == ["smile"]
+    assert len(smtp_sink.messages) == 1
+
+
+def test_weekly_summary_goes_through_the_pooled_direct_send(smtp_sink, monkeypatch):
+    from app.services import summary_service
+    from app.utils import email
+
+    monkeypatch.setattr(email, "_direct_pool", _pool(smtp_sink))
+    monkeypatch.setattr(summary_service, "get_feedback_counts", lambda **kw: [
+        {"clinic_name": "Smile City", "up": 3, "down": 1, "total": 4},
+    ])
+    summary_service.send_weekly_summary_email("owner@example.com")
+    summary_service.send_weekly_summary_email("owner@example.com")
+
+    assert len(smtp_sink.messages) == 2 and smtp_sink.connections == 1
+    assert "Weekly Feedback Summary" in smtp_sink.messages[0]
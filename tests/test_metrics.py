@@ -0,0 +1,32 @@
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+
+
+def test_chat_reports_stage_timings(monkeypatch):
+    async def fake_completion(system, messages, model=None):
+        return "Hello!"
+
+    monkeypatch.setattr('app.routes.chat.chat_completion', fake_completion)
+    client = TestClient(app)
+
+    res = client.post('/chat', json={'clinic_id': 'smile-city-001', 'message': 'hello'})
+    assert res.status_code == 200
+    timing = res.headers['server-timing']
+    for name in ('clinic_lookup', 'guardrails', 'llm_total', 'app'):
+        assert f'{name};dur=' in timing
+
+    metrics = client.get('/metrics', headers={'X-API-Key': settings.api_key}).text
+    assert 'request_stage_seconds_count{route="/chat",stage="llm_total"}' in metrics
+    assert 'guardrail_outcomes_total{clinic="smile-city-001",outcome="pass",route="/chat"}' in metrics
+
+
+def test_metrics_require_the_scrape_token(monkeypatch):
+    monkeypatch.setattr(settings, 'metrics_token', 'scrape-secret')
+    client = TestClient(app)
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+    assert client.get('/metrics', headers={'X-API-Key': settings.api_key}).status_code == 200
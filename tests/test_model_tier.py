@@ -0,0 +1,54 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.metrics import MODEL_TIER_FEEDBACK_TOTAL
+from app.services import model_tier
+
+
+def test_classifier_sends_only_simple_turns_to_fast_tier():
+    assert model_tier.classify("hi!", history_depth=0)[0] == "fast"
+    assert model_tier.classify("Are you open on Saturday?", history_depth=2) == ("fast", "simple", "hours")
+    assert model_tier.classify("How much does an implant cost?", history_depth=0) == ("quality", "intent", "pricing")
+    assert model_tier.classify("Do you take SmileCare insurance?", history_depth=0)[2] == "insurance"
+    assert model_tier.classify("Where are you? When do you open?", history_depth=0)[1] == "multi_question"
+    assert model_tier.classify("where " * 40, history_depth=0)[1] == "long_message"
+    assert model_tier.classify("ok", history_depth=20)[1] == "deep_history"
+
+
+def test_unmatched_and_swedish_questions_are_not_sent_to_fast_tier():
+    assert model_tier.classify("Vad kostar implantat?", history_depth=0) == ("quality", "intent", "pricing")
+    assert model_tier.classify("Täcker högkostnadsskyddet det?", history_depth=0)[2] == "insurance"
+    assert model_tier.classify("Hur lång tid tar en rotfyllning?", history_depth=0)[2] == "treatment"
+    assert model_tier.classify("Har ni öppet på lördag?", history_depth=0) == ("fast", "simple", "hours")
+    assert model_tier.classify("Hej!", history_depth=0) == ("fast", "simple", "greeting")
+    assert model_tier.classify("Is it normal that my gum bleeds?", history_depth=0) == ("quality", "unknown_intent", "other")
+    assert model_tier.classify("Gör det ont?", history_depth=0) == ("quality", "unknown_intent", "other")
+
+
+def test_plan_policy_pins_tier(monkeypatch):
+    monkeypatch.setattr('app.services.model_tier.settings.model_tier_by_plan_config', "free:fast,enterprise:quality")
+    monkeypatch.setattr('app.services.model_tier.settings.openai_model', "quality-model")
+    monkeypatch.setattr('app.services.model_tier.settings.openai_fast_model', "fast-model")
+
+    assert model_tier.choose({"plan": "free"}, "How much are veneers?", 0)["model"] == "fast-model"
+    assert model_tier.choose({"plan": "enterprise"}, "hi", 0)["model"] == "quality-model"
+    assert model_tier.choose({"plan": "pro"}, "hi", 0)["reason"] == "simple"
+
+
+def test_chat_uses_chosen_model_and_feedback_is_attributed(monkeypatch):
+    monkeypatch.setattr('app.services.model_tier.settings.openai_fast_model', "fast-model")
+    used = []
+
+    async def completion(system, messages, model=None):
+        used.append(model)
+        return "Hello!"
+
+    monkeypatch.setattr('app.routes.chat.chat_completion', completion)
+    client = TestClient(app)
+    before = MODEL_TIER_FEEDBACK_TOTAL.labels("fast", "up")._value.get()
+
+    res = client.post('/chat', json={'clinic_id': 'smile-city-001', 'message': 'hello', 'session_id': 'tier-s1'})
+    assert res.status_code == 200 and used == ["fast-model"]
+
+    client.post('/chat/feedback', json={'clinic_id': 'smile-city-001', 'session_id': 'tier-s1', 'rating': 'up'})
+    assert MODEL_TIER_FEEDBACK_TOTAL.labels("fast", "up")._value.get() == before + 1
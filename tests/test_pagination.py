@@ -0,0 +1,129 @@
+import base64
+import json
+import re
+import uuid
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.supabase_db import _keyset_filter, fetch_keyset_page, iter_keyset_pages
+from app.utils.pagination import decode_cursor, encode_cursor
+
+_FILTER_RE = re.compile(r'^created_at\.(lt|gt)\."([^"]+)",and\(created_at\.eq\."([^"]+)",id\.(lt|gt)\.([0-9a-f-]+)\)$')
+
+
+class FakeQuery:
+    """Just enough of a postgrest select builder to run keyset paging over a list of rows."""
+
+    def __init__(self, rows, log):
+        self.rows = rows
+        self.params = httpx.QueryParams()
+        self.filter = None
+        self.count = None
+        log.append(self)
+
+    def or_(self, filters):
+        self.filter = filters
+        return self
+
+    def limit(self, count):
+        self.count = count
+        return self
+
+    def execute(self):
+        direction = self.params["order"].split(",")[0].split(".")[1]
+        rows = sorted(self.rows, key=lambda r: (r["created_at"], r["id"]), reverse=direction == "desc")
+        if self.filter:
+            op, created_at, tie_at, id_op, row_id = _FILTER_RE.match(self.filter).groups()
+            assert id_op == op and tie_at == created_at
+            after = (created_at, row_id)
+            rows = [r for r in rows if ((r["created_at"], r["id"]) < after if op == "lt" else (r["created_at"], r["id"]) > after)]
+        return SimpleNamespace(data=rows[:self.count])
+
+
+def _rows(n, same_time_every=3):
+    # Every `same_time_every` rows share a created_at, so paging has to break ties on id.
+    return [
+        {"id": str(uuid.UUID(int=i * 7919 % 1000)), "created_at": f"2024-05-01T10:00:{i // same_time_every:02d}+00:00"}
+        for i in range(n)
+    ]
+
+
+def _token(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+def test_keyset_filter_compares_created_at_then_id():
+    cursor = ("2024-05-01T10:00:00+00:00", "00000000-0000-0000-0000-00000000002a")
+    assert _keyset_filter(cursor) == (
+        'created_at.lt."2024-05-01T10:00:00+00:00",'
+        'and(created_at.eq."2024-05-01T10:00:00+00:00",id.lt.00000000-0000-0000-0000-00000000002a)'
+    )
+    assert _keyset_filter(cursor, desc=False).startswith('created_at.gt."2024-05-01T10:00:00+00:00",')
+
+
+@pytest.mark.parametrize("desc", [True, False])
+def test_iter_keyset_pages_visits_every_row_once_across_ties(desc):
+    rows = _rows(23)
+    queries = []
+    pages = list(iter_keyset_pages(lambda: FakeQuery(rows, queries), page_size=4, desc=desc))
+
+    assert [len(p) for p in pages] == [4, 4, 4, 4, 4, 3]
+    seen = [(r["created_at"], r["id"]) for page in pages for r in page]
+    assert seen == sorted(((r["created_at"], r["id"]) for r in rows), reverse=desc)
+    assert queries[0].filter is None and all(q.filter for q in queries[1:])
+    assert queries[0].params["order"] == ("created_at.desc,id.desc" if desc else "created_at.asc,id.asc")
+
+
+def test_fetch_keyset_page_cursor_round_trips_through_token():
+    rows = _rows(10)
+    cursor, seen = None, []
+    while True:
+        page, next_cursor = fetch_keyset_page(lambda: FakeQuery(rows, []), cursor, limit=3)
+        seen += [r["id"] for r in page]
+        if next_cursor is None:
+            break
+        cursor = decode_cursor(encode_cursor(next_cursor))
+        assert cursor == next_cursor
+    assert sorted(seen) == sorted(r["id"] for r in rows) and len(seen) == 10
+
+
+@pytest.mark.parametrize("value", [
+    ["2024-05-01T10:00:00+00:00", "not-a-uuid"],
+    ['2024-05-01T10:00:00+00:00",id.gt.0),or(id.gt', "00000000-0000-0000-0000-00000000002a"],
+    ["2024-05-01T10:00:00+00:00", "00000000-0000-0000-0000-00000000002a,id.gt.0"],
+    {"created_at": "2024-05-01T10:00:00+00:00", "id": "00000000-0000-0000-0000-00000000002a"},
+    ["2024-05-01T10:00:00+00:00", "00000000-0000-0000-0000-00000000002a", "extra"],
+    ["2024-05-01T10:00:00+00:00", 42],
+])
+def test_decode_cursor_rejects_anything_but_a_timestamp_uuid_pair(value):
+    with pytest.raises(ValueError):
+        decode_cursor(_token(value))
+
+
+def test_decode_cursor_normalizes_postgrest_timestamps():
+    row_id = "00000000-0000-0000-0000-00000000002A"
+    assert decode_cursor(_token(["2024-05-01T10:00:00.12Z", row_id])) == (
+        "2024-05-01T10:00:00.120000+00:00", row_id.lower(),
+    )
+
+
+def test_bad_cursor_is_a_400_on_listing_routes(monkeypatch):
+    def list_clinics(*args, **kwargs):
+        raise AssertionError("a bad cursor must not reach the database")
+
+    monkeypatch.setattr('app.routes.admin.list_clinics', list_clinics)
+    monkeypatch.setattr('app.routes.clinics.list_clinics', list_clinics)
+    client = TestClient(app)
+    bad = _token(['2024-05-01",id.gt.0', "x"])
+
+    res = client.get(f'/admin/clinics?cursor={bad}', headers={"x-api-key": settings.api_key})
+    assert res.status_code == 400
+    res = client.get(f'/clinics/debug/ids?cursor={bad}', headers={"X-API-Key": settings.api_key})
+    assert res.status_code == 400
+    res = client.get('/clinics/debug/ids?cursor=%%%', headers={"X-API-Key": settings.api_key})
+    assert res.status_code == 400
@@ -0,0 +1,45 @@
+import json
+import time
+
+import pytest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.profiling import ProfilingMiddleware
+
+pytest.importorskip("pyinstrument")
+
+
+def _busy_app(tmp_path=None, sample_rate=0.0):
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, sample_rate=sample_rate, directory=str(tmp_path) if tmp_path else None, keep=2)
+
+    @app.get("/busy")
+    async def busy():
+        end = time.perf_counter() + 0.02
+        while time.perf_counter() < end:
+            pass
+        return {"ok": True}
+
+    return app
+
+
+def test_profile_needs_api_key_and_returns_call_tree():
+    client = TestClient(_busy_app())
+    assert client.get('/busy', headers={'X-Profile': '1'}).json() == {'ok': True}
+
+    res = client.get('/busy', headers={'X-Profile': '1', 'X-API-Key': settings.api_key})
+    assert res.headers['content-type'].startswith('text/plain')
+    assert 'busy' in res.text
+
+    res = client.get('/busy?profile=1&profile_format=speedscope', headers={'X-API-Key': settings.api_key})
+    assert 'shared' in json.loads(res.text)
+
+
+def test_sampled_profiles_rotate(tmp_path):
+    client = TestClient(_busy_app(tmp_path, sample_rate=1.0))
+    for _ in range(3):
+        assert client.get('/busy').json() == {'ok': True}
+    assert len(list(tmp_path.glob('*.speedscope.json'))) == 2
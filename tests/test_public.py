@@ -0,0 +1,41 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import clinic_cache
+
+
+def test_public_clinic_etag_and_304(monkeypatch):
+    clinic = {"id": "u1", "clinic_id": "etag-clinic", "clinic_name": "Etag Dental", "location": "Main St"}
+    monkeypatch.setattr('app.services.clinic_cache.get_clinic_by_public_id', lambda cid: dict(clinic) if cid == "etag-clinic" else None)
+    clinic_cache.clear()
+    client = TestClient(app)
+
+    first = client.get('/public/clinic/etag-clinic')
+    etag = first.headers['etag']
+    assert first.status_code == 200
+    assert 'stale-while-revalidate' in first.headers['cache-control']
+    assert first.json()['clinic_name'] == "Etag Dental"
+
+    cached = client.get('/public/clinic/etag-clinic', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['etag'] == etag
+
+    # A changed profile gets a new ETag, so the old one no longer matches
+    clinic_cache.prime([{**clinic, "location": "New St"}])
+    changed = client.get('/public/clinic/etag-clinic', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['etag'] != etag
+    assert client.get('/public/clinic/missing').status_code == 404
+
+
+def test_public_etag_ignores_private_columns(monkeypatch):
+    clinic = {"id": "u2", "clinic_id": "private-clinic", "clinic_name": "Quiet Dental", "retention_days": None}
+    monkeypatch.setattr('app.services.clinic_cache.get_clinic_by_public_id', lambda cid: dict(clinic))
+    clinic_cache.clear()
+    client = TestClient(app)
+    etag = client.get('/public/clinic/private-clinic').headers['etag']
+
+    clinic_cache.prime([{**clinic, "onboarding_email_sent_at": "2024-05-24T10:00:00+00:00",
+                         "retention_days": 30, "lead_digest_minutes": 15}])
+    res = client.get('/public/clinic/private-clinic', headers={'If-None-Match': etag})
+    assert res.status_code == 304 and res.headers['etag'] == etag
@@ -0,0 +1,225 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import Settings, settings
+from app.main import app
+from app.services import retention_service
+from app.services.retention_service import ARCHIVE_SUMMARY_CHARS, retention_days_for, run_retention
+
+NOW = datetime.now(timezone.utc)
+
+
+def _ago(days: float) -> str:
+    return (NOW - timedelta(days=days)).isoformat()
+
+
+class FakeStore:
+    """In-memory stand-in for the chat_messages / chat_session_archives calls the job makes."""
+
+    def __init__(self, clinics, messages):
+        self.clinics = clinics
+        self.messages = {m["id"]: m for m in messages}
+        self.archives = {}
+        self.cutoffs = {}
+        self.pages = []
+        self.deletes = []
+
+    def iter_retention_clinics(self):
+        yield self.clinics[:2]
+        yield self.clinics[2:]
+
+    def iter_expired_messages(self, clinic_uuid, cutoff, page_size=500):
+        self.cutoffs[clinic_uuid] = cutoff
+        expired = sorted(
+            (m for m in self.messages.values() if m["clinic"] == clinic_uuid and m["created_at"] < cutoff),
+            key=lambda m: (m["created_at"], m["id"]),
+        )
+        for i in range(0, len(expired), page_size):
+            page = expired[i:i + page_size]
+            self.pages.append(len(page))
+            yield page
+
+    def get_session_archives(self, session_uuids):
+        return [self.archives[s] for s in session_uuids if s in self.archives]
+
+    def upsert_session_archives(self, rows):
+        for row in rows:
+            self.archives[row["session_id"]] = row
+
+    def delete_messages(self, ids):
+        self.deletes.append(len(ids))
+        for message_id in ids:
+            del self.messages[message_id]
+
+    def ensure_message_partitions(self):
+        return ["chat_messages_2024_06"]
+
+
+def _messages(clinic, session, count, age_days, content="hello world"):
+    return [
+        {
+            "id": f"{clinic}-{session}-{age_days}-{i}",
+            "clinic": clinic,
+            "session_id": session,
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": content,
+            "created_at": _ago(age_days + i / 1000),
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def store(monkeypatch):
+    clinics = [
+        {"id": "free-clinic", "plan": "free", "retention_days": None},
+        {"id": "pro-clinic", "plan": "pro", "retention_days": None},
+        {"id": "keep-clinic", "plan": "free", "retention_days": 0},
+        {"id": "custom-clinic", "plan": "pro", "retention_days": 7},
+    ]
+    messages = (
+        _messages("free-clinic", "s1", 5, 40)
+        + _messages("free-clinic", "s2", 2, 10)
+        + _messages("pro-clinic", "s3", 3, 100)
+        + _messages("pro-clinic", "s4", 4, 200)
+        + _messages("keep-clinic", "s5", 3, 2000)
+        + _messages("custom-clinic", "s6", 2, 8)
+    )
+    fake = FakeStore(clinics, messages)
+    for name in ("iter_retention_clinics", "iter_expired_messages", "get_session_archives",
+                 "upsert_session_archives", "delete_messages", "ensure_message_partitions"):
+        monkeypatch.setattr(retention_service, name, getattr(fake, name))
+    monkeypatch.setattr(settings, "chat_retention_days_by_plan", "free:30,pro:180")
+    monkeypatch.setattr(settings, "chat_retention_days", 365)
+    return fake
+
+
+def test_retention_window_prefers_clinic_then_plan_then_default(monkeypatch):
+    monkeypatch.setattr(settings, "chat_retention_days_by_plan", "free:30,pro:180")
+    assert retention_days_for({"plan": "free"}) == 30
+    assert retention_days_for({"plan": "pro", "retention_days": 7}) == 7
+    assert retention_days_for({"plan": "free", "retention_days": 0}) == 0
+    assert retention_days_for({"plan": "enterprise"}) == settings.chat_retention_days
+
+
+def test_archive_run_compacts_deletes_and_reports_reclaimed_bytes(store):
+    report = run_retention(mode="archive", batch_size=100)
+
+    assert store.cutoffs.keys() == {"free-clinic", "pro-clinic", "custom-clinic"}
+    assert store.cutoffs["free-clinic"][:10] == _ago(30)[:10]
+    assert {m["session_id"] for m in store.messages.values()} == {"s2", "s3", "s5"}
+
+    assert report["complete"] is True
+    assert report["clinics_processed"] == 3
+    assert report["messages_deleted"] == 5 + 4 + 2
+    assert report["bytes_deleted"] == 11 * len("hello world")
+    assert report["partitions"] == ["chat_messages_2024_06"]
+
+    archive = store.archives["s1"]
+    assert archive["clinic_id"] == "free-clinic" and archive["message_count"] == 5
+    assert archive["content_bytes"] == 5 * len("hello world")
+    assert archive["first_message_at"] < archive["last_message_at"]
+    assert archive["summary"].startswith("user: hello world\nassistant: hello world")
+    assert report["sessions_compacted"] == 3
+    assert report["bytes_archived"] == sum(len(a["summary"].encode()) for a in store.archives.values())
+    assert report["bytes_reclaimed"] == report["bytes_deleted"] - report["bytes_archived"]
+
+    assert retention_service.LAST_REPORT is report
+
+
+def test_batches_are_bounded_and_a_cut_short_run_resumes(store):
+    report = run_retention(mode="delete", batch_size=2, max_batches=3)
+
+    assert store.pages == [2, 2, 1, 2]  # the fourth page is fetched but not processed
+    assert store.deletes == [2, 2, 1]
+    assert report["batches"] == 3 and report["complete"] is False
+    assert report["messages_deleted"] == 5
+    assert store.archives == {}
+
+    report = run_retention(mode="delete", batch_size=2, max_batches=10)
+    assert report["complete"] is True and report["messages_deleted"] == 6
+    assert all(size <= 2 for size in store.deletes)
+
+
+def test_archive_summary_accumulates_across_runs_and_is_capped(store):
+    store.messages = {m["id"]: m for m in _messages("free-clinic", "s1", 40, 50, content="x" * 100)}
+
+    run_retention(mode="archive", batch_size=10, max_batches=1)
+    first = dict(store.archives["s1"])
+    run_retention(mode="archive", batch_size=10, max_batches=10)
+    archive = store.archives["s1"]
+
+    assert first["message_count"] == 10
+    assert archive["message_count"] == 40
+    assert archive["content_bytes"] == 40 * 100
+    assert archive["first_message_at"] == first["first_message_at"]
+    assert len(archive["summary"]) == ARCHIVE_SUMMARY_CHARS
+
+
+def test_dry_run_counts_without_writing(store):
+    before = dict(store.messages)
+    report = run_retention(mode="archive", dry_run=True)
+
+    assert store.messages == before and store.archives == {} and store.deletes == []
+    assert report["messages_deleted"] == 11 and report["sessions_compacted"] == 3
+    assert "partitions" not in report
+
+
+def test_partition_failure_is_reported_and_purge_continues(store, monkeypatch, caplog):
+    def fail():
+        raise RuntimeError("must be owner of table chat_messages")
+
+    monkeypatch.setattr(retention_service, "ensure_message_partitions", fail)
+    with caplog.at_level("ERROR", logger="app.services.retention_service"):
+        report = run_retention(mode="delete")
+
+    assert report["partitions_error"] == "must be owner of table chat_messages"
+    assert report["messages_deleted"] == 11
+    assert any(r.levelname == "ERROR" for r in caplog.records)
+
+
+def test_cron_route_runs_inline_and_serves_last_report(store):
+    client = TestClient(app)
+    headers = {"x-api-key": settings.api_key}
+
+    assert client.post('/admin/cron/retention?mode=shred', headers=headers).status_code == 400
+    assert client.post('/admin/cron/retention?wait=true').status_code == 401
+
+    res = client.post('/admin/cron/retention?wait=true&mode=delete', headers=headers)
+    assert res.status_code == 200 and res.json()["report"]["messages_deleted"] == 11
+    assert client.get('/admin/cron/retention', headers=headers).json()["report"]["mode"] == "delete"
+
+
+def test_nothing_is_purged_until_a_window_is_configured(store, monkeypatch):
+    monkeypatch.setattr(settings, "chat_retention_days_by_plan", "")
+    monkeypatch.setattr(settings, "chat_retention_days", Settings.model_fields["chat_retention_days"].default)
+    report = run_retention(mode="delete")
+
+    assert settings.chat_retention_days == 0
+    assert store.cutoffs.keys() == {"custom-clinic"}  # only the clinic that set retention_days
+    assert report["messages_deleted"] == 2
+
+
+def test_failed_delete_after_archiving_does_not_double_count(store, monkeypatch):
+    store.messages = {m["id"]: m for m in _messages("free-clinic", "s1", 6, 50)}
+    delete = store.delete_messages
+
+    def failing_delete(ids):
+        raise RuntimeError("statement timeout")
+
+    monkeypatch.setattr(retention_service, "delete_messages", failing_delete)
+    with pytest.raises(RuntimeError):
+        run_retention(mode="archive", batch_size=4)
+    assert store.archives["s1"]["message_count"] == 4 and len(store.messages) == 6
+
+    monkeypatch.setattr(retention_service, "delete_messages", delete)
+    report = run_retention(mode="archive", batch_size=4)
+    archive = store.archives["s1"]
+
+    assert store.messages == {}
+    assert archive["message_count"] == 6
+    assert archive["content_bytes"] == 6 * len("hello world")
+    assert archive["summary"].count("hello world") == 6
+    assert report["messages_deleted"] == 6
@@ -0,0 +1,27 @@
+import gzip
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.static_assets import asset_path, versioned_widget_src
+
+
+def test_widget_served_fingerprinted_and_compressed():
+    client = TestClient(app)
+    plain = client.get('/static/widget.js', headers={'Accept-Encoding': 'identity'})
+    assert plain.status_code == 200
+    assert 'immutable' not in plain.headers['cache-control']
+
+    path = asset_path('widget.js')
+    assert path != '/static/widget.js' and path.endswith('.js')
+    gz = client.get(path, headers={'Accept-Encoding': 'gzip'})
+    assert gz.headers['content-encoding'] == 'gzip'
+    assert 'immutable' in gz.headers['cache-control']
+    assert gz.content == plain.content  # httpx decodes the gzip body
+
+    again = client.get(path, headers={'Accept-Encoding': 'gzip', 'If-None-Match': gz.headers['etag']})
+    assert again.status_code == 304
+
+    assert client.get('/static/nope.js').status_code == 404
+    assert versioned_widget_src('https://api.example.com/static/widget.js') == 'https://api.example.com' + path
+    assert versioned_widget_src('https://cdn.example.com/w.js') == 'https://cdn.example.com/w.js'
@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import clinic_cache
+from app.services.warmup import Warmup, prefetch_clinics, warmup
+
+
+def test_failed_steps_are_recorded_and_worker_still_becomes_ready():
+    async def ok():
+        return 3
+
+    async def broken():
+        raise RuntimeError("supabase down")
+
+    async def slow():
+        await asyncio.sleep(5)
+
+    w = Warmup()
+    asyncio.run(w.run([("ok", ok), ("broken", broken)]))
+    assert w.ready and not w.timed_out
+    assert w.steps["ok"] == {"status": "ok", "seconds": w.steps["ok"]["seconds"], "result": 3}
+    assert w.steps["broken"]["status"] == "failed"
+
+    w = Warmup()
+    asyncio.run(w.run([("slow", slow)], timeout=0.05))
+    assert w.ready and w.timed_out
+
+
+def test_prefetch_primes_cache_up_to_limit(monkeypatch):
+    pages = [[{"id": f"u{i}", "clinic_id": f"warm-{i}", "clinic_name": f"Warm Dental {i}"} for i in range(p * 3, p * 3 + 3)] for p in range(3)]
+    monkeypatch.setattr('app.supabase_db.iter_active_clinics', lambda page_size: iter(pages))
+    monkeypatch.setattr('app.services.clinic_cache.get_clinic_by_public_id', lambda cid: None)
+    clinic_cache.clear()
+
+    assert prefetch_clinics(limit=5) == 5
+    assert clinic_cache.get_clinic("warm-4")["clinic_name"] == "Warm Dental 4"
+    assert clinic_cache.get_clinic("warm-5") is None
+
+
+def test_ready_only_after_warmup(monkeypatch):
+    monkeypatch.setattr('app.main.settings.warmup_enabled', False)
+    warmup.reset()
+    assert TestClient(app).get('/ready').status_code == 503
+
+    with TestClient(app) as client:
+        assert client.get('/health').status_code == 200
+        deadline = time.monotonic() + 10
+        while client.get('/ready').status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        body = client.get('/ready').json()
+    assert body["ready"] is True
+    assert {"redis", "static_assets", "sdks"} <= set(body["steps"])
@@ -0,0 +1,36 @@
+from app.workers import check_shared_state, reset_after_fork
+
+
+def test_shared_state_warnings_only_with_multiple_workers(monkeypatch):
+    monkeypatch.setattr('app.workers.settings.web_concurrency', 1)
+    assert check_shared_state() == []
+
+    monkeypatch.setattr('app.workers.settings.web_concurrency', 4)
+    monkeypatch.setattr('app.workers.settings.redis_url', "")
+    issues = check_shared_state()
+    assert any("REDIS_URL" in issue and "4x" in issue for issue in issues)
+
+    monkeypatch.setattr('app.workers.settings.redis_url', "redis://localhost:6379/0")
+    assert not any("REDIS_URL" in issue for issue in check_shared_state())
+
+
+def test_mail_handles_are_listed_only_when_deliveries_are_not_stored(monkeypatch):
+    monkeypatch.setattr('app.workers.settings.web_concurrency', 2)
+    monkeypatch.setattr('app.workers.settings.supabase_url', "")
+    issues = check_shared_state()
+    assert any("/admin/mail/{id}" in issue for issue in issues)
+    assert any("retention_service.LAST_REPORT" in issue for issue in issues)
+
+    monkeypatch.setattr('app.workers.settings.supabase_url', "https://db.example.supabase.co")
+    monkeypatch.setattr('app.workers.settings.supabase_service_role_key', "service-role")
+    assert not any("/admin/mail/{id}" in issue for issue in check_shared_state())
+
+
+def test_reset_after_fork_drops_inherited_clients(monkeypatch):
+    from app import supabase_db
+    from app.services import llm
+
+    monkeypatch.setattr(supabase_db, "_sb", object())
+    monkeypatch.setattr(llm, "_client", object())
+    reset_after_fork()
+    assert supabase_db._sb is None and llm._client is None